@@ -13,7 +13,9 @@ import statsmodels.api as sm
 
 from scipy import optimize
 from scipy import signal
+from scipy import sparse
 from scipy.stats.mstats import mquantiles
+from scipy.stats import binom
 import scipy.fftpack as fft
 
 import seaborn as sns
@@ -25,15 +27,36 @@ from pathos.multiprocessing import ProcessingPool as Pool
 from tqdm import tqdm
 
 import warnings
+import os
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
 
 from pyleoclim import Timeseries
 import sys
 import collections
+import time
+import logging
+import hashlib
 
 from math import factorial
 
-if sys.platform.startswith('darwin') or sys.platform.startswith('linux'):
+try:
     from . import f2py_wwz as f2py
+except ImportError:
+    f2py = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+else:
+    # a process forked after a prange kernel ran on the tbb threading layer hangs at exit, which is what the pool
+    # of `executor` does; unless a layer is chosen with NUMBA_THREADING_LAYER, use the workqueue one
+    if 'NUMBA_THREADING_LAYER' not in os.environ:
+        numba.config.THREADING_LAYER = 'workqueue'
+
+logger = logging.getLogger(__name__)
 
 '''
 Core functions below, focusing on algorithms
@@ -179,13 +202,14 @@ class WaveletAnalysis(object):
         for arg in args:
             assert isinstance(arg, int) and arg >= 1
 
-    def ar1_model(self, ts, tau, n=None):
+    def ar1_model(self, ts, tau, n=None, rng=None):
         ''' Return a time series with the AR1 process
 
         Args:
             ts (array): time axis of the time series
             tau (float): the averaged persistence
             n (int): the length of the AR1 process
+            rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state
 
         Returns:
             r (array): the AR1 time series
@@ -194,25 +218,54 @@ class WaveletAnalysis(object):
             Schulz, M. & Mudelsee, M. REDFIT: estimating red-noise spectra directly from unevenly spaced
                 paleoclimatic time series. Computers & Geosciences 28, 421–426 (2002).
 
+        '''
+        r = self.ar1_model_batch(ts, tau, n=n, p=1, rng=rng)[:, 0]
+
+        return r
+
+    def ar1_model_batch(self, ts, tau, n=None, p=1, rng=None):
+        ''' Return p realizations of the AR1 process of `ar1_model()` at once
+
+        The recursion runs over the time steps with all the realizations updated together;
+        for an evenly-spaced time axis it is done with a single linear filter.
+
+        Args:
+            ts (array): time axis of the time series
+            tau (float): the averaged persistence
+            n (int): the length of the AR1 process
+            p (int): the number of realizations
+            rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state
+
+        Returns:
+            r (array): n rows by p columns matrix of the AR1 process
+
         '''
         if n is None:
             n = np.size(ts)
         else:
             self.assertPositiveInt(n)
+        self.assertPositiveInt(p)
+
+        if rng is None:
+            rng = np.random
 
-        r = np.zeros(n)
+        scaled_dt = np.diff(ts[:n]) / tau
+        rho = np.exp(-scaled_dt)
 
+        r = np.ndarray(shape=(n, p))
         r[0] = 1
-        for i in range(1, n):
-            scaled_dt = (ts[i] - ts[i-1]) / tau
-            rho = np.exp(-scaled_dt)
-            err = np.random.normal(0, np.sqrt(1 - rho**2), 1)
-            r[i] = r[i-1]*rho + err
+        r[1:] = rng.standard_normal(size=(n-1, p)) * np.sqrt(1 - rho**2)[:, np.newaxis]
+
+        if n > 1 and np.allclose(rho, rho[0]):
+            r = signal.lfilter([1], [1, -rho[0]], r, axis=0)
+        else:
+            for i in range(1, n):
+                r[i] += r[i-1]*rho[i-1]
 
         return r
 
     def wwz_basic(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=1, detrend=False, params=['default', 4, 0, 1],
-                  gaussianize=False, standardize=True):
+                  gaussianize=False, standardize=True, prune=True):
         ''' Return the weighted wavelet amplitude (WWA).
         
         Original method from Foster. Not multiprocessing.
@@ -237,6 +290,7 @@ class WaveletAnalysis(object):
                 (the default is zero, which means only smoothing.)
             gaussianize (bool): If True, gaussianizes the timeseries
             standardize (bool): If True, standardizes the timeseries
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
             wwa (array): the weighted wavelet amplitude
@@ -259,6 +313,7 @@ class WaveletAnalysis(object):
         pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
         omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
 
         Neffs = np.ndarray(shape=(nt, nf))
         ywave_1 = np.ndarray(shape=(nt, nf))
@@ -269,6 +324,12 @@ class WaveletAnalysis(object):
 
         for k in range(nf):
             for j in range(nt):
+                if prune.mask[j, k]:
+                    ywave_1[j, k] = np.nan  # skipped, see make_prune()
+                    ywave_2[j, k] = np.nan
+                    ywave_3[j, k] = np.nan
+                    continue
+
                 dz = omega[k] * (ts - tau[j])
                 weights = np.exp(-c*dz**2)
 
@@ -300,6 +361,8 @@ class WaveletAnalysis(object):
                     ywave_2[j, k] = S_inv[1, 0]*weighted_phi1 + S_inv[1, 1]*weighted_phi2 + S_inv[1, 2]*weighted_phi3
                     ywave_3[j, k] = S_inv[2, 0]*weighted_phi1 + S_inv[2, 1]*weighted_phi2 + S_inv[2, 2]*weighted_phi3
 
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+
         wwa = np.sqrt(ywave_2**2 + ywave_3**2)
         phase = np.arctan2(ywave_3, ywave_2)
         #  coeff = ywave_2 + ywave_3*1j
@@ -308,7 +371,7 @@ class WaveletAnalysis(object):
         return wwa, phase, Neffs, coeff
 
     def wwz_nproc(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8,  detrend=False, params=['default', 4, 0, 1],
-                  gaussianize=False, standardize=True):
+                  gaussianize=False, standardize=True, prune=True):
         ''' Return the weighted wavelet amplitude (WWA).
         
         Original method from Foster. Supports multiprocessing. 
@@ -333,6 +396,7 @@ class WaveletAnalysis(object):
                 (the default is zero, which means only smoothing.)
             gaussianize (bool): If True, gaussianizes the timeseries
             standardize (bool): If True, standardizes the timeseries
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
             wwa (array): the weighted wavelet amplitude
@@ -350,6 +414,7 @@ class WaveletAnalysis(object):
         pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
         omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
 
         Neffs = np.ndarray(shape=(nt, nf))
         ywave_1 = np.ndarray(shape=(nt, nf))
@@ -366,6 +431,7 @@ class WaveletAnalysis(object):
             S = np.zeros(shape=(3, 3))
 
             if Neff_loc <= Neff:
+                ywave_1_1g = np.nan
                 ywave_2_1g = np.nan
                 ywave_3_1g = np.nan
             else:
@@ -395,13 +461,18 @@ class WaveletAnalysis(object):
         list_of_grids = list(zip(*(grid.flat for grid in tf_mesh)))
         tau_grids, omega_grids = zip(*list_of_grids)
 
-        with Pool(nproc) as pool:
-            res = pool.map(wwa_1g, tau_grids, omega_grids)
-            res_array = np.asarray(res)
-            Neffs = res_array[:, 0].reshape((np.size(omega), np.size(tau))).T
-            ywave_1 = res_array[:, 1].reshape((np.size(omega), np.size(tau))).T
-            ywave_2 = res_array[:, 2].reshape((np.size(omega), np.size(tau))).T
-            ywave_3 = res_array[:, 3].reshape((np.size(omega), np.size(tau))).T
+        # the grids are ordered by frequency, then by time shift
+        keep = ~prune.mask.T.ravel()
+        res_array = np.full((np.size(keep), 4), np.nan)
+        if np.any(keep):
+            res = executor.map(wwa_1g, np.asarray(tau_grids)[keep], np.asarray(omega_grids)[keep], nproc=nproc)
+            res_array[keep] = np.asarray(res)
+        Neffs = res_array[:, 0].reshape((np.size(omega), np.size(tau))).T
+        ywave_1 = res_array[:, 1].reshape((np.size(omega), np.size(tau))).T
+        ywave_2 = res_array[:, 2].reshape((np.size(omega), np.size(tau))).T
+        ywave_3 = res_array[:, 3].reshape((np.size(omega), np.size(tau))).T
+
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
 
         wwa = np.sqrt(ywave_2**2 + ywave_3**2)
         phase = np.arctan2(ywave_3, ywave_2)
@@ -410,8 +481,121 @@ class WaveletAnalysis(object):
 
         return wwa, phase, Neffs, coeff
 
+    def wwz_numpy(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=1, detrend=False, params=['default', 4, 0, 1],
+                  gaussianize=False, standardize=True, block_size=None, prune=True,
+                  dtype=np.float64):
+        ''' Return the weighted wavelet amplitude (WWA).
+
+        Original method from Foster. Vectorized with NumPy over blocks of (tau, freq) cells. Not multiprocessing.
+
+        Args:
+            ys (array): a time series
+            ts (array): time axis of the time series
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): not used, the blocks of cells are evaluated in the current process; kept for a common
+                interface with the other engines
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            block_size (int): the number of (tau, freq) cells evaluated at once; see `wwz_blocks()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
+            dtype (dtype): the floating point precision of the computation and of the outputs, e.g. np.float32;
+                see `cast_wwz_inputs()`
+
+        Returns:
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
+
+        '''
+        self.assertPositiveInt(Neff)
+
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
+
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+        ts, pd_ys, tau, omega = self.cast_wwz_inputs(dtype, ts, pd_ys, tau, omega)
+
+        Neffs, ywave_1, ywave_2, ywave_3 = self.wwz_blocks(self.wwz_cells, ts, pd_ys, tau, omega, c, Neff,
+                                                           block_size=block_size, keep=~prune.mask, dtype=dtype)
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+
+        wwa = np.sqrt(ywave_2**2 + ywave_3**2)
+        phase = np.arctan2(ywave_3, ywave_2)
+        coeff = (ywave_1, ywave_2, ywave_3)
+
+        return wwa, phase, Neffs, coeff
+
+    def wwz_shm(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
+                gaussianize=False, standardize=True, tile_size=None, prune=True):
+        ''' Return the weighted wavelet amplitude (WWA).
+
+        Original method from Foster. Supports multiprocessing with the inputs and outputs in shared memory,
+        one task per tile of frequencies.
+
+        Args:
+            ys (array): a time series
+            ts (array): time axis of the time series
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): the number of processes for multiprocessing
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            tile_size (int): the number of frequencies per task; see `wwz_shm_map()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
+
+        Returns:
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
+
+        '''
+        assert nproc >= 2, "wwz_shm() should use nproc >= 2, if want serial run, please use wwz_numpy()"
+        self.assertPositiveInt(Neff)
+
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
+
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+
+        Neffs, ywave_1, ywave_2, ywave_3 = self.wwz_shm_map('wwz_cells', ts, pd_ys, tau, omega, c, Neff,
+                                                            nproc=nproc, tile_size=tile_size, keep=~prune.mask)
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+
+        wwa = np.sqrt(ywave_2**2 + ywave_3**2)
+        phase = np.arctan2(ywave_3, ywave_2)
+        coeff = (ywave_1, ywave_2, ywave_3)
+
+        return wwa, phase, Neffs, coeff
+
     def kirchner_basic(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=1, detrend=False, params=["default", 4, 0, 1],
-                       gaussianize=False, standardize=True):
+                       gaussianize=False, standardize=True, prune=True):
         ''' Return the weighted wavelet amplitude (WWA) modified by Kirchner.
 
         Method modified by Kirchner. No multiprocessing.
@@ -436,6 +620,7 @@ class WaveletAnalysis(object):
                 (the default is zero, which means only smoothing.)
             gaussianize (bool): If True, gaussianizes the timeseries
             standardize (bool): If True, standardizes the timeseries
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
             wwa (array): the weighted wavelet amplitude
@@ -459,6 +644,7 @@ class WaveletAnalysis(object):
         pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
         omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
 
         Neffs = np.ndarray(shape=(nt, nf))
         a0 = np.ndarray(shape=(nt, nf))
@@ -467,6 +653,12 @@ class WaveletAnalysis(object):
 
         for k in range(nf):
             for j in range(nt):
+                if prune.mask[j, k]:
+                    a0[j, k] = np.nan  # skipped, see make_prune()
+                    a1[j, k] = np.nan
+                    a2[j, k] = np.nan
+                    continue
+
                 dz = omega[k] * (ts - tau[j])
                 weights = np.exp(-c*dz**2)
 
@@ -513,6 +705,8 @@ class WaveletAnalysis(object):
                     a1[j, k] = cos_tau_center*A - sin_tau_center*B  # Eq. (S6)
                     a2[j, k] = sin_tau_center*A + cos_tau_center*B  # Eq. (S7)
 
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+
         wwa = np.sqrt(a1**2 + a2**2)
         phase = np.arctan2(a2, a1)
         #  coeff = a1 + a2*1j
@@ -521,7 +715,7 @@ class WaveletAnalysis(object):
         return wwa, phase, Neffs, coeff
 
     def kirchner_nproc(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
-                       gaussianize=False, standardize=True):
+                       gaussianize=False, standardize=True, prune=True):
         ''' Return the weighted wavelet amplitude (WWA) modified by Kirchner.
 
         Method modified by kirchner. Supports multiprocessing. 
@@ -546,6 +740,7 @@ class WaveletAnalysis(object):
                 (the default is zero, which means only smoothing.)
             gaussianize (bool): If True, gaussianizes the timeseries
             standardize (bool): If True, standardizes the timeseries
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
             wwa (array): the weighted wavelet amplitude
@@ -564,6 +759,7 @@ class WaveletAnalysis(object):
         pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
         omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
 
         Neffs = np.ndarray(shape=(nt, nf))
         a0 = np.ndarray(shape=(nt, nf))
@@ -623,13 +819,18 @@ class WaveletAnalysis(object):
         list_of_grids = list(zip(*(grid.flat for grid in tf_mesh)))
         tau_grids, omega_grids = zip(*list_of_grids)
 
-        with Pool(nproc) as pool:
-            res = pool.map(wwa_1g, tau_grids, omega_grids)
-            res_array = np.asarray(res)
-            Neffs = res_array[:, 0].reshape((np.size(omega), np.size(tau))).T
-            a0 = res_array[:, 1].reshape((np.size(omega), np.size(tau))).T
-            a1 = res_array[:, 2].reshape((np.size(omega), np.size(tau))).T
-            a2 = res_array[:, 3].reshape((np.size(omega), np.size(tau))).T
+        # the grids are ordered by frequency, then by time shift
+        keep = ~prune.mask.T.ravel()
+        res_array = np.full((np.size(keep), 4), np.nan)
+        if np.any(keep):
+            res = executor.map(wwa_1g, np.asarray(tau_grids)[keep], np.asarray(omega_grids)[keep], nproc=nproc)
+            res_array[keep] = np.asarray(res)
+        Neffs = res_array[:, 0].reshape((np.size(omega), np.size(tau))).T
+        a0 = res_array[:, 1].reshape((np.size(omega), np.size(tau))).T
+        a1 = res_array[:, 2].reshape((np.size(omega), np.size(tau))).T
+        a2 = res_array[:, 3].reshape((np.size(omega), np.size(tau))).T
+
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
 
         wwa = np.sqrt(a1**2 + a2**2)
         phase = np.arctan2(a2, a1)
@@ -638,12 +839,13 @@ class WaveletAnalysis(object):
 
         return wwa, phase, Neffs, coeff
 
-    def kirchner_f2py(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
-                      gaussianize=False, standardize=True):
+    def kirchner_numpy(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=1, detrend=False, params=['default', 4, 0, 1],
+                       gaussianize=False, standardize=True, block_size=None, prune=True,
+                       dtype=np.float64):
         ''' Return the weighted wavelet amplitude (WWA) modified by Kirchner.
 
-        Fastest method. Calls Fortran libraries.
-        
+        Method modified by Kirchner. Vectorized with NumPy over blocks of (tau, freq) cells. No multiprocessing.
+
         Args:
             ys (array): a time series
             ts (array): time axis of the time series
@@ -651,7 +853,8 @@ class WaveletAnalysis(object):
             tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
             c (float): the decay constant
             Neff (int): the threshold of the number of effective degree of freedom
-            nproc (int): fake argument, just for convenience
+            nproc (int): not used, the blocks of cells are evaluated in the current process; kept for a common
+                interface with the other engines
             detrend (str): 'no' - the original time series is assumed to have no trend;
                            'linear' - a linear least-squares fit to `ys` is subtracted;
                            'constant' - the mean of `ys` is subtracted
@@ -664,6 +867,10 @@ class WaveletAnalysis(object):
                 (the default is zero, which means only smoothing.)
             gaussianize (bool): If True, gaussianizes the timeseries
             standardize (bool): If True, standardizes the timeseries
+            block_size (int): the number of (tau, freq) cells evaluated at once; see `wwz_blocks()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
+            dtype (dtype): the floating point precision of the computation and of the outputs, e.g. np.float32;
+                see `cast_wwz_inputs()`
 
         Returns:
             wwa (array): the weighted wavelet amplitude
@@ -672,875 +879,3210 @@ class WaveletAnalysis(object):
             coeff (array): the wavelet transform coefficients (a0, a1, a2)
 
         '''
-        self.assertPositiveInt(Neff, nproc)
-
-        nt = np.size(tau)
-        nts = np.size(ts)
-        nf = np.size(freqs)
+        self.assertPositiveInt(Neff)
 
         pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
         omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+        ts, pd_ys, tau, omega = self.cast_wwz_inputs(dtype, ts, pd_ys, tau, omega)
 
-        Neffs, a0, a1, a2 = f2py.f2py_wwz.wwa(tau, omega, c, Neff, ts, pd_ys, nproc, nts, nt, nf)
+        Neffs, a0, a1, a2 = self.wwz_blocks(self.kirchner_cells, ts, pd_ys, tau, omega, c, Neff,
+                                            block_size=block_size, keep=~prune.mask, dtype=dtype)
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
 
-        undef = -99999.
-        a0[a0 == undef] = np.nan
-        a1[a1 == undef] = np.nan
-        a2[a2 == undef] = np.nan
         wwa = np.sqrt(a1**2 + a2**2)
         phase = np.arctan2(a2, a1)
-
-        #  coeff = a1 + a2*1j
         coeff = (a0, a1, a2)
 
         return wwa, phase, Neffs, coeff
 
-    def make_coi(self, tau, Neff=3):
-        ''' Return the cone of influence.
+    def kirchner_shm(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
+                     gaussianize=False, standardize=True, tile_size=None, prune=True):
+        ''' Return the weighted wavelet amplitude (WWA) modified by Kirchner.
+
+        Method modified by Kirchner. Supports multiprocessing with the inputs and outputs in shared memory,
+        one task per tile of frequencies.
 
         Args:
+            ys (array): a time series
+            ts (array): time axis of the time series
+            freqs (array): vector of frequency
             tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
-            Neff (int): the threshold of the number of effective samples
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): the number of processes for multiprocessing
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            tile_size (int): the number of frequencies per task; see `wwz_shm_map()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
-            coi (array): cone of influence
-
-        References:
-            wave_signif() in http://paos.colorado.edu/research/wavelets/wave_python/waveletFunctions.py
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
 
         '''
-        assert isinstance(Neff, int) and Neff >= 1
-        nt = np.size(tau)
-
-        fourier_factor = 4*np.pi / (Neff+np.sqrt(2+Neff**2))
-        coi_const = fourier_factor / np.sqrt(2)
+        assert nproc >= 2, "kirchner_shm() should use nproc >= 2, if want serial run, please use kirchner_numpy()"
+        self.assertPositiveInt(Neff)
 
-        dt = np.median(np.diff(tau))
-        nt_half = (nt+1)//2 - 1
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
-        A = np.append(0.00001, np.arange(nt_half)+1)
-        B = A[::-1]
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
 
-        if nt % 2 == 0:
-            C = np.append(A, B)
-        else:
-            C = np.append(A, B[1:])
+        Neffs, a0, a1, a2 = self.wwz_shm_map('kirchner_cells', ts, pd_ys, tau, omega, c, Neff,
+                                             nproc=nproc, tile_size=tile_size, keep=~prune.mask)
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
 
-        coi = coi_const * dt * C
+        wwa = np.sqrt(a1**2 + a2**2)
+        phase = np.arctan2(a2, a1)
+        coeff = (a0, a1, a2)
 
-        return coi
+        return wwa, phase, Neffs, coeff
 
-    def make_omega(self, ts, freqs):
-        ''' Return the angular frequency based on the time axis and given frequency vector
+    def kirchner_f2py(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
+                      gaussianize=False, standardize=True, tile_size=64,
+                      trunc_radius=None, trunc_tol=None, prune=True, dtype=np.float64):
+        ''' Return the weighted wavelet amplitude (WWA) modified by Kirchner.
 
+        Fastest method. Calls Fortran libraries.
+        
         Args:
             ys (array): a time series
             ts (array): time axis of the time series
             freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): the number of OpenMP threads of the f2py kernel
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            tile_size (int): the number of time shifts tau per task of the Fortran kernel `wwa_tiled`
+            trunc_radius (float): if not None, the sums of each cell only run over the points within this number
+                of periods of tau; see `trunc_windows()`
+            trunc_tol (float): if not None, the sums of each cell only run over the points with a weight above
+                `trunc_tol`; see `trunc_windows()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
+            dtype (dtype): np.float64, or np.float32 for the single precision Fortran kernel `wwa_window_f32`;
+                see `cast_wwz_inputs()`
 
         Returns:
-            omega (array): the angular frequency vector
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
 
         '''
-        # for the frequency band larger than f_Nyquist, the wwa will be marked as NaNs
-        f_Nyquist = 0.5 / np.median(np.diff(ts))
-        freqs_with_nan = np.copy(freqs)
-        freqs_with_nan[freqs > f_Nyquist] = np.nan
-        omega = 2*np.pi*freqs_with_nan
-
-        return omega
+        assert f2py is not None, "kirchner_f2py() requires the compiled extension f2py_wwz, see src/Makefile"
+        assert np.dtype(dtype) in [np.float32, np.float64], "kirchner_f2py() supports np.float32 and np.float64 only"
+        self.assertPositiveInt(Neff, nproc)
 
-    def wwa2psd(self, wwa, ts, Neffs, freqs=None, Neff=3, anti_alias=False, avgs=2):
-        """ Return the power spectral density (PSD) using the weighted wavelet amplitude (WWA).
+        nt = np.size(tau)
+        nts = np.size(ts)
+        nf = np.size(freqs)
 
-        Args:
-            wwa (array): the weighted wavelet amplitude.
-            ts (array): the time points, should be pre-truncated so that the span is exactly what is used for wwz
-            Neffs (array):  the matrix of effective number of points in the time-scale coordinates obtained from wwz from wwz
-            freqs (array): vector of frequency from wwz
-            Neff (int): the threshold of the number of effective samples
-            anti_alias (bool): whether to apply anti-alias filter
-            avgs (int): flag for whether spectrum is derived from instantaneous point measurements (avgs<>1)
-                        OR from measurements averaged over each sampling interval (avgs==1)
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
-        Returns:
-            psd (array): power spectral density
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+
+        if trunc_radius is not None or trunc_tol is not None:
+            assert hasattr(f2py.f2py_wwz, 'wwa_window'), "The truncation requires the Fortran kernel `wwa_window`, please recompile f2py_wwz."
+
+        if np.dtype(dtype) == np.float32:
+            assert hasattr(f2py.f2py_wwz, 'wwa_window_f32'), "The single precision requires the Fortran kernel `wwa_window_f32`, please recompile f2py_wwz."
+            ts_win, pd_ys_win, lo, hi = self.wwz_windows(ts, pd_ys, tau, omega, c,
+                                                         trunc_radius=trunc_radius, trunc_tol=trunc_tol)
+            hi[prune.mask] = lo[prune.mask]
+            ts_win, pd_ys_win, tau_win, omega_win = self.cast_wwz_inputs(dtype, ts_win, pd_ys_win, tau, omega)
+            Neffs, a0, a1, a2 = f2py.f2py_wwz.wwa_window_f32(tau_win, omega_win, c, Neff, ts_win, pd_ys_win, lo, hi,
+                                                             nproc, tile_size, nts, nt, nf)
+        elif hasattr(f2py.f2py_wwz, 'wwa_window'):
+            # the pruned cells get empty windows, which the kernel skips
+            ts_win, pd_ys_win, lo, hi = self.wwz_windows(ts, pd_ys, tau, omega, c,
+                                                         trunc_radius=trunc_radius, trunc_tol=trunc_tol)
+            hi[prune.mask] = lo[prune.mask]
+            Neffs, a0, a1, a2 = f2py.f2py_wwz.wwa_window(tau, omega, c, Neff, ts_win, pd_ys_win, lo, hi, nproc, tile_size,
+                                                         nts, nt, nf)
+        elif hasattr(f2py.f2py_wwz, 'wwa_tiled'):
+            Neffs, a0, a1, a2 = f2py.f2py_wwz.wwa_tiled(tau, omega, c, Neff, ts, pd_ys, nproc, tile_size, nts, nt, nf)
+        else:
+            # extension compiled from an older src/f2py_wwz.f90
+            Neffs, a0, a1, a2 = f2py.f2py_wwz.wwa(tau, omega, c, Neff, ts, pd_ys, nproc, nts, nt, nf)
 
-        References:
-            Kirchner's C code for weighted psd calculation
+        undef = -99999.
+        a0[a0 == undef] = np.nan
+        a1[a1 == undef] = np.nan
+        a2[a2 == undef] = np.nan
+        a0[prune.mask] = np.nan
+        a1[prune.mask] = np.nan
+        a2[prune.mask] = np.nan
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+        wwa = np.sqrt(a1**2 + a2**2)
+        phase = np.arctan2(a2, a1)
 
-        """
-        af = AliasFilter()
+        #  coeff = a1 + a2*1j
+        coeff = (a0, a1, a2)
 
-        # weighted psd calculation start
-        power = wwa**2 * 0.5 * (np.max(ts)-np.min(ts))/np.size(ts) * Neffs
+        return wwa, phase, Neffs, coeff
 
-        Neff_diff = Neffs - Neff
-        Neff_diff[Neff_diff < 0] = 0
+    def wwz_numba(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
+                  gaussianize=False, standardize=True, trunc_radius=None, trunc_tol=None, prune=True):
+        ''' Return the weighted wavelet amplitude (WWA).
 
-        sum_power = np.nansum(power * Neff_diff, axis=0)
-        sum_eff = np.nansum(Neff_diff, axis=0)
+        Original method from Foster. Compiled with Numba, multithreaded over the frequencies.
 
-        psd = sum_power / sum_eff
-        # weighted psd calculation end
+        Args:
+            ys (array): a time series
+            ts (array): time axis of the time series
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): the number of threads
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            trunc_radius (float): if not None, the sums of each cell only run over the points within this number
+                of periods of tau; see `trunc_windows()`
+            trunc_tol (float): if not None, the sums of each cell only run over the points with a weight above
+                `trunc_tol`; see `trunc_windows()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
-        if anti_alias:
-            assert freqs is not None, "freqs is required for alias filter!"
-            dt = np.median(np.diff(ts))
-            f_sampling = 1/dt
-            psd_copy = psd[1:]
-            freqs_copy = freqs[1:]
-            alpha, filtered_pwr, model_pwer, aliased_pwr = af.alias_filter(
-                freqs_copy, psd_copy, f_sampling, f_sampling*1e3, np.min(freqs), avgs)
+        Returns:
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
 
-            psd[1:] = np.copy(filtered_pwr)
+        '''
+        assert numba is not None, "wwz_numba() requires the optional package numba"
+        self.assertPositiveInt(Neff, nproc)
 
-        return psd
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
-    def freq_vector_lomb_scargle(self, ts, nf=None, ofac=4, hifac=1):
-        ''' Return the frequency vector based on the Lomb-Scargle algorithm.
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+
+        ts_win, pd_ys_win, lo, hi = self.wwz_windows(ts, pd_ys, tau, omega, c,
+                                                     trunc_radius=trunc_radius, trunc_tol=trunc_tol)
+        hi[prune.mask] = lo[prune.mask]
+
+        numba.set_num_threads(np.min([nproc, numba.config.NUMBA_NUM_THREADS]))
+        Neffs, ywave_1, ywave_2, ywave_3 = wwz_numba_grid(np.asarray(tau, dtype=float), np.asarray(omega, dtype=float),
+                                                          c, Neff, ts_win, pd_ys_win, lo, hi)
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+
+        wwa = np.sqrt(ywave_2**2 + ywave_3**2)
+        phase = np.arctan2(ywave_3, ywave_2)
+        coeff = (ywave_1, ywave_2, ywave_3)
+
+        return wwa, phase, Neffs, coeff
+
+    def kirchner_numba(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False, params=['default', 4, 0, 1],
+                       gaussianize=False, standardize=True, trunc_radius=None, trunc_tol=None, prune=True):
+        ''' Return the weighted wavelet amplitude (WWA) modified by Kirchner.
+
+        Method modified by Kirchner. Compiled with Numba, multithreaded over the frequencies;
+        the portable counterpart of `kirchner_f2py()`.
 
         Args:
+            ys (array): a time series
             ts (array): time axis of the time series
-            ofac (float): Oversampling rate that influences the resolution of the frequency axis,
-                         when equals to 1, it means no oversamling (should be >= 1).
-                         The default value 4 is usaually a good value.
-
-            hifac (float): fhi/fnyq (should be >= 1), where fhi is the highest frequency that
-                          can be analyzed by the Lomb-Scargle algorithm and fnyq is the Nyquist frequency.
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): the number of threads
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            trunc_radius (float): if not None, the sums of each cell only run over the points within this number
+                of periods of tau; see `trunc_windows()`
+            trunc_tol (float): if not None, the sums of each cell only run over the points with a weight above
+                `trunc_tol`; see `trunc_windows()`
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
-            freqs (array): the frequency vector
-
-        References:
-            Trauth, M. H. MATLAB® Recipes for Earth Sciences. (Springer, 2015). pp 181.
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
 
         '''
-        assert ofac >= 1 and hifac <= 1, "`ofac` should be >= 1, and `hifac` should be <= 1"
+        assert numba is not None, "kirchner_numba() requires the optional package numba"
+        self.assertPositiveInt(Neff, nproc)
 
-        dt = np.median(np.diff(ts))
-        flo = (1/(2*dt)) / (np.size(ts)*ofac)
-        fhi = hifac / (2*dt)
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
-        if nf is None:
-            df = flo
-            nf = (fhi - flo) / df + 1
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
 
-        freqs = np.linspace(flo, fhi, nf)
+        ts_win, pd_ys_win, lo, hi = self.wwz_windows(ts, pd_ys, tau, omega, c,
+                                                     trunc_radius=trunc_radius, trunc_tol=trunc_tol)
+        hi[prune.mask] = lo[prune.mask]
 
-        return freqs
+        numba.set_num_threads(np.min([nproc, numba.config.NUMBA_NUM_THREADS]))
+        Neffs, a0, a1, a2 = kirchner_numba_grid(np.asarray(tau, dtype=float), np.asarray(omega, dtype=float),
+                                                c, Neff, ts_win, pd_ys_win, lo, hi)
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
 
-    def freq_vector_welch(self, ts):
-        ''' Return the frequency vector based on the Welch's method.
+        wwa = np.sqrt(a1**2 + a2**2)
+        phase = np.arctan2(a2, a1)
+        coeff = (a0, a1, a2)
+
+        return wwa, phase, Neffs, coeff
+
+    def kirchner_nufft(self, ys, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, nproc=1, detrend=False, params=['default', 4, 0, 1],
+                       gaussianize=False, standardize=True, nufft_tol=1e-6, pair_budget=2**18, prune=True):
+        ''' Return an approximation of the weighted wavelet amplitude (WWA) modified by Kirchner, with non-uniform FFTs.
+
+        For a fixed tau, the weighted sums of `kirchner_basic()` are windowed non-uniform Fourier sums, and the
+        coefficients only need sum(w), sum(w*ys), sum(w*exp(i*omega*ts)) and sum(w*ys*exp(i*omega*ts)), since
+        a1 + i*a2 = 2*exp(-i*omega*tau) * sum(w*(ys-a0)*exp(i*omega*ts)) / sum(w). The frequencies are split into
+        bands, where the window of each frequency is expanded around the widest one of the band,
+        exp(-c*omega**2*dt**2) = exp(-c*omega_b**2*dt**2) * sum_k (-delta*c*omega_b**2*dt**2)**k / k!, with
+        delta = omega**2/omega_b**2 - 1. Each term is extirpolated onto a regular grid with Lagrange weights, as in
+        Press & Rybicki (1989), and evaluated at all the frequencies of the band at once with a chirp-z transform,
+        so the cost per tau is about O(N log N) instead of O(nf*N). It pays off for dense, evenly-spaced frequency
+        vectors, e.g. `freq_vector_lomb_scargle()` with a high `ofac`. No multiprocessing.
 
         Args:
+            ys (array): a time series
             ts (array): time axis of the time series
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): fake argument, just for convenience
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            nufft_tol (float): the accuracy of the approximation, relative to the largest weight: the windows are
+                truncated below `nufft_tol`, and the width of the bands, the number of terms of the expansion and
+                the order of the extirpolation are set so that their errors are below `nufft_tol`;
+                see `nufft_validation()` for the error actually achieved
+            pair_budget (int): the maximum number of (tau, point) pairs processed at once, which bounds the memory
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
 
         Returns:
-            freqs (array): the frequency vector
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
 
         References:
-            https://github.com/scipy/scipy/blob/v0.14.0/scipy/signal/spectral.py
+            Press, W. H. & Rybicki, G. B. Fast algorithm for spectral analysis of unevenly sampled data.
+                The Astrophysical Journal 338, 277-280 (1989).
+            Kirchner, J. W. & Neal, C. Universal fractal scaling in stream chemistry and its implications for solute
+                transport and water quality trend detection. PNAS 110, 12213-12218 (2013).
 
         '''
-        nt = np.size(ts)
-        dt = np.median(np.diff(ts))
-        fs = 1 / dt
-        if nt % 2 == 0:
-            n_freqs = nt//2 + 1
-        else:
-            n_freqs = (nt+1) // 2
+        self.assertPositiveInt(Neff, pair_budget)
+        assert 0 < nufft_tol < 1, "nufft_tol should be between 0 and 1."
 
-        freqs = np.arange(n_freqs) * fs / nt
+        nt = np.size(tau)
+        nf = np.size(freqs)
 
-        return freqs
+        pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize)
 
-    def freq_vector_nfft(self, ts):
-        ''' Return the frequency vector based on NFFT
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+
+        # the window of the zero frequency is infinite, so its columns are the direct sums over all the points
+        zero = np.flatnonzero(omega == 0)
+        if np.size(zero) > 0:
+            _, _, Neffs_zero, coeff_zero = self.kirchner_numpy(
+                ys, ts, np.asarray(freqs)[zero], tau, c=c, Neff=Neff, detrend=detrend, params=params,
+                gaussianize=gaussianize, standardize=standardize,
+                prune=prune._replace(mask=prune.mask[:, zero], Neffs=prune.Neffs[:, zero]))
+
+        order = np.argsort(ts)
+        ts = np.asarray(ts, dtype=np.float64)[order]
+        pd_ys = np.asarray(pd_ys, dtype=np.float64)[order]
+        tau = np.asarray(tau, dtype=np.float64)
+
+        # the windows are truncated where the weights are below nufft_tol, which bounds the expansion variable
+        # delta*c*omega_b**2*dt**2 by 1 within a band, so that its remainder after n_terms terms is below nufft_tol
+        log_tol = -np.log(nufft_tol)
+        n_terms = 1
+        while np.e / factorial(n_terms) > nufft_tol:
+            n_terms += 1
+
+        # with a grid spacing of 1/(2*omega), the Lagrange error of exp(i*omega*t) is below nufft_tol
+        n_lag = 2
+        while 0.5**n_lag / factorial(n_lag) * np.prod(np.arange(1, n_lag, 2)/2)**2 > nufft_tol:
+            n_lag += 2
+
+        Neffs = np.full((nt, nf), np.nan)
+        a0 = np.full((nt, nf), np.nan)
+        a12 = np.full((nt, nf), np.nan, dtype=complex)
+
+        if np.size(zero) > 0:
+            Neffs[:, zero] = Neffs_zero
+            a0[:, zero] = coeff_zero[0]
+            a12.real[:, zero] = coeff_zero[1]
+            a12.imag[:, zero] = coeff_zero[2]
+
+        for band in self.nufft_bands(omega, 1/log_tol):
+            omega_b = omega[band[0]]
+            radius = np.sqrt(log_tol/c) / omega_b
+            h = 0.5 / omega[band[-1]]
+            n_grid = int(np.ceil(2*radius/h)) + 2*n_lag + 2
+
+            t0 = ts[0] - radius - n_lag*h
+            base, lag_weights = self.extirpolation_weights((ts-t0)/h, n_lag)
+
+            lo = np.searchsorted(ts, tau-radius)
+            hi = np.searchsorted(ts, tau+radius, side='right')
+            m0 = np.floor((tau-radius-t0)/h).astype(int) - n_lag
+
+            rows = np.flatnonzero((hi > lo) & ~np.all(prune.mask[:, band], axis=1))
+            delta = omega[band]**2/omega_b**2 - 1
+            powers = (-delta)**np.arange(n_terms)[:, np.newaxis]
+            powers2 = (-2*delta)**np.arange(n_terms)[:, np.newaxis]
+
+            # the rows of tau are processed in chunks of about pair_budget (tau, point) pairs
+            n_pairs = np.cumsum(hi[rows]-lo[rows])
+            chunk_ids = (n_pairs - 1) // pair_budget
+            for chunk_id in np.unique(chunk_ids):
+                J = rows[chunk_ids == chunk_id]
+                counts = hi[J] - lo[J]
+                offsets = np.cumsum(counts) - counts
+                pair_j = np.repeat(np.arange(np.size(J)), counts)
+                pair_i = np.arange(np.sum(counts)) - np.repeat(offsets, counts) + np.repeat(lo[J], counts)
+
+                D = c*omega_b**2 * (ts[pair_i]-tau[J][pair_j])**2
+                W = np.exp(-D)
+
+                # the terms W*D**k/k! of the expansion, and those of W**2 for sum(w**2)
+                terms = np.ndarray(shape=(n_terms, np.size(D)))
+                terms[0] = W
+                for k in range(1, n_terms):
+                    terms[k] = terms[k-1] * D / k
+                terms2 = terms * W
+
+                sums = np.add.reduceat(terms, offsets, axis=1)
+                sums_y = np.add.reduceat(terms*pd_ys[pair_i], offsets, axis=1)
+                sums2 = np.add.reduceat(terms2, offsets, axis=1)
+
+                sum_w = sums.T @ powers
+                sum_wy = sums_y.T @ powers
+                Neff_loc = sum_w**2 / (sums2.T @ powers2)
+
+                # extirpolation onto the grid of each tau, which starts at t0 + m0*h
+                grid_rows = pair_j[:, np.newaxis]*n_grid + base[pair_i][:, np.newaxis] + np.arange(n_lag) \
+                    - m0[J][pair_j][:, np.newaxis]
+                spread = sparse.csr_matrix((lag_weights[pair_i].ravel(), (grid_rows.ravel(), np.repeat(np.arange(np.size(D)), n_lag))),
+                                           shape=(np.size(J)*n_grid, np.size(D)))
+                grid = spread @ np.concatenate((terms, terms*pd_ys[pair_i])).T
+                grid = grid.reshape((np.size(J), n_grid, 2*n_terms))
+
+                sum_wexp = np.ndarray(shape=(np.size(J), np.size(band), 2*n_terms), dtype=complex)
+                for run in self.nufft_runs(omega[band]):
+                    omega_run = omega[band][run]
+                    if np.size(omega_run) >= 8:
+                        d_omega = omega_run[1] - omega_run[0]
+                        sum_wexp[:, run] = signal.czt(grid, m=np.size(omega_run), w=np.exp(1j*d_omega*h),
+                                                      a=np.exp(-1j*omega_run[0]*h), axis=1)
+                    else:
+                        sum_wexp[:, run] = np.einsum('jnm,nk->jkm', grid,
+                                                     np.exp(1j*np.outer(np.arange(n_grid), omega_run*h)))
+
+                # the grid of each tau starts at t0 + m0*h, and the phase is taken relative to tau
+                shift = np.exp(1j*np.outer(t0 + m0[J]*h - tau[J], omega[band]))
+                sum_wexp_1 = np.einsum('jkm,mk->jk', sum_wexp[..., :n_terms], powers) * shift
+                sum_wexp_y = np.einsum('jkm,mk->jk', sum_wexp[..., n_terms:], powers) * shift
+
+                a0_band = sum_wy / sum_w
+                a12_band = 2 * (sum_wexp_y - a0_band*sum_wexp_1) / sum_w
+
+                # the coefficients cannot be estimated reliably when Neff_loc <= Neff
+                a0_band[Neff_loc <= Neff] = np.nan
+                a12_band[Neff_loc <= Neff] = np.nan
+
+                Neffs[np.ix_(J, band)] = Neff_loc
+                a0[np.ix_(J, band)] = a0_band
+                a12[np.ix_(J, band)] = a12_band
+
+        Neffs[prune.mask] = prune.Neffs[prune.mask]
+        a0[prune.mask] = np.nan
+        a12[prune.mask] = np.nan
+
+        a1 = np.real(a12)
+        a2 = np.imag(a12)
+
+        wwa = np.sqrt(a1**2 + a2**2)
+        phase = np.arctan2(a2, a1)
+        coeff = (a0, a1, a2)
+
+        return wwa, phase, Neffs, coeff
+
+    def nufft_bands(self, omega, delta_max):
+        ''' Split the frequencies into the bands of `kirchner_nufft()`.
 
         Args:
-            ts (array): time axis of the time series
+            omega (array): the angular frequency vector; the NaNs, above the Nyquist frequency, and the zero
+                frequency, whose window is infinite, are left out
+            delta_max (float): the maximum of omega**2/omega_b**2 - 1 in a band, where omega_b is its lowest frequency
 
         Returns:
-            freqs (array): the frequency vector
+            bands (list): the indices of the frequencies of each band, in increasing order of frequency
 
         '''
-        nt = np.size(ts)
-        dt = np.median(np.diff(ts))
-        fs = 1 / dt
-        n_freqs = nt//2 + 1
+        valid = np.flatnonzero(omega > 0)
+        valid = valid[np.argsort(omega[valid])]
+        omega_sorted = omega[valid]
 
-        freqs = np.linspace(0, fs/2, n_freqs)
+        bands = []
+        start = 0
+        while start < np.size(valid):
+            stop = np.searchsorted(omega_sorted, omega_sorted[start]*np.sqrt(1+delta_max), side='right')
+            bands.append(valid[start:stop])
+            start = stop
 
-        return freqs
+        return bands
 
-    def make_freq_vector(self, ts, method = 'nfft', **kwargs):
-        ''' Make frequency vector- Selector function.
-        
-        This function selects among various methods to obtain the frequency 
-        vector. 
+    def nufft_runs(self, omega):
+        ''' Split sorted frequencies into runs of evenly-spaced frequencies, for the chirp-z transforms of
+        `kirchner_nufft()`.
 
         Args:
-            ts (array): time axis of the time series
-            method (str): The method to use. Options are 'nfft' (default), 'Lomb-Scargle', 'Welch'
-                For Lomb_Scargle, additional parameters may be passed:
-                    nf (int): number of frequency points
-                    ofac (float): Oversampling rate that influences the resolution of the frequency axis,
-                         when equals to 1, it means no oversamling (should be >= 1).
-                         The default value 4 is usaually a good value.
-                    hifac (float): fhi/fnyq (should be >= 1), where fhi is the highest frequency that
-                          can be analyzed by the Lomb-Scargle algorithm and fnyq is the Nyquist frequency.
-        
+            omega (array): the sorted angular frequencies of a band
+
         Returns:
-            freqs (array): the frequency vector
+            runs (list): the slices of the runs
 
         '''
-        
-        if method is 'Lomb-Scargle':
-            freqs = self.freq_vector_lomb_scargle(ts,**kwargs)
-        elif method is 'Welch':
-            freqs = self.freq_vector_welch(ts)        
-        else:
-            freqs = self.freq_vector_nfft(ts)
-        #  freqs = freqs[1:]  # discard the first element 0
-
-        return freqs
-
-    def beta_estimation(self, psd, freqs, fmin, fmax):
-        ''' Estimate the power slope of a 1/f^beta process.
+        runs = []
+        start = 0
+        while start < np.size(omega):
+            stop = start + 1
+            if stop < np.size(omega):
+                d_omega = omega[stop] - omega[start]
+                while stop + 1 < np.size(omega) and np.isclose(omega[stop+1]-omega[stop], d_omega, rtol=1e-6, atol=0):
+                    stop += 1
+                stop += 1
+            runs.append(slice(start, stop))
+            start = stop
+
+        return runs
+
+    def extirpolation_weights(self, x, n_lag):
+        ''' Return the Lagrange weights that extirpolate points onto a regular grid, as in Press & Rybicki (1989),
+        so that sum(v*exp(i*omega*ts)) is approximated by the same sum over the grid.
 
         Args:
-            psd (array): the power spectral density
-            freqs (array): the frequency vector
-            fmin, fmax (float): the frequency range for beta estimation
+            x (array): the positions of the points in units of the grid spacing
+            n_lag (int): the even number of grid points each point is spread onto
 
         Returns:
-            beta (float): the estimated slope
-            f_binned (array): binned frequency vector
-            psd_binned (array): binned power spectral density
-            Y_reg (array): prediction based on linear regression
+            base (array): the index of the first grid point of each point
+            weights (array): of shape (np.size(x), n_lag), the weights of the grid points base, ..., base+n_lag-1
 
         '''
-        # drop the PSD at frequency zero
-        if freqs[0] == 0:
-            psd = psd[1:]
-            freqs = freqs[1:]
+        nodes = np.arange(n_lag)
+        base = np.floor(x).astype(int) - n_lag//2 + 1
+        diff = (x - base)[:, np.newaxis] - nodes
 
-        Results = collections.namedtuple('Results', ['beta', 'f_binned', 'psd_binned', 'Y_reg', 'std_err'])
-        if np.max(freqs) < fmax or np.min(freqs) > fmin:
-            res = Results(beta=np.nan, f_binned=np.nan, psd_binned=np.nan, Y_reg=np.nan, std_err=np.nan)
-            return res
+        weights = np.ndarray(shape=(np.size(x), n_lag))
+        for q in nodes:
+            others = nodes[nodes != q]
+            weights[:, q] = np.prod(diff[:, others], axis=1) / np.prod(q - others)
 
-        # frequency binning start
-        fminindx = np.where(freqs >= fmin)[0][0]
-        fmaxindx = np.where(freqs <= fmax)[0][-1]
+        return base, weights
 
-        if fminindx >= fmaxindx:
-            res = Results(beta=np.nan, f_binned=np.nan, psd_binned=np.nan, Y_reg=np.nan, std_err=np.nan)
-            return res
+    def trunc_windows(self, ts, tau, omega, c, trunc_radius=None, trunc_tol=None):
+        ''' Return the windows of points that the sums of each (tau, omega) cell are truncated to.
 
-        logf = np.log(freqs)
-        logf_step = logf[fminindx+1] - logf[fminindx]
-        logf_start = logf[fminindx]
-        logf_end = logf[fmaxindx]
-        logf_binedges = np.arange(logf_start, logf_end+logf_step, logf_step)
+        The weight of a point is `exp(-c*(omega*(t-tau))**2)`, so it is below `trunc_tol` outside the window
+        `|t-tau| <= sqrt(-log(trunc_tol)/c)/omega`, and the window of `trunc_radius` periods is
+        `|t-tau| <= 2*pi*trunc_radius/omega`. The windows are found by binary search in the sorted time axis.
 
-        n_intervals = np.size(logf_binedges)-1
-        logpsd_binned = np.empty(n_intervals)
-        logf_binned = np.empty(n_intervals)
+        Args:
+            ts (array): time axis of the time series, sorted in ascending order
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            trunc_radius (float): the half-width of the windows in number of periods
+            trunc_tol (float): the weight below which the points are left out; used if `trunc_radius` is None
 
-        logpsd = np.log(psd)
+        Returns:
+            lo, hi (array): of shape (nt, nf); the sums of each cell run over `ts[lo:hi]`
+            trunc_err (array): of shape (nt, nf); an upper bound of the weight of the left out points,
+                relative to the weight of the kept ones, i.e. of the relative error of every weighted sum.
+                It is the number of left out points times the largest weight outside the window,
+                divided by the weight of the point nearest to tau.
 
-        for i in range(n_intervals):
-            lb = logf_binedges[i]
-            ub = logf_binedges[i+1]
-            q = np.where((logf > lb) & (logf <= ub))
+        '''
+        assert trunc_radius is not None or trunc_tol is not None, "Either `trunc_radius` or `trunc_tol` should be set."
+        assert np.all(np.diff(ts) >= 0), "The time axis should be sorted."
 
-            logpsd_binned[i] = np.nanmean(logpsd[q])
-            logf_binned[i] = (ub + lb) / 2
+        if trunc_radius is not None:
+            z_max = 2*np.pi*trunc_radius
+        else:
+            z_max = np.sqrt(-np.log(trunc_tol)/c)
 
-        f_binned = np.exp(logf_binned)
-        psd_binned = np.exp(logpsd_binned)
-        # frequency binning end
+        nts = np.size(ts)
+        half_width = z_max / omega
 
-        # linear regression below
-        Y = np.log10(psd_binned)
-        X = np.log10(f_binned)
-        X_ex = sm.add_constant(X)
+        lo = np.searchsorted(ts, tau[:, np.newaxis] - half_width, side='left')
+        hi = np.searchsorted(ts, tau[:, np.newaxis] + half_width, side='right')
 
-        model = sm.OLS(Y, X_ex)
-        results = model.fit()
+        # the point nearest to tau is always in the window
+        i_near = np.clip(np.searchsorted(ts, tau), 1, nts-1)
+        d_near = np.min([np.abs(ts[i_near-1] - tau), np.abs(ts[i_near] - tau)], axis=0)
+        w_near = np.exp(-c*(omega*d_near[:, np.newaxis])**2)
 
-        if np.size(results.params) < 2:
-            beta = np.nan
-            Y_reg = np.nan
-            std_err = np.nan
-        else:
-            beta = -results.params[1]  # the slope we want
-            Y_reg = 10**model.predict(results.params)  # prediction based on linear regression
-            std_err = results.bse[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trunc_err = (nts - (hi-lo)) * np.exp(-c*z_max**2) / w_near
 
-        res = Results(beta=beta, f_binned=f_binned, psd_binned=psd_binned, Y_reg=Y_reg, std_err=std_err)
+        trunc_err[:, np.isnan(omega)] = np.nan
 
-        return res
+        return lo, hi, trunc_err
 
-    def beta2HurstIndex(self, beta):
-        ''' Translate psd slope to Hurst index
+    def wwz_windows(self, ts, pd_ys, tau, omega, c, trunc_radius=None, trunc_tol=None):
+        ''' Return the time series sorted in time, and the windows of points for the sums of each (tau, omega) cell.
 
         Args:
-            beta (float): the estimated slope of a power spectral density curve
+            ts (array): time axis of the time series
+            pd_ys (array): the preprocessed time series
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            trunc_radius, trunc_tol (float): see `trunc_windows()`; with both None, the windows are the full series
 
         Returns:
-            H (float): Hurst index, should be in (0, 1)
-
-        References:
-            Equation 2 in http://www.bearcave.com/misl/misl_tech/wavelets/hurst/
+            ts_win, pd_ys_win (array): the time series, sorted in time if truncated
+            lo, hi (array): of shape (nt, nf); the sums of each cell run over `ts_win[lo:hi]`
 
         '''
-        H = (beta-1)/2
+        nt = np.size(tau)
+        nf = np.size(omega)
 
-        return H
+        ts_win = np.asarray(ts, dtype=float)
+        pd_ys_win = np.asarray(pd_ys, dtype=float)
 
-    def psd_ar(self, var_noise, freqs, ar_params, f_sampling):
-        ''' Return the theoretical power spectral density (PSD) of an autoregressive model
+        if trunc_radius is None and trunc_tol is None:
+            lo = np.zeros((nt, nf), dtype=np.int32)
+            hi = np.full((nt, nf), np.size(ts), dtype=np.int32)
+
+        else:
+            order = np.argsort(ts_win, kind='stable')
+            ts_win = ts_win[order]
+            pd_ys_win = pd_ys_win[order]
+
+            lo, hi, _ = self.trunc_windows(ts_win, np.asarray(tau, dtype=float), np.asarray(omega, dtype=float), c,
+                                           trunc_radius=trunc_radius, trunc_tol=trunc_tol)
+            lo = lo.astype(np.int32)
+            hi = hi.astype(np.int32)
+
+        return ts_win, pd_ys_win, lo, hi
+
+    def cast_wwz_inputs(self, dtype, ts, pd_ys, tau, omega):
+        ''' Return the inputs of a WWZ kernel in the floating point precision `dtype`.
+
+        In a reduced precision, the time axis and the time shifts are centered first, so that the phases
+        `omega*t` are not computed on large time values; the coefficients do not depend on the time origin.
 
         Args:
-            var_noise (float): the variance of the noise of the AR process
-            freqs (array): vector of frequency
-            ar_params (array): autoregressive coefficients, not including zero-lag
-            f_sampling (float): sampling frequency
+            dtype (dtype): the floating point precision, e.g. np.float32
+            ts (array): time axis of the time series
+            pd_ys (array): the preprocessed time series
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
 
         Returns:
-            psd (array): power spectral density
+            ts, pd_ys, tau, omega (array): the inputs in the precision `dtype`
 
         '''
-        p = np.size(ar_params)
+        if np.dtype(dtype) != np.float64:
+            t_center = np.mean(ts)
+            ts = np.asarray(ts, dtype=float) - t_center
+            tau = np.asarray(tau, dtype=float) - t_center
 
-        tmp = np.ndarray(shape=(p, np.size(freqs)), dtype=complex)
-        for k in range(p):
-            tmp[k, :] = np.exp(-1j*2*np.pi*(k+1)*freqs/f_sampling)
+        ts, pd_ys, tau, omega = [np.asarray(x, dtype=dtype) for x in (ts, pd_ys, tau, omega)]
 
-        psd = var_noise / np.absolute(1-np.sum(ar_params*tmp, axis=0))**2
+        return ts, pd_ys, tau, omega
 
-        return psd
+    def make_prune(self, ts, tau, omega, c, Neff, dv=0.2, v_max=12):
+        ''' Return the (tau, omega) cells whose coefficients are known to be NaNs before running a WWZ kernel.
 
-    def fBMsim(self, N=128, H=0.25):
-        '''Simple method to generate fractional Brownian Motion
+        The cells above the Nyquist frequency have a NaN `omega` (see `make_omega()`), and the cells with
+        `Neff_loc <= Neff` do not have enough points close to tau. The latter is predicted from the number of points
+        in the shells `v_b <= u**2 - u_near**2 < v_b + dv`, where `u = sqrt(c)*omega*|t-tau|` and `u_near` is that of
+        the point nearest to tau, found by binary search in the sorted time axis.
+        Within a shell the weight relative to the nearest point, `exp(-(u**2-u_near**2))`, is bounded, which gives
+        an upper bound of `sum(w)` and a lower bound of `sum(w**2)`, hence an upper bound of
+        `Neff_loc = sum(w)**2/sum(w**2)`. Only the cells whose bound is below `Neff` are pruned,
+        so the pruning does not change the result of any other cell. The kernels only skip the coefficients of the
+        pruned cells: their exact `Neff_loc` is computed here once, see `prune_neffs()`.
 
         Args:
-            N (int): the length of the simulated time series
-            H (float): Hurst index, should be in (0, 1). The relationship between H and the scaling exponent beta is
-                H = (beta-1) / 2
+            ts (array): time axis of the time series
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            dv (float): the width of the shells
+            v_max (float): the outer edge of the last shell; beyond, the weights are below `exp(-v_max)` times
+                the weight of the nearest point
 
         Returns:
-            xfBm (array): the simulated fractional Brownian Motion time series
-
-        References:
-            1. http://cours-physique.lps.ens.fr/index.php/TD11_Correlated_Noise_2011
-            2. https://www.wikiwand.com/en/Fractional_Brownian_motion
+            prune (namedtuple): with the fields
+                mask (array): of shape (nt, nf), True for the cells that the kernels skip
+                Neffs (array): of shape (nt, nf), the local number of effective points of the skipped cells,
+                    as the kernels would compute it; NaNs above the Nyquist frequency and for the other cells
 
-        @authors: jeg, fzhu
         '''
-        assert isinstance(N, int) and N >= 1
-        assert H > 0 and H < 1, "H should be in (0, 1)!"
+        ts = np.sort(ts)
+        tau = np.asarray(tau, dtype=float)
+        nts = np.size(ts)
+        nt = np.size(tau)
+        nf = np.size(omega)
 
-        HH = 2 * H
+        v_edges = np.linspace(0, v_max, int(np.round(v_max/dv))+1)
+        w_max = np.exp(-v_edges[:-1])  # the largest relative weight in each shell
+        w2_min = np.exp(-2*v_edges[1:])  # the smallest squared relative weight in each shell
 
-        ns = N-1  # number of steps
-        covariance = np.ones((ns, ns))
+        i_near = np.clip(np.searchsorted(ts, tau), 1, nts-1)
+        d_near = np.min([np.abs(ts[i_near-1] - tau), np.abs(ts[i_near] - tau)], axis=0)
 
-        for i in range(ns):
-            for j in range(i, ns):
-                x = np.abs(i-j)
-                covariance[i, j] = covariance[j, i] = (np.abs(x-1)**HH + (x+1)**HH - 2*x**HH) / 2.
+        Neffs_max = np.full((nt, nf), np.nan)
+        for k in range(nf):
+            if np.isnan(omega[k]):
+                continue
 
-        w, v = np.linalg.eig(covariance)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                half_width = np.sqrt(d_near[:, np.newaxis]**2 + v_edges/(c*omega[k]**2))
 
-        A = np.zeros((ns, ns))
-        for i in range(ns):
-            for j in range(i, ns):
-                A[i, j] = A[j, i] = np.sum(np.sqrt(w) * v[i, :] * v[j, :])
+            lo = np.searchsorted(ts, tau[:, np.newaxis] - half_width, side='left')
+            hi = np.searchsorted(ts, tau[:, np.newaxis] + half_width, side='right')
+            counts = hi - lo
+            shells = np.diff(counts, axis=1)
 
-        xi = np.random.randn((ns))
-        eta = np.dot(A, xi)
+            sum_w = counts[:, 0] + np.dot(shells, w_max) + (nts - counts[:, -1])*np.exp(-v_max)
+            sum_w2 = counts[:, 0] + np.dot(shells, w2_min)
 
-        xfBm = np.zeros(N)
-        xfBm[0] = 0
-        for i in range(1, N):
-            xfBm[i] = xfBm[i-1] + eta[i-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                Neffs_max[:, k] = np.fmin(sum_w**2 / sum_w2, nts)
 
-        return xfBm
+        # a small margin for the rounding errors of the kernels at the edges of the shells
+        mask = np.isnan(Neffs_max) | (Neffs_max <= Neff*(1-1e-8))
 
-    def psd_fBM(self, freqs, ts, H):
-        ''' Return the theoretical psd of a fBM
+        Prune = collections.namedtuple('Prune', ['mask', 'Neffs'])
+        prune = Prune(mask=mask, Neffs=self.prune_neffs(ts, tau, omega, c, mask))
+
+        return prune
+
+    def prune_neffs(self, ts, tau, omega, c, mask, block_size=2**22):
+        ''' Return the exact local number of effective points `Neff_loc = sum(w)**2/sum(w**2)` of a set of cells.
+
+        The sums only run over the points with `c*(omega*(t-tau))**2 < 746`, the other weights being exactly 0
+        in double precision, so that each cell costs O(window) instead of O(len(ts)).
 
         Args:
-            freqs (array): vector of frequency
-            ts (array): the time axis of the time series
-            H (float): Hurst index, should be in (0, 1)
+            ts (array): time axis of the time series, sorted
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            mask (array): of shape (nt, nf), True for the cells to compute
+            block_size (int): the number of weights evaluated at once
 
         Returns:
-            psd (array): power spectral density
-
-        References:
-            Flandrin, P. On the spectrum of fractional Brownian motions.
-                IEEE Transactions on Information Theory 35, 197–199 (1989).
+            Neffs (array): of shape (nt, nf), `Neff_loc` of the cells of `mask`; NaNs for the other cells
+                and above the Nyquist frequency
 
         '''
-        nf = np.size(freqs)
-        psd = np.ndarray(shape=(nf))
-        T = np.max(ts) - np.min(ts)
+        nts = np.size(ts)
+        Neffs = np.full(np.shape(mask), np.nan)
 
-        omega = 2 * np.pi * freqs
+        for k in range(np.size(omega)):
+            cells = np.flatnonzero(mask[:, k])
+            if np.size(cells) == 0 or np.isnan(omega[k]):
+                continue
 
-        for k in range(nf):
-            tmp = 2 * omega[k] * T
-            psd[k] = (1 - 2**(1 - 2*H)*np.sin(tmp)/tmp) / np.abs(omega[k])**(1 + 2*H)
+            half_width = np.sqrt(746/c) / omega[k]
+            lo = np.searchsorted(ts, tau[cells] - half_width, side='left')
+            hi = np.searchsorted(ts, tau[cells] + half_width, side='right')
 
-        return psd
+            width = max(np.max(hi - lo), 1)
+            n_block = max(block_size // width, 1)
 
-    def get_wwz_func(self, nproc, method):
-        ''' Return the wwz function to use.
+            for b in range(0, np.size(cells), n_block):
+                idx = lo[b:b+n_block, np.newaxis] + np.arange(width)
+                in_window = idx < hi[b:b+n_block, np.newaxis]
+                idx = np.minimum(idx, nts-1)
+
+                dz = omega[k] * (ts[idx] - tau[cells[b:b+n_block], np.newaxis])
+                w = np.where(in_window, np.exp(-c*dz**2), 0)
+
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    Neffs[cells[b:b+n_block], k] = np.sum(w, axis=1)**2 / np.sum(w**2, axis=1)
+
+        return Neffs
+
+    def get_prune(self, prune, ts, tau, omega, c, Neff):
+        ''' Return the cells to be skipped by a WWZ kernel.
 
         Args:
-            nproc (int): the number of processes for multiprocessing
-            method (str): 'Foster' - the original WWZ method;
-                          'Kirchner' - the method Kirchner adapted from Foster;
-                          'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py (default)
+            prune (bool or namedtuple): True - the cells are predicted with `make_prune()`;
+                                        False - no cell is skipped;
+                                        or the output of `make_prune()`, to reuse it across calls
+            ts (array): time axis of the time series
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+
         Returns:
-            wwz_func (function): the wwz function to use
+            prune (namedtuple): see `make_prune()`
 
         '''
-        wa = WaveletAnalysis()
-        wa.assertPositiveInt(nproc)
+        if prune is True:
+            prune = self.make_prune(ts, tau, omega, c, Neff)
+        elif prune is False:
+            Prune = collections.namedtuple('Prune', ['mask', 'Neffs'])
+            shape = (np.size(tau), np.size(omega))
+            prune = Prune(mask=np.zeros(shape, dtype=bool), Neffs=np.full(shape, np.nan))
 
-        if method == 'Foster':
-            if nproc == 1:
-                wwz_func = wa.wwz_basic
-            else:
-                wwz_func = wa.wwz_nproc
+        return prune
 
-        elif method == 'Kirchner':
-            if nproc == 1:
-                wwz_func = wa.kirchner_basic
-            else:
-                wwz_func = wa.kirchner_nproc
+    def wwz_blocks(self, cells_func, ts, pd_ys, tau, omega, c, Neff, block_size=None, keep=None, dtype=np.float64):
+        ''' Evaluate a vectorized WWZ kernel over the (tau, omega) grid, one block of cells at a time.
+
+        Args:
+            cells_func (function): the kernel, `wwz_cells()` or `kirchner_cells()`
+            ts (array): time axis of the time series
+            pd_ys (array): the preprocessed time series
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            block_size (int): the number of (tau, omega) cells evaluated at once. The temporary arrays are of size
+                `block_size*len(ts)`, so this caps the peak memory. If None, it is set so that each temporary array
+                holds about 2**20 elements.
+            keep (array): of shape (nt, nf), the cells to be evaluated, the others being NaNs; if None, all the cells
+            dtype (dtype): the floating point precision of the outputs
+
+        Returns:
+            Neffs, a0, a1, a2 (array): the effective number of points and the coefficients on the (tau, omega) grid
+
+        '''
+        nt = np.size(tau)
+        nf = np.size(omega)
+        nts = np.size(ts)
+
+        if block_size is None:
+            block_size = np.max([2**20 // nts, 1])
+        self.assertPositiveInt(int(block_size))
+
+        tau_grid, omega_grid = np.meshgrid(tau, omega, indexing='ij')
+        tau_cells = tau_grid.ravel()
+        omega_cells = omega_grid.ravel()
+
+        if keep is None:
+            cells = np.arange(nt*nf)
         else:
-            wwz_func = wa.kirchner_f2py
+            cells = np.flatnonzero(keep)
 
-        return wwz_func
+        res = np.full((4, nt*nf), np.nan, dtype=dtype)
+        for start in range(0, np.size(cells), block_size):
+            block = cells[start:start+block_size]
+            res[:, block] = cells_func(ts, pd_ys, tau_cells[block], omega_cells[block], c, Neff)
 
-    def prepare_wwz(self, ys, ts, freqs='nfft', tau=None, len_bd=0, bc_mode='reflect', reflect_type='odd', **kwargs):
-        ''' Return the truncated time series with NaNs deleted and estimate frequency vector and tau
+        Neffs, a0, a1, a2 = res.reshape((4, nt, nf))
+
+        return Neffs, a0, a1, a2
+
+    def wwz_shm_map(self, cells_name, ts, pd_ys, tau, omega, c, Neff, nproc=8, tile_size=None, keep=None):
+        ''' Evaluate a vectorized WWZ kernel over the (tau, omega) grid in parallel, with the data in shared memory.
+
+        `ts`, `pd_ys`, `tau` and `omega` are copied once into shared memory blocks, and each worker of the
+        module-level `executor` evaluates a tile of frequencies with `wwz_blocks()` and writes it
+        directly into a shared output array, so only the names of the blocks are pickled per task.
 
         Args:
-            ys (array): a time series, NaNs will be deleted automatically
-            ts (array): the time points, if `ys` contains any NaNs, some of the time points will be deleted accordingly
-            freqs (array): vector of frequency. If None, use the nfft method.If using Lomb-Scargle, additional parameters
-                may be set. See make_freq_vector
+            cells_name (str): the name of the kernel, 'wwz_cells' or 'kirchner_cells'
+            ts (array): time axis of the time series
+            pd_ys (array): the preprocessed time series
             tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
-                if the boundaries of tau are not exactly on two of the time axis points, then tau will be adjusted to be so
-            len_bd (int): the number of the ghost grids want to create on each boundary
-            bc_mode (str): see np.lib.pad()
-            reflect_type (str): see np.lib.pad()
+            omega (array): the angular frequency vector
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            nproc (int): the number of processes for multiprocessing
+            tile_size (int): the number of frequencies per task. If None, it is set so that there are about
+                4 tasks per process.
+            keep (array): of shape (nt, nf), the cells to be evaluated, the others being NaNs; if None, all the cells
 
         Returns:
-            ys_cut (array): the truncated time series with NaNs deleted
-            ts_cut (array): the truncated time axis of the original time series with NaNs deleted
+            Neffs, a0, a1, a2 (array): the effective number of points and the coefficients on the (tau, omega) grid
+
+        '''
+        nt = np.size(tau)
+        nf = np.size(omega)
+
+        if tile_size is None:
+            tile_size = int(np.ceil(nf / (4*nproc)))
+        self.assertPositiveInt(int(tile_size))
+
+        if keep is None:
+            keep = np.ones((nt, nf), dtype=bool)
+
+        arrays = {'ts': ts, 'pd_ys': pd_ys, 'tau': tau, 'omega': omega, 'keep': keep, 'out': np.zeros((4, nt, nf))}
+
+        shms = []
+        try:
+            specs = {}
+            for key, array in arrays.items():
+                array = np.ascontiguousarray(array, dtype=float)
+                shm = shared_memory.SharedMemory(create=True, size=np.max([array.nbytes, 1]))
+                shms.append(shm)
+                np.ndarray(np.shape(array), dtype=float, buffer=shm.buf)[...] = array
+                specs[key] = (shm.name, np.shape(array))
+
+            tasks = [(specs, cells_name, c, Neff, start, np.min([start+tile_size, nf]))
+                     for start in range(0, nf, tile_size)]
+            executor.map(wwz_shm_tile, tasks, nproc=nproc)
+
+            out = np.ndarray((4, nt, nf), dtype=float, buffer=shms[-1].buf).copy()
+
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+        Neffs, a0, a1, a2 = out
+
+        return Neffs, a0, a1, a2
+
+    def kirchner_cells(self, ts, pd_ys, tau, omega, c, Neff):
+        ''' The vectorized kernel of `kirchner_basic()` for a set of (tau, omega) cells.
+
+        Args:
+            ts (array): time axis of the time series
+            pd_ys (array): the preprocessed time series, or a matrix with one preprocessed time series per column
+            tau, omega (array): the time shift and the angular frequency of each cell, of the same size
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+
+        Returns:
+            Neff_loc, a0, a1, a2 (array): the effective number of points and the coefficients of each cell
+
+        '''
+        Neff_loc, rows = self.kirchner_rows(ts, tau, omega, c, Neff)
+        a0, a1, a2 = np.dot(rows, pd_ys)
+
+        return Neff_loc, a0, a1, a2
+
+    def kirchner_rows(self, ts, tau, omega, c, Neff):
+        ''' Return the weight vectors that map the preprocessed time series onto the coefficients (a0, a1, a2)
+        of `kirchner_basic()` for a set of (tau, omega) cells.
+
+        Args:
+            ts (array): time axis of the time series
+            tau, omega (array): the time shift and the angular frequency of each cell, of the same size
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+
+        Returns:
+            Neff_loc (array): the effective number of points of each cell
+            rows (array): of shape (3, ncells, nts); the rows are NaNs when Neff_loc <= Neff
+
+        '''
+        dz = omega[:, np.newaxis] * (ts - tau[:, np.newaxis])
+        weights = np.exp(-c*dz**2)
+
+        sum_w = np.sum(weights, axis=1)
+        Neff_loc = sum_w**2 / np.sum(weights**2, axis=1)
+
+        # the coefficients cannot be estimated reliably when Neff_loc <= Neff
+        rows = np.full((3, np.size(tau), np.size(ts)), np.nan, dtype=weights.dtype)
+
+        valid = Neff_loc > Neff
+        if not np.any(valid):
+            return Neff_loc, rows
+
+        tau_v = tau[valid][:, np.newaxis]
+        omega_v = omega[valid][:, np.newaxis]
+        w = weights[valid] / sum_w[valid, np.newaxis]
+
+        def w_prod(xs, ys):
+            return np.einsum('ij,ij->i', w, xs*ys)[:, np.newaxis]
+
+        def w_one(xs):
+            return np.einsum('ij,ij->i', w, xs)[:, np.newaxis]
+
+        sin_basis = np.sin(omega_v*ts)
+        cos_basis = np.cos(omega_v*ts)
+
+        sin_one = w_one(sin_basis)
+        cos_one = w_one(cos_basis)
+        sin_cos = w_prod(sin_basis, cos_basis)
+        sin_sin = w_prod(sin_basis, sin_basis)
+        cos_cos = w_prod(cos_basis, cos_basis)
+
+        numerator = 2*(sin_cos - sin_one*cos_one)
+        denominator = (cos_cos - cos_one**2) - (sin_sin - sin_one**2)
+        time_shift = np.arctan2(numerator, denominator) / (2*omega_v)  # Eq. (S5)
+
+        sin_shift = np.sin(omega_v*(ts - time_shift))
+        cos_shift = np.cos(omega_v*(ts - time_shift))
+        sin_tau_center = np.sin(omega_v*(time_shift - tau_v))
+        cos_tau_center = np.cos(omega_v*(time_shift - tau_v))
+
+        # A = 2*(ys_cos_shift - ys_one*cos_shift_one) and B = 2*(ys_sin_shift - ys_one*sin_shift_one) are linear in ys
+        A = 2*w*(cos_shift - w_one(cos_shift))
+        B = 2*w*(sin_shift - w_one(sin_shift))
+
+        rows[0, valid] = w
+        rows[1, valid] = cos_tau_center*A - sin_tau_center*B  # Eq. (S6)
+        rows[2, valid] = sin_tau_center*A + cos_tau_center*B  # Eq. (S7)
+
+        return Neff_loc, rows
+
+    def wwz_cells(self, ts, pd_ys, tau, omega, c, Neff):
+        ''' The vectorized kernel of `wwz_basic()` for a set of (tau, omega) cells.
+
+        Args:
+            ts (array): time axis of the time series
+            pd_ys (array): the preprocessed time series, or a matrix with one preprocessed time series per column
+            tau, omega (array): the time shift and the angular frequency of each cell, of the same size
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+
+        Returns:
+            Neff_loc, ywave_1, ywave_2, ywave_3 (array): the effective number of points and the coefficients of each cell
+
+        '''
+        Neff_loc, rows = self.wwz_rows(ts, tau, omega, c, Neff)
+        ywave_1, ywave_2, ywave_3 = np.dot(rows, pd_ys)
+
+        return Neff_loc, ywave_1, ywave_2, ywave_3
+
+    def wwz_rows(self, ts, tau, omega, c, Neff):
+        ''' Return the weight vectors that map the preprocessed time series onto the coefficients
+        of `wwz_basic()` for a set of (tau, omega) cells.
+
+        Args:
+            ts (array): time axis of the time series
+            tau, omega (array): the time shift and the angular frequency of each cell, of the same size
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+
+        Returns:
+            Neff_loc (array): the effective number of points of each cell
+            rows (array): of shape (3, ncells, nts); the rows are NaNs when Neff_loc <= Neff
+
+        '''
+        dz = omega[:, np.newaxis] * (ts - tau[:, np.newaxis])
+        weights = np.exp(-c*dz**2)
+
+        sum_w = np.sum(weights, axis=1)
+        Neff_loc = sum_w**2 / np.sum(weights**2, axis=1)
+
+        # the coefficients cannot be estimated reliably when Neff_loc <= Neff
+        rows = np.full((3, np.size(tau), np.size(ts)), np.nan, dtype=weights.dtype)
+
+        valid = Neff_loc > Neff
+        if not np.any(valid):
+            return Neff_loc, rows
+
+        w = weights[valid] / sum_w[valid, np.newaxis]
+        phi = np.stack([np.ones_like(w), np.cos(dz[valid]), np.sin(dz[valid])], axis=1)
+
+        S = np.einsum('nt,nit,njt->nij', w, phi, phi)
+        S_inv = np.linalg.pinv(S)
+
+        rows[:, valid] = np.einsum('nij,njt->int', S_inv, w[:, np.newaxis, :]*phi)
+
+        return Neff_loc, rows
+
+    def make_wwz_operator(self, ts, freqs, tau, c=1/(8*np.pi**2), Neff=3, method='Kirchner', weight_tol=None,
+                          block_size=None, dtype=np.float64):
+        ''' Return the linear operator that maps a preprocessed time series onto the wavelet transform coefficients.
+
+        For a fixed time axis, the coefficients (a0, a1, a2) of both the Foster and the Kirchner methods are linear
+        in the preprocessed time series, so the operator can be built once and then applied to many time series
+        (e.g. the AR1 surrogates of the Monte-Carlo simulations) as one matrix product with `apply_wwz_operator()`.
+
+        Args:
+            ts (array): time axis of the time series
             freqs (array): vector of frequency
             tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective degree of freedom
+            method (str): 'Foster' or any of its variants ('Foster_numpy', 'Foster_numba', ...) - the original WWZ method;
+                          otherwise - the method Kirchner adapted from Foster
+            weight_tol (float): if not None, the entries of each row smaller than `weight_tol` times the largest
+                entry of that row are dropped and the operator is stored as sparse matrices
+            block_size (int): the number of (tau, freq) cells evaluated at once; see `wwz_blocks()`
+            dtype (dtype): the floating point precision the operator is stored in; with np.float32 it takes half
+                the memory, and `apply_wwz_operator()` computes in single precision
+
+        Returns:
+            op (namedtuple): with the fields
+                Neffs (array): the matrix of effective number of points in the time-scale coordinates
+                valid (array): of shape (3, nt, nf), where each of the coefficients (a0, a1, a2) is defined
+                ops (tuple): the three matrices of shape (nt*nf, nts) for (a0, a1, a2)
 
         '''
-        ys, ts = Timeseries.clean_ts(ys, ts)
+        self.assertPositiveInt(Neff)
+
+        nt = np.size(tau)
+        nf = np.size(freqs)
+        nts = np.size(ts)
+
+        if method.startswith('Foster'):
+            rows_func = self.wwz_rows
+        else:
+            rows_func = self.kirchner_rows
+
+        if block_size is None:
+            block_size = np.max([2**20 // nts, 1])
+        self.assertPositiveInt(int(block_size))
+
+        omega = self.make_omega(ts, freqs)
+        tau_grid, omega_grid = np.meshgrid(tau, omega, indexing='ij')
+        tau_cells = tau_grid.ravel()
+        omega_cells = omega_grid.ravel()
+
+        Neffs = np.ndarray(shape=(nt*nf))
+        valid = np.ndarray(shape=(3, nt*nf), dtype=bool)
+        if weight_tol is None:
+            ops = np.ndarray(shape=(3, nt*nf, nts), dtype=dtype)
+        else:
+            ops = [[], [], []]
+
+        for start in range(0, nt*nf, block_size):
+            block = slice(start, start+block_size)
+            Neffs[block], rows = rows_func(ts, tau_cells[block], omega_cells[block], c, Neff)
+
+            valid[:, block] = ~np.any(np.isnan(rows), axis=2)
+            rows[np.isnan(rows)] = 0
+
+            if weight_tol is None:
+                ops[:, block] = rows
+            else:
+                row_max = np.max(np.abs(rows), axis=2, keepdims=True)
+                rows[np.abs(rows) < weight_tol*row_max] = 0
+                for i in range(3):
+                    ops[i].append(sparse.csr_matrix(rows[i].astype(dtype)))
+
+        if weight_tol is None:
+            ops = tuple(ops)
+        else:
+            ops = tuple(sparse.vstack(op, format='csr') for op in ops)
+
+        Operator = collections.namedtuple('Operator', ['Neffs', 'valid', 'ops'])
+        op = Operator(Neffs=Neffs.reshape((nt, nf)), valid=valid.reshape((3, nt, nf)), ops=ops)
+
+        return op
+
+    def apply_wwz_operator(self, op, ys, ts, detrend=False, params=['default', 4, 0, 1],
+                           gaussianize=False, standardize=True):
+        ''' Return the weighted wavelet amplitude (WWA) of one or many time series using an operator
+        built by `make_wwz_operator()`.
+
+        Args:
+            op (namedtuple): the operator returned by `make_wwz_operator()` for the time axis `ts`
+            ys (array): a time series, or a matrix with one time series per column
+            ts (array): time axis of the time series
+            detrend (str): 'no' - the original time series is assumed to have no trend;
+                           'linear' - a linear least-squares fit to `ys` is subtracted;
+                           'constant' - the mean of `ys` is subtracted
+                           'savitzy-golay' - ys is filtered using the Savitzky-Golay
+                               filters and the resulting filtered series is subtracted from y.
+            params (list): The paramters for the Savitzky-Golay filters. The first parameter
+                corresponds to the window size (default it set to half of the data)
+                while the second parameter correspond to the order of the filter
+                (default is 4). The third parameter is the order of the derivative
+                (the default is zero, which means only smoothing.)
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+
+        Returns:
+            wwa (array): the weighted wavelet amplitude
+            phase (array): the weighted wavelet phase
+            Neffs (array): the matrix of effective number of points in the time-scale coordinates
+            coeff (array): the wavelet transform coefficients (a0, a1, a2)
+            If `ys` is a matrix, wwa, phase and the coefficients get a leading axis, one entry per column of `ys`.
+
+        '''
+        nt, nf = np.shape(op.Neffs)
+
+        if np.ndim(ys) == 1:
+            pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params,
+                                    gaussianize=gaussianize, standardize=standardize)
+            shape = (nt, nf)
+        else:
+            pd_ys = np.column_stack([self.preprocess(y, ts, detrend=detrend, params=params,
+                                                     gaussianize=gaussianize, standardize=standardize)
+                                     for y in np.transpose(ys)])
+            shape = (nt, nf, np.shape(ys)[1])
+
+        # in the precision of the operator
+        pd_ys = np.asarray(pd_ys, dtype=op.ops[0].dtype)
+
+        a0, a1, a2 = [np.reshape(op_i.dot(pd_ys), shape) for op_i in op.ops]
+
+        for a, valid in zip((a0, a1, a2), op.valid):
+            a[~valid] = np.nan
+
+        if np.ndim(ys) > 1:
+            a0, a1, a2 = [np.moveaxis(a, -1, 0) for a in (a0, a1, a2)]
+
+        wwa = np.sqrt(a1**2 + a2**2)
+        phase = np.arctan2(a2, a1)
+        coeff = (a0, a1, a2)
+
+        return wwa, phase, op.Neffs, coeff
+
+    def quantile_positions(self, n, prob):
+        ''' Return the positions in the sorted sample used by `scipy.stats.mstats.mquantiles()` (alphap=betap=0.4).
+
+        The quantile is `(1-gamma)*x[k-1] + gamma*x[k]`, where x is the sample sorted in ascending order.
+
+        Args:
+            n (int or array): the sample size(s)
+            prob (float): the quantile level
+
+        Returns:
+            k (int or array): the index of the upper of the two order statistics
+            gamma (float or array): the interpolation weight
+
+        '''
+        alphap, betap = 0.4, 0.4
+
+        m = alphap + prob*(1-alphap-betap)
+        aleph = n*prob + m
+        k = np.floor(np.clip(aleph, 1, n-1)).astype(int)
+        gamma = np.clip(aleph-k, 0, 1)
+
+        return k, gamma
+
+    def quantile_ci_ranks(self, n, prob, conf=0.95):
+        ''' Return the ranks of the order statistics that bound the quantile `prob` with confidence `conf`.
+
+        The interval is the distribution-free one from the binomial distribution of the number of
+        simulations below the true quantile.
+
+        Args:
+            n (int or array): the sample size(s)
+            prob (float): the quantile level
+            conf (float): the confidence level
+
+        Returns:
+            r_lo, r_hi (int or array): the 0-based ranks of the lower and upper bounds in the sorted sample;
+                the interval is not available when `r_lo < 0` or `r_hi > n-1`
+
+        '''
+        alpha = 1 - conf
+        n = np.asarray(n)
+
+        with np.errstate(invalid='ignore'):
+            r_lo = np.nan_to_num(binom.ppf(alpha/2, n, prob), nan=-1) - 1
+            r_hi = np.nan_to_num(binom.ppf(1-alpha/2, n, prob), nan=0)
+
+        r_lo = np.where(n > 0, r_lo, -1).astype(int)
+        r_hi = np.where(n > 0, r_hi, 0).astype(int)
+
+        return r_lo, r_hi
+
+    def ar1_quantile_ci(self, red, qs=0.95, conf=0.95):
+        ''' Return the confidence interval of the quantiles of the AR1 simulations.
+
+        Args:
+            red (array): the AR1 simulations stacked along the first axis, NaNs are ignored
+            qs (float or list): the quantile level(s)
+            conf (float): the confidence level
+
+        Returns:
+            lo, hi (array): the bounds of the interval, with the same shape as `ar1_quantiles()`;
+                NaN where there are too few simulations for the interval
+
+        '''
+        red_sorted = np.sort(red, axis=0)  # NaNs are sorted to the end
+        n = np.sum(~np.isnan(red), axis=0)
+
+        probs = np.atleast_1d(qs)
+        lo = np.ndarray(shape=(np.size(probs),) + np.shape(red)[1:])
+        hi = np.ndarray(shape=(np.size(probs),) + np.shape(red)[1:])
+
+        for i, prob in enumerate(probs):
+            r_lo, r_hi = self.quantile_ci_ranks(n, prob, conf=conf)
+            lo[i] = np.take_along_axis(red_sorted, np.clip(r_lo, 0, None)[np.newaxis], axis=0)[0]
+            hi[i] = np.take_along_axis(red_sorted, np.clip(r_hi, None, np.max(n)-1)[np.newaxis], axis=0)[0]
+
+            out = (r_lo < 0) | (r_hi > n-1)
+            lo[i][out] = np.nan
+            hi[i][out] = np.nan
+
+        if np.ndim(qs) == 0:
+            lo, hi = lo[0], hi[0]
+
+        return lo, hi
+
+    def mc_converged(self, q, lo, hi, mc_tol, mc_frac=1):
+        ''' Check if the quantiles of the Monte-Carlo simulations are precise enough to stop.
+
+        Args:
+            q (array): the quantiles
+            lo, hi (array): the bounds of their confidence interval
+            mc_tol (float): the tolerance on the half-width of the interval, relative to the quantile
+            mc_frac (float): the fraction of the cells that have to meet the tolerance
+
+        Returns:
+            converged (bool): True if at least `mc_frac` of the cells with a quantile meet the tolerance
+
+        '''
+        valid = ~np.isnan(q)
+        if not np.any(valid):
+            return True
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_err = (hi[valid]-lo[valid]) / 2 / np.abs(q[valid])
+
+        frac = np.sum(rel_err <= mc_tol) / np.sum(valid)
+
+        return frac >= mc_frac
+
+    def ar1_quantiles(self, red, qs=0.95):
+        ''' Return the quantiles of Monte-Carlo simulations for all the cells at once.
+
+        The quantiles are taken along the first axis with the same plotting positions as
+        `scipy.stats.mstats.mquantiles()` (alphap=betap=0.4); NaNs are ignored cell by cell.
+
+        Args:
+            red (array): the simulations stacked along the first axis, e.g. of shape (nMC, nt, nf)
+            qs (float or list): the quantile level(s)
+
+        Returns:
+            q (array): the quantiles, of shape `red.shape[1:]` if `qs` is a float, otherwise of shape
+                `(len(qs),) + red.shape[1:]`; NaNs where all the simulations are NaNs
+
+        '''
+        red_sorted = np.sort(red, axis=0)  # NaNs are sorted to the end
+        n = np.sum(~np.isnan(red), axis=0)
+
+        probs = np.atleast_1d(qs)
+        q = np.ndarray(shape=(np.size(probs),) + np.shape(red)[1:])
+
+        for i, prob in enumerate(probs):
+            k, gamma = self.quantile_positions(n, prob)
+
+            x_lo = np.take_along_axis(red_sorted, np.clip(k-1, 0, None)[np.newaxis], axis=0)[0]
+            x_hi = np.take_along_axis(red_sorted, k[np.newaxis], axis=0)[0]
+            q[i] = (1-gamma)*x_lo + gamma*x_hi
+
+        q[:, n == 0] = np.nan
+
+        if np.ndim(qs) == 0:
+            q = q[0]
+
+        return q
+
+    def make_coi(self, tau, Neff=3):
+        ''' Return the cone of influence.
+
+        Args:
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            Neff (int): the threshold of the number of effective samples
+
+        Returns:
+            coi (array): cone of influence
+
+        References:
+            wave_signif() in http://paos.colorado.edu/research/wavelets/wave_python/waveletFunctions.py
+
+        '''
+        assert isinstance(Neff, int) and Neff >= 1
+        nt = np.size(tau)
+
+        fourier_factor = 4*np.pi / (Neff+np.sqrt(2+Neff**2))
+        coi_const = fourier_factor / np.sqrt(2)
+
+        dt = np.median(np.diff(tau))
+        nt_half = (nt+1)//2 - 1
+
+        A = np.append(0.00001, np.arange(nt_half)+1)
+        B = A[::-1]
+
+        if nt % 2 == 0:
+            C = np.append(A, B)
+        else:
+            C = np.append(A, B[1:])
+
+        coi = coi_const * dt * C
+
+        return coi
+
+    def make_omega(self, ts, freqs):
+        ''' Return the angular frequency based on the time axis and given frequency vector
+
+        Args:
+            ys (array): a time series
+            ts (array): time axis of the time series
+            freqs (array): vector of frequency
+
+        Returns:
+            omega (array): the angular frequency vector
+
+        '''
+        # for the frequency band larger than f_Nyquist, the wwa will be marked as NaNs
+        f_Nyquist = 0.5 / np.median(np.diff(ts))
+        freqs_with_nan = np.copy(freqs)
+        freqs_with_nan[freqs > f_Nyquist] = np.nan
+        omega = 2*np.pi*freqs_with_nan
+
+        return omega
+
+    def wwa2psd(self, wwa, ts, Neffs, freqs=None, Neff=3, anti_alias=False, avgs=2):
+        """ Return the power spectral density (PSD) using the weighted wavelet amplitude (WWA).
+
+        Args:
+            wwa (array): the weighted wavelet amplitude.
+            ts (array): the time points, should be pre-truncated so that the span is exactly what is used for wwz
+            Neffs (array):  the matrix of effective number of points in the time-scale coordinates obtained from wwz from wwz
+            freqs (array): vector of frequency from wwz
+            Neff (int): the threshold of the number of effective samples
+            anti_alias (bool): whether to apply anti-alias filter
+            avgs (int): flag for whether spectrum is derived from instantaneous point measurements (avgs<>1)
+                        OR from measurements averaged over each sampling interval (avgs==1)
+
+        Returns:
+            psd (array): power spectral density
+
+        References:
+            Kirchner's C code for weighted psd calculation
+
+        """
+        # weighted psd calculation start
+        # summed over blocks of time shifts, so that memory-mapped wwa and Neffs are never loaded all at once
+        nt, nf = np.shape(wwa)
+        block = np.max([2**22 // nf, 1])
+
+        sum_power = np.zeros(nf)
+        sum_eff = np.zeros(nf)
+        for start in range(0, nt, block):
+            wwa_block = np.asarray(wwa[start:start+block], dtype=np.float64)
+            Neffs_block = np.asarray(Neffs[start:start+block], dtype=np.float64)
+
+            power = wwa_block**2 * 0.5 * (np.max(ts)-np.min(ts))/np.size(ts) * Neffs_block
+
+            Neff_diff = Neffs_block - Neff
+            Neff_diff[Neff_diff < 0] = 0
+
+            sum_power += np.nansum(power * Neff_diff, axis=0)
+            sum_eff += np.nansum(Neff_diff, axis=0)
+
+        psd = (sum_power / sum_eff).astype(np.result_type(wwa.dtype, Neffs.dtype))
+        # weighted psd calculation end
+
+        if anti_alias:
+            assert freqs is not None, "freqs is required for alias filter!"
+            psd = self.anti_alias_psd(psd, ts, freqs, avgs=avgs)
+
+        return psd
+
+    def anti_alias_psd(self, psd, ts, freqs, avgs=2):
+        """ Return the power spectral density (PSD) with the alias filter applied.
+
+        Args:
+            psd (array): power spectral density
+            ts (array): the time points
+            freqs (array): vector of frequency
+            avgs (int): flag for whether spectrum is derived from instantaneous point measurements (avgs<>1)
+                        OR from measurements averaged over each sampling interval (avgs==1)
+
+        Returns:
+            psd (array): the filtered power spectral density
+
+        """
+        af = AliasFilter()
+
+        dt = np.median(np.diff(ts))
+        f_sampling = 1/dt
+        psd_copy = psd[1:]
+        freqs_copy = freqs[1:]
+        alpha, filtered_pwr, model_pwer, aliased_pwr = af.alias_filter(
+            freqs_copy, psd_copy, f_sampling, f_sampling*1e3, np.min(freqs), avgs)
+
+        psd[1:] = np.copy(filtered_pwr)
+
+        return psd
+
+    def psd_direct(self, ys, ts, freqs, tau, c=1e-3, Neff=3, method='Kirchner', detrend=False,
+                   params=['default', 4, 0, 1], gaussianize=False, standardize=True, anti_alias=False, avgs=2,
+                   block_size=None, prune=True, dtype=np.float64):
+        """ Return the power spectral density (PSD) of `wwa2psd()` of one or many time series, without the
+        (nt, nf) planes of the WWA.
+
+        The cells are visited frequency by frequency in blocks, and the weighted power of each block is added
+        to the PSD of its frequency right away. The coefficients a1 and a2 are linear in the preprocessed time
+        series, so the rows of the cells (see `kirchner_rows()`) are computed once per block and applied to all
+        the time series at once as one matrix product, e.g. to the data together with all its AR1 surrogates.
+
+        Args:
+            ys (array): a time series, or a matrix with one time series per column
+            ts (array): time axis of the time series
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            c (float): the decay constant
+            Neff (int): the threshold of the number of effective samples
+            method (str): 'Foster' or any of its variants ('Foster_numpy', 'Foster_numba', ...) - the original WWZ method;
+                          otherwise - the method Kirchner adapted from Foster
+            detrend (str): see `preprocess()`
+            params (list): the paramters for the Savitzky-Golay filters, see `preprocess()`
+            gaussianize (bool): If True, gaussianizes the timeseries
+            standardize (bool): If True, standardizes the timeseries
+            anti_alias (bool): whether to apply anti-alias filter
+            avgs (int): flag for whether spectrum is derived from instantaneous point measurements (avgs<>1)
+                        OR from measurements averaged over each sampling interval (avgs==1)
+            block_size (int): the number of (tau, freq) cells evaluated at once
+            prune (bool or namedtuple): if True, the cells known to be NaNs are skipped; see `get_prune()`
+            dtype (dtype): the floating point precision of the matrix products
+
+        Returns:
+            psd (array): power spectral density; if `ys` is a matrix, with a leading axis, one PSD per column of `ys`
+
+        """
+        self.assertPositiveInt(Neff)
+
+        nt = np.size(tau)
+        nf = np.size(freqs)
+        nts = np.size(ts)
+
+        if method.startswith('Foster'):
+            rows_func = self.wwz_rows
+        else:
+            rows_func = self.kirchner_rows
+
+        if block_size is None:
+            block_size = np.max([2**20 // nts, 1])
+        self.assertPositiveInt(int(block_size))
+
+        if np.ndim(ys) == 1:
+            pd_ys = self.preprocess(ys, ts, detrend=detrend, params=params,
+                                    gaussianize=gaussianize, standardize=standardize)[:, np.newaxis]
+        else:
+            pd_ys = np.column_stack([self.preprocess(y, ts, detrend=detrend, params=params,
+                                                     gaussianize=gaussianize, standardize=standardize)
+                                     for y in np.transpose(ys)])
+        pd_ys = np.asarray(pd_ys, dtype=dtype)
+
+        omega = self.make_omega(ts, freqs)
+        prune = self.get_prune(prune, ts, tau, omega, c, Neff)
+
+        # the cells frequency by frequency, without the ones known to be NaNs, which have no weight in the PSD
+        omega_grid, tau_grid = np.meshgrid(omega, tau, indexing='ij')
+        f_grid = np.repeat(np.arange(nf), nt)
+        keep = ~prune.mask.T.ravel()
+        omega_cells = omega_grid.ravel()[keep]
+        tau_cells = tau_grid.ravel()[keep]
+        f_cells = f_grid[keep]
+
+        sum_power = np.zeros((nf, np.shape(pd_ys)[1]))
+        sum_eff = np.zeros(nf)
+        for start in range(0, np.size(f_cells), block_size):
+            block = slice(start, start+block_size)
+            Neff_loc, rows = rows_func(ts, tau_cells[block], omega_cells[block], c, Neff)
+
+            Neff_diff = Neff_loc - Neff
+            valid = Neff_diff > 0
+            if not np.any(valid):
+                continue
+
+            a1 = rows[1, valid].astype(dtype) @ pd_ys
+            a2 = rows[2, valid].astype(dtype) @ pd_ys
+            power = (a1**2 + a2**2) * (0.5 * (np.max(ts)-np.min(ts))/nts * Neff_loc[valid] * Neff_diff[valid])[:, np.newaxis]
+
+            # the cells of a block are sorted by frequency
+            f_valid = f_cells[block][valid]
+            f_uniq, f_start = np.unique(f_valid, return_index=True)
+            sum_power[f_uniq] += np.add.reduceat(power, f_start, axis=0)
+            sum_eff[f_uniq] += np.add.reduceat(Neff_diff[valid], f_start)
+
+        psd = (sum_power / sum_eff[:, np.newaxis]).T.astype(dtype)
+
+        if anti_alias:
+            for psd_i in psd:
+                self.anti_alias_psd(psd_i, ts, freqs, avgs=avgs)
+
+        if np.ndim(ys) == 1:
+            psd = psd[0]
+
+        return psd
+
+    def freq_vector_lomb_scargle(self, ts, nf=None, ofac=4, hifac=1):
+        ''' Return the frequency vector based on the Lomb-Scargle algorithm.
+
+        Args:
+            ts (array): time axis of the time series
+            ofac (float): Oversampling rate that influences the resolution of the frequency axis,
+                         when equals to 1, it means no oversamling (should be >= 1).
+                         The default value 4 is usaually a good value.
+
+            hifac (float): fhi/fnyq (should be >= 1), where fhi is the highest frequency that
+                          can be analyzed by the Lomb-Scargle algorithm and fnyq is the Nyquist frequency.
+
+        Returns:
+            freqs (array): the frequency vector
+
+        References:
+            Trauth, M. H. MATLAB® Recipes for Earth Sciences. (Springer, 2015). pp 181.
+
+        '''
+        assert ofac >= 1 and hifac <= 1, "`ofac` should be >= 1, and `hifac` should be <= 1"
+
+        dt = np.median(np.diff(ts))
+        flo = (1/(2*dt)) / (np.size(ts)*ofac)
+        fhi = hifac / (2*dt)
+
+        if nf is None:
+            df = flo
+            nf = (fhi - flo) / df + 1
+
+        freqs = np.linspace(flo, fhi, nf)
+
+        return freqs
+
+    def freq_vector_welch(self, ts):
+        ''' Return the frequency vector based on the Welch's method.
+
+        Args:
+            ts (array): time axis of the time series
+
+        Returns:
+            freqs (array): the frequency vector
+
+        References:
+            https://github.com/scipy/scipy/blob/v0.14.0/scipy/signal/spectral.py
+
+        '''
+        nt = np.size(ts)
+        dt = np.median(np.diff(ts))
+        fs = 1 / dt
+        if nt % 2 == 0:
+            n_freqs = nt//2 + 1
+        else:
+            n_freqs = (nt+1) // 2
+
+        freqs = np.arange(n_freqs) * fs / nt
+
+        return freqs
+
+    def freq_vector_nfft(self, ts):
+        ''' Return the frequency vector based on NFFT
+
+        Args:
+            ts (array): time axis of the time series
+
+        Returns:
+            freqs (array): the frequency vector
+
+        '''
+        nt = np.size(ts)
+        dt = np.median(np.diff(ts))
+        fs = 1 / dt
+        n_freqs = nt//2 + 1
+
+        freqs = np.linspace(0, fs/2, n_freqs)
+
+        return freqs
+
+    def make_freq_vector(self, ts, method = 'nfft', **kwargs):
+        ''' Make frequency vector- Selector function.
+        
+        This function selects among various methods to obtain the frequency 
+        vector. 
+
+        Args:
+            ts (array): time axis of the time series
+            method (str): The method to use. Options are 'nfft' (default), 'Lomb-Scargle', 'Welch'
+                For Lomb_Scargle, additional parameters may be passed:
+                    nf (int): number of frequency points
+                    ofac (float): Oversampling rate that influences the resolution of the frequency axis,
+                         when equals to 1, it means no oversamling (should be >= 1).
+                         The default value 4 is usaually a good value.
+                    hifac (float): fhi/fnyq (should be >= 1), where fhi is the highest frequency that
+                          can be analyzed by the Lomb-Scargle algorithm and fnyq is the Nyquist frequency.
+        
+        Returns:
+            freqs (array): the frequency vector
+
+        '''
+        
+        if method is 'Lomb-Scargle':
+            freqs = self.freq_vector_lomb_scargle(ts,**kwargs)
+        elif method is 'Welch':
+            freqs = self.freq_vector_welch(ts)        
+        else:
+            freqs = self.freq_vector_nfft(ts)
+        #  freqs = freqs[1:]  # discard the first element 0
+
+        return freqs
+
+    def beta_estimation(self, psd, freqs, fmin, fmax):
+        ''' Estimate the power slope of a 1/f^beta process.
+
+        Args:
+            psd (array): the power spectral density
+            freqs (array): the frequency vector
+            fmin, fmax (float): the frequency range for beta estimation
+
+        Returns:
+            beta (float): the estimated slope
+            f_binned (array): binned frequency vector
+            psd_binned (array): binned power spectral density
+            Y_reg (array): prediction based on linear regression
+
+        '''
+        # drop the PSD at frequency zero
+        if freqs[0] == 0:
+            psd = psd[1:]
+            freqs = freqs[1:]
+
+        Results = collections.namedtuple('Results', ['beta', 'f_binned', 'psd_binned', 'Y_reg', 'std_err'])
+        if np.max(freqs) < fmax or np.min(freqs) > fmin:
+            res = Results(beta=np.nan, f_binned=np.nan, psd_binned=np.nan, Y_reg=np.nan, std_err=np.nan)
+            return res
+
+        # frequency binning start
+        fminindx = np.where(freqs >= fmin)[0][0]
+        fmaxindx = np.where(freqs <= fmax)[0][-1]
+
+        if fminindx >= fmaxindx:
+            res = Results(beta=np.nan, f_binned=np.nan, psd_binned=np.nan, Y_reg=np.nan, std_err=np.nan)
+            return res
+
+        logf = np.log(freqs)
+        logf_step = logf[fminindx+1] - logf[fminindx]
+        logf_start = logf[fminindx]
+        logf_end = logf[fmaxindx]
+        logf_binedges = np.arange(logf_start, logf_end+logf_step, logf_step)
+
+        n_intervals = np.size(logf_binedges)-1
+        logpsd_binned = np.empty(n_intervals)
+        logf_binned = np.empty(n_intervals)
+
+        logpsd = np.log(psd)
+
+        for i in range(n_intervals):
+            lb = logf_binedges[i]
+            ub = logf_binedges[i+1]
+            q = np.where((logf > lb) & (logf <= ub))
+
+            logpsd_binned[i] = np.nanmean(logpsd[q])
+            logf_binned[i] = (ub + lb) / 2
+
+        f_binned = np.exp(logf_binned)
+        psd_binned = np.exp(logpsd_binned)
+        # frequency binning end
+
+        # linear regression below
+        Y = np.log10(psd_binned)
+        X = np.log10(f_binned)
+        X_ex = sm.add_constant(X)
+
+        model = sm.OLS(Y, X_ex)
+        results = model.fit()
+
+        if np.size(results.params) < 2:
+            beta = np.nan
+            Y_reg = np.nan
+            std_err = np.nan
+        else:
+            beta = -results.params[1]  # the slope we want
+            Y_reg = 10**model.predict(results.params)  # prediction based on linear regression
+            std_err = results.bse[1]
+
+        res = Results(beta=beta, f_binned=f_binned, psd_binned=psd_binned, Y_reg=Y_reg, std_err=std_err)
+
+        return res
+
+    def beta2HurstIndex(self, beta):
+        ''' Translate psd slope to Hurst index
+
+        Args:
+            beta (float): the estimated slope of a power spectral density curve
+
+        Returns:
+            H (float): Hurst index, should be in (0, 1)
+
+        References:
+            Equation 2 in http://www.bearcave.com/misl/misl_tech/wavelets/hurst/
+
+        '''
+        H = (beta-1)/2
+
+        return H
+
+    def psd_ar(self, var_noise, freqs, ar_params, f_sampling):
+        ''' Return the theoretical power spectral density (PSD) of an autoregressive model
+
+        Args:
+            var_noise (float): the variance of the noise of the AR process
+            freqs (array): vector of frequency
+            ar_params (array): autoregressive coefficients, not including zero-lag
+            f_sampling (float): sampling frequency
+
+        Returns:
+            psd (array): power spectral density
+
+        '''
+        p = np.size(ar_params)
+
+        tmp = np.ndarray(shape=(p, np.size(freqs)), dtype=complex)
+        for k in range(p):
+            tmp[k, :] = np.exp(-1j*2*np.pi*(k+1)*freqs/f_sampling)
+
+        psd = var_noise / np.absolute(1-np.sum(ar_params*tmp, axis=0))**2
+
+        return psd
+
+    def fBMsim(self, N=128, H=0.25):
+        '''Simple method to generate fractional Brownian Motion
+
+        Args:
+            N (int): the length of the simulated time series
+            H (float): Hurst index, should be in (0, 1). The relationship between H and the scaling exponent beta is
+                H = (beta-1) / 2
+
+        Returns:
+            xfBm (array): the simulated fractional Brownian Motion time series
+
+        References:
+            1. http://cours-physique.lps.ens.fr/index.php/TD11_Correlated_Noise_2011
+            2. https://www.wikiwand.com/en/Fractional_Brownian_motion
+
+        @authors: jeg, fzhu
+        '''
+        assert isinstance(N, int) and N >= 1
+        assert H > 0 and H < 1, "H should be in (0, 1)!"
+
+        HH = 2 * H
+
+        ns = N-1  # number of steps
+        covariance = np.ones((ns, ns))
+
+        for i in range(ns):
+            for j in range(i, ns):
+                x = np.abs(i-j)
+                covariance[i, j] = covariance[j, i] = (np.abs(x-1)**HH + (x+1)**HH - 2*x**HH) / 2.
+
+        w, v = np.linalg.eig(covariance)
+
+        A = np.zeros((ns, ns))
+        for i in range(ns):
+            for j in range(i, ns):
+                A[i, j] = A[j, i] = np.sum(np.sqrt(w) * v[i, :] * v[j, :])
+
+        xi = np.random.randn((ns))
+        eta = np.dot(A, xi)
+
+        xfBm = np.zeros(N)
+        xfBm[0] = 0
+        for i in range(1, N):
+            xfBm[i] = xfBm[i-1] + eta[i-1]
+
+        return xfBm
+
+    def psd_fBM(self, freqs, ts, H):
+        ''' Return the theoretical psd of a fBM
+
+        Args:
+            freqs (array): vector of frequency
+            ts (array): the time axis of the time series
+            H (float): Hurst index, should be in (0, 1)
+
+        Returns:
+            psd (array): power spectral density
+
+        References:
+            Flandrin, P. On the spectrum of fractional Brownian motions.
+                IEEE Transactions on Information Theory 35, 197–199 (1989).
+
+        '''
+        nf = np.size(freqs)
+        psd = np.ndarray(shape=(nf))
+        T = np.max(ts) - np.min(ts)
+
+        omega = 2 * np.pi * freqs
+
+        for k in range(nf):
+            tmp = 2 * omega[k] * T
+            psd[k] = (1 - 2**(1 - 2*H)*np.sin(tmp)/tmp) / np.abs(omega[k])**(1 + 2*H)
+
+        return psd
+
+    def get_wwz_func(self, nproc, method):
+        ''' Return the wwz function to use.
+
+        Args:
+            nproc (int): the number of processes for multiprocessing
+            method (str): 'Foster' - the original WWZ method;
+                          'Foster_numpy' - the original WWZ method vectorized with NumPy;
+                          'Foster_numba' - the original WWZ method compiled with numba;
+                          'Foster_shm' - the original WWZ method with a shared-memory process pool;
+                          'Kirchner' - the method Kirchner adapted from Foster;
+                          'Kirchner_numpy' - the method Kirchner adapted from Foster vectorized with NumPy;
+                          'Kirchner_numba' - the method Kirchner adapted from Foster compiled with numba;
+                          'Kirchner_shm' - the method Kirchner adapted from Foster with a shared-memory process pool;
+                          'Kirchner_nufft' - an approximation of the method Kirchner adapted from Foster with non-uniform
+                              FFTs, for dense frequency vectors; see `kirchner_nufft()`
+                          'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py (default); falls back to 'Kirchner_numba', then to
+                              'Kirchner_numpy', when the f2py extension is not available;
+                          'auto' - see `choose_wwz_method()`, which the callers use to resolve it first;
+                              treated as 'Kirchner_f2py' here
+        Returns:
+            wwz_func (function): the wwz function to use
+
+        '''
+        wa = WaveletAnalysis()
+        wa.assertPositiveInt(nproc)
+
+        if method == 'Foster':
+            if nproc == 1:
+                wwz_func = wa.wwz_basic
+            else:
+                wwz_func = wa.wwz_nproc
+
+        elif method == 'Foster_numpy':
+            wwz_func = wa.wwz_numpy
+
+        elif method == 'Foster_shm':
+            if nproc == 1:
+                wwz_func = wa.wwz_numpy
+            else:
+                wwz_func = wa.wwz_shm
+
+        elif method == 'Kirchner':
+            if nproc == 1:
+                wwz_func = wa.kirchner_basic
+            else:
+                wwz_func = wa.kirchner_nproc
+
+        elif method == 'Kirchner_numpy':
+            wwz_func = wa.kirchner_numpy
+
+        elif method == 'Foster_numba':
+            wwz_func = wa.wwz_numba
+
+        elif method == 'Kirchner_numba':
+            wwz_func = wa.kirchner_numba
+
+        elif method == 'Kirchner_shm':
+            if nproc == 1:
+                wwz_func = wa.kirchner_numpy
+            else:
+                wwz_func = wa.kirchner_shm
+
+        elif method == 'Kirchner_nufft':
+            wwz_func = wa.kirchner_nufft
+
+        elif f2py is not None:
+            wwz_func = wa.kirchner_f2py
+
+        elif numba is not None:
+            warnings.warn("WWZ method: the f2py extension f2py_wwz is not available; will use the numba version instead.")
+            wwz_func = wa.kirchner_numba
+
+        else:
+            warnings.warn("WWZ method: neither the f2py extension f2py_wwz nor numba is available; will use the numpy version instead.")
+            wwz_func = wa.kirchner_numpy
+
+        return wwz_func
+
+    def choose_wwz_method(self, nts, nt, nf, nproc=8, cost_per_proc=2**20, shm_cost=2**27):
+        ''' Choose the WWZ method and the number of processes for `method='auto'`.
+
+        The cost is estimated as `len(ts)*len(tau)*len(freqs)`, the number of weighted points to sum over.
+        The compiled engines are preferred: 'Kirchner_numba', then 'Kirchner_f2py', when they can be imported.
+        Otherwise 'Kirchner_numpy' is used, or 'Kirchner_shm' for large problems with several processes.
+        The number of processes is capped so that each one gets at least `cost_per_proc`, since below that
+        the overhead of the threads or processes dominates. The decision is logged with the `logging` module
+        at the INFO level, under the logger of this module.
+
+        Args:
+            nts (int): the number of points of the time series
+            nt (int): the number of time shifts tau
+            nf (int): the number of frequencies
+            nproc (int): the maximum number of processes or threads
+            cost_per_proc (int): the minimum cost per process
+            shm_cost (int): the minimum cost to use the process pool when no compiled engine is available
+
+        Returns:
+            method (str): the WWZ method, see `get_wwz_func()`
+            nproc (int): the number of processes or threads
+
+        '''
+        self.assertPositiveInt(nproc)
+
+        cost = nts * nt * nf
+        backends = [name for name, module in [('f2py', f2py), ('numba', numba)] if module is not None] + ['numpy']
+
+        nproc_auto = int(np.clip(cost // cost_per_proc, 1, np.min([nproc, multiprocessing.cpu_count()])))
+
+        if numba is not None:
+            method = 'Kirchner_numba'
+        elif f2py is not None:
+            method = 'Kirchner_f2py'
+        elif cost >= shm_cost and nproc_auto >= 2:
+            method = 'Kirchner_shm'
+        else:
+            method = 'Kirchner_numpy'
+            nproc_auto = 1
+
+        logger.info("WWZ method 'auto': cost=%d (len(ts)=%d, len(tau)=%d, len(freqs)=%d), backends=%s -> method=%s, nproc=%d",
+                    cost, nts, nt, nf, backends, method, nproc_auto)
+
+        return method, nproc_auto
+
+    def prepare_wwz(self, ys, ts, freqs='nfft', tau=None, len_bd=0, bc_mode='reflect', reflect_type='odd', **kwargs):
+        ''' Return the truncated time series with NaNs deleted and estimate frequency vector and tau
+
+        Args:
+            ys (array): a time series, NaNs will be deleted automatically
+            ts (array): the time points, if `ys` contains any NaNs, some of the time points will be deleted accordingly
+            freqs (array): vector of frequency. If None, use the nfft method.If using Lomb-Scargle, additional parameters
+                may be set. See make_freq_vector
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+                if the boundaries of tau are not exactly on two of the time axis points, then tau will be adjusted to be so
+            len_bd (int): the number of the ghost grids want to create on each boundary
+            bc_mode (str): see np.lib.pad()
+            reflect_type (str): see np.lib.pad()
+
+        Returns:
+            ys_cut (array): the truncated time series with NaNs deleted
+            ts_cut (array): the truncated time axis of the original time series with NaNs deleted
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+
+        '''
+        ys, ts = Timeseries.clean_ts(ys, ts)
+
+        if tau is None:
+            med_res = np.size(ts) // np.median(np.diff(ts))
+            tau = np.linspace(np.min(ts), np.max(ts), np.max([np.size(ts)//10, 50, med_res]))
+
+        elif np.isnan(tau).any():
+            warnings.warn("The input tau contains some NaNs." +
+                          "It will be regenerated using the boundarys of the time axis of the time series with NaNs deleted," +
+                          "with the length of the size of the input tau.")
+            tau = np.linspace(np.min(ts), np.max(ts), np.size(tau))
+
+        elif np.min(tau) < np.min(ts) and np.max(tau) > np.max(ts):
+            warnings.warn("tau should be within the time span of the time series." +
+                          "Note that sometimes if the leading points of the time series are NaNs," +
+                          "they will be deleted and cause np.min(tau) < np.min(ts)." +
+                          "A new tau with the same size of the input tau will be generated.")
+            tau = np.linspace(np.min(ts), np.max(ts), np.size(tau))
+
+        elif np.min(tau) not in ts or np.max(tau) not in ts:
+            warnings.warn("The boundaries of tau are not exactly on two of the time axis points," +
+                          "and it will be adjusted to be so.")
+            tau_lb = np.min(ts[ts > np.min(tau)])
+            tau_ub = np.max(ts[ts < np.max(tau)])
+            tau = np.linspace(tau_lb, tau_ub, np.size(tau))
+
+        # boundary condition
+        if len_bd > 0:
+            dt = np.median(np.diff(ts))
+            dtau = np.median(np.diff(tau))
+            len_bd_tau = len_bd*dt//dtau
+
+            if bc_mode in ['reflect', 'symmetric']:
+                ys = np.lib.pad(ys, (len_bd, len_bd), bc_mode, reflect_type=reflect_type)
+            else:
+                ys = np.lib.pad(ys, (len_bd, len_bd), bc_mode)
+
+            ts_left_bd = np.linspace(ts[0]-dt*len_bd, ts[0]-dt, len_bd)
+            ts_right_bd = np.linspace(ts[-1]+dt, ts[-1]+dt*len_bd, len_bd)
+            ts = np.concatenate((ts_left_bd, ts, ts_right_bd))
+
+            warnings.warn("The tau will be regenerated to fit the boundary condition.")
+            tau_left_bd = np.linspace(tau[0]-dtau*len_bd_tau, tau[0]-dtau, len_bd_tau)
+            tau_right_bd = np.linspace(tau[-1]+dtau, tau[-1]+dtau*len_bd_tau, len_bd_tau)
+            tau = np.concatenate((tau_left_bd, tau, tau_right_bd))
+
+        # truncate the time series when the range of tau is smaller than that of the time series
+        ts_cut = ts[(np.min(tau) <= ts) & (ts <= np.max(tau))]
+        ys_cut = ys[(np.min(tau) <= ts) & (ts <= np.max(tau))]
+
+        if freqs is None or isinstance(freqs, str):
+            freqs = self.make_freq_vector(ts_cut, method = 'nfft')
+
+        return ys_cut, ts_cut, freqs, tau
+
+    def prepare_wwz_update(self, res, ys, ts, c=1/(8*np.pi**2), update_tol=1e-8, detrend=False, gaussianize=False,
+                           standardize=True):
+        ''' Return the record of a previous wwz extended with newly appended points, and how to reuse its results
+
+        Args:
+            res (namedtuple): the results of wwz on the previous record, see wwz()
+            ys (array): the new values appended to the record, NaNs will be deleted automatically
+            ts (array): the time points of the new values, after the end of the previous record
+            c (float): the decay constant used for the previous results
+            update_tol (float): at each frequency, the time shifts where the Gaussian window weights the first new
+                point by more than `update_tol` are recomputed; the other ones are kept
+            detrend (str): the detrending used for the previous results
+            gaussianize (bool): the gaussianization used for the previous results
+            standardize (bool): the standardization used for the previous results
+
+        Returns:
+            ys_cut (array): the extended time series
+            ts_cut (array): the extended time axis
+            freqs (array): vector of frequency, the one of the previous results
+            tau (array): the time shifts of the previous results, extended with the same spacing until the end of
+                the new record
+            n_keep (array): the number of leading time shifts whose results are kept, for each frequency; the zero
+                frequency weights all the points equally, so none of its time shifts are kept
+            scale (float): the factor to apply to wwa and to the coefficients kept, as the standardization changes
+            shift (float): the offset to add to the constant coefficient a0 kept
+
+        '''
+        assert hasattr(res, "ys_cut") and hasattr(res, "ts_cut"), "The results should come from wwz()!"
+
+        ys, ts = Timeseries.clean_ts(ys, ts)
+        assert np.min(ts) > np.max(res.ts_cut), "The new points should be appended after the end of the record!"
+
+        ys_cut = np.concatenate((res.ys_cut, ys))
+        ts_cut = np.concatenate((res.ts_cut, ts))
+        freqs = res.freqs
+
+        dtau = np.median(np.diff(res.tau))
+        n_new = int((np.max(ts_cut) - np.max(res.tau)) // dtau)
+        tau = np.concatenate((res.tau, np.max(res.tau) + dtau*np.arange(1, n_new+1)))
+
+        omega = self.make_omega(ts_cut, freqs)
+        with np.errstate(divide='ignore'):
+            radius = np.sqrt(-np.log(update_tol)/c) / omega
+        n_keep = np.sum(res.tau[:, np.newaxis] <= np.min(ts) - radius, axis=0)
+
+        # the frequencies above f_Nyquist are NaNs, unless f_Nyquist changes with the new points
+        omega_old = self.make_omega(res.ts_cut, freqs)
+        n_keep[np.isnan(omega) & np.isnan(omega_old)] = np.size(res.tau)
+
+        scale, shift = 1, 0
+        if detrend is True or gaussianize:
+            warnings.warn("The detrending and the gaussianization depend on the whole record nonlinearly, " +
+                          "so all the time shifts will be recomputed.")
+            n_keep[:] = 0
+
+        elif standardize:
+            # the results are linear in the standardized values, (ys-mu)/sig
+            _, mu_old, sig_old = Timeseries.standardize(res.ys_cut)
+            _, mu_new, sig_new = Timeseries.standardize(ys_cut)
+            scale = sig_old / sig_new
+            shift = (mu_old - mu_new) / sig_new
+
+        return ys_cut, ts_cut, freqs, tau, n_keep, scale, shift
+
+    def cross_wt(self, coeff1, coeff2):
+        ''' Return the cross wavelet transform.
+
+        Args:
+            coeff1, coeff2 (array): the two sets of wavelet transform coefficients **in the form of a1 + a2*1j**
+            freqs (array): vector of frequency
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+
+        Returns:
+            xw_amplitude (array): the cross wavelet amplitude
+            xw_phase (array): the cross wavelet phase
+
+        References:
+            1.Grinsted, A., Moore, J. C. & Jevrejeva, S. Application of the cross wavelet transform and
+                wavelet coherence to geophysical time series. Nonlin. Processes Geophys. 11, 561–566 (2004).
+
+        '''
+        xwt = coeff1 * np.conj(coeff2)
+        xw_amplitude = np.sqrt(xwt.real**2 + xwt.imag**2)
+        xw_phase = np.arctan2(xwt.imag, xwt.real)
+
+        return xwt, xw_amplitude, xw_phase
+
+    def wavelet_coherence(self, coeff1, coeff2, freqs, tau, smooth_factor=0.25):
+        ''' Return the cross wavelet coherence.
+
+        Args:
+            coeff1, coeff2 (array): the two sets of wavelet transform coefficients **in the form of a1 + a2*1j**
+            freqs (array): vector of frequency.
+            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+
+        Returns:
+            xw_coherence (array): the cross wavelet coherence
+
+        References:
+            1. Grinsted, A., Moore, J. C. & Jevrejeva, S. Application of the cross wavelet transform and
+                wavelet coherence to geophysical time series. Nonlin. Processes Geophys. 11, 561–566 (2004).
+            2. Matlab code by Grinsted (https://github.com/grinsted/wavelet-coherence)
+            3. Python code by Sebastian Krieger (https://github.com/regeirk/pycwt)
+
+        '''
+        def rect(length, normalize=False):
+            """ Rectangular function adapted from https://github.com/regeirk/pycwt/blob/master/pycwt/helpers.py
+
+            Args:
+                length (int): length of the rectangular function
+                normalize (bool): normalize or not
+
+            Returns:
+                rect (array): the (normalized) rectangular function
+
+            """
+            rect = np.zeros(length)
+            rect[0] = rect[-1] = 0.5
+            rect[1:-1] = 1
+
+            if normalize:
+                rect /= rect.sum()
+
+            return rect
+
+        def Smoothing(coeff, snorm, dj, smooth_factor=smooth_factor):
+            """ Soothing function adapted from https://github.com/regeirk/pycwt/blob/master/pycwt/helpers.py
+
+            Args:
+                coeff (array): the wavelet coefficients get from wavlet transform **in the form of a1 + a2*1j**
+                snorm (array): normalized scales
+                dj (float): it satisfies the equation [ Sj = S0 * 2**(j*dj) ]
+
+            Returns:
+                rect (array): the (normalized) rectangular function
+
+            """
+            def fft_kwargs(signal, **kwargs):
+                return {'n': np.int(2 ** np.ceil(np.log2(len(signal))))}
+
+            W = coeff.transpose()
+            m, n = np.shape(W)
+
+            # Smooth in time
+            k = 2 * np.pi * fft.fftfreq(fft_kwargs(W[0, :])['n'])
+            k2 = k ** 2
+            # Notes by Smoothing by Gaussian window (absolute value of wavelet function)
+            # using the convolution theorem: multiplication by Gaussian curve in
+            # Fourier domain for each scale, outer product of scale and frequency
+            F = np.exp(-smooth_factor * (snorm[:, np.newaxis] ** 2) * k2)  # Outer product
+            smooth = fft.ifft(F * fft.fft(W, axis=1, **fft_kwargs(W[0, :])),
+                              axis=1,  # Along Fourier frequencies
+                              **fft_kwargs(W[0, :], overwrite_x=True))
+            T = smooth[:, :n]  # Remove possibly padded region due to FFT
+            if np.isreal(W).all():
+                T = T.real
+
+            # Smooth in scale
+            wsize = 0.6 / dj * 2
+            win = rect(np.int(np.round(wsize)), normalize=True)
+            T = signal.convolve2d(T, win[:, np.newaxis], 'same')
+            S = T.transpose()
+
+            return S
+
+        xwt = coeff1 * np.conj(coeff2)
+        power1 = np.abs(coeff1)**2
+        power2 = np.abs(coeff2)**2
+
+        scales = 1/freqs  # `scales` here is the `Period` axis in the wavelet plot
+        dt = np.median(np.diff(tau))
+        snorm = scales / dt  # normalized scales
+
+        # with WWZ method, we don't have a constant dj, so we will just take the average over the whole scale range
+        N = np.size(scales)
+        s0 = scales[-1]
+        sN = scales[0]
+        dj = np.log2(sN/s0) / N
+
+        S12 = Smoothing(xwt/scales, snorm, dj)
+        S1 = Smoothing(power1/scales, snorm, dj)
+        S2 = Smoothing(power2/scales, snorm, dj)
+        xw_coherence = np.abs(S12)**2 / (S1*S2)
+        wcs = S12 / (np.sqrt(S1)*np.sqrt(S2))
+        xw_phase = np.angle(wcs)
+
+        return xw_coherence, xw_phase
+
+    def reconstruct_ts(self, coeff, freqs, tau, t, len_bd=0):
+        ''' Reconstruct the normalized time series from the wavelet coefficients.
+        
+        Args:
+            coeff (array): the coefficients of the corresponding basis functions (a0, a1, a2)
+            freqs (array): vector of frequency of the basis functions
+            tau (array): the evenly-spaced time points of the basis functions
+            t (array): the specified evenly-spaced time points of the reconstructed time series
+            len_bd (int): the number of the ghost grids want to creat on each boundary
+
+        Returns:
+            rec_ts (array): the reconstructed normalized time series
+            t (array): the evenly-spaced time points of the reconstructed time series
+        '''
+        omega = 2*np.pi*freqs
+        nf = np.size(freqs)
+
+        dt = np.median(np.diff(t))
+        if len_bd > 0:
+            t_left_bd = np.linspace(t[0]-dt*len_bd, t[0]-dt, len_bd)
+            t_right_bd = np.linspace(t[-1]+dt, t[-1]+dt*len_bd, len_bd)
+            t = np.concatenate((t_left_bd, t, t_right_bd))
+
+        ntau = np.size(tau)
+        a_0, a_1, a_2 = coeff
+
+        rec_ts = np.zeros(np.size(t))
+        for k in range(nf):
+            for j in range(ntau):
+                if np.isnan(a_0[j, k]) or np.isnan(a_1[j, k]) or np.isnan(a_1[j, k]):
+                    continue
+                else:
+                    dz = omega[k] * (t - tau[j])
+                    phi_1 = np.cos(dz)
+                    phi_2 = np.sin(dz)
+
+                    rec_ts += (a_0[j, k] + a_1[j, k]*phi_1 + a_2[j, k]*phi_2)
+
+        rec_ts = self.preprocess(rec_ts, t, detrend=False, gaussianize=False, standardize=True)
+
+        return rec_ts, t
+
+
+class StreamingQuantiles(object):
+    ''' Running quantiles of Monte-Carlo simulations that are processed batch by batch.
+
+    Only the largest values of every cell that can still be needed for the requested quantile levels are kept,
+    so the result is exactly that of `WaveletAnalysis.ar1_quantiles()` on the full stack of simulations,
+    while the memory is about `(1-min(qs))*nMC` values per cell instead of `nMC`.
+    '''
+
+    def __init__(self, shape, nMC, qs=0.95, conf=None, dtype=np.float64):
+        '''
+        Args:
+            shape (tuple): the shape of one simulation, e.g. (nt, nf)
+            nMC (int): the maximum number of simulations
+            qs (float or list): the quantile level(s)
+            conf (float): if not None, also keep what is needed for the confidence interval of the
+                quantiles at this level, see `ci()`
+            dtype (dtype): the floating point precision the top values are kept in
+
+        '''
+        self.wa = WaveletAnalysis()
+        self.qs = qs
+        self.conf = conf
+
+        # the number of top order statistics needed for any sample size up to nMC
+        ns = np.arange(1, nMC+1)
+        self.ntop = 1
+        for prob in np.atleast_1d(qs):
+            k, _ = self.wa.quantile_positions(ns, prob)
+            self.ntop = np.max([self.ntop, np.max(ns - np.clip(k-1, 0, None))])
+
+            if conf is not None:
+                r_lo, _ = self.wa.quantile_ci_ranks(ns, prob, conf=conf)
+                self.ntop = np.max([self.ntop, np.max(ns - np.clip(r_lo, 0, None))])
+
+        self.top = np.full((self.ntop,) + tuple(shape), -np.inf, dtype=dtype)
+        self.n = np.zeros(shape, dtype=int)
+
+    def update(self, batch):
+        ''' Add a batch of simulations.
+
+        Args:
+            batch (array): the simulations stacked along the first axis, e.g. of shape (nb, nt, nf)
+
+        '''
+        nb = np.shape(batch)[0]
+        batch = np.asarray(batch, dtype=self.top.dtype)
+        self.n += np.sum(~np.isnan(batch), axis=0)
+
+        # NaNs never make it into the top values
+        stacked = np.concatenate([self.top, np.where(np.isnan(batch), -np.inf, batch)], axis=0)
+        self.top = np.partition(stacked, nb, axis=0)[nb:]
+
+    def quantiles(self):
+        ''' Return the quantiles of the simulations added so far.
+
+        Returns:
+            q (array): see `WaveletAnalysis.ar1_quantiles()`
+
+        '''
+        top_sorted = np.sort(self.top, axis=0)
+        n = self.n
+
+        probs = np.atleast_1d(self.qs)
+        q = np.ndarray(shape=(np.size(probs),) + np.shape(n))
+
+        for i, prob in enumerate(probs):
+            k, gamma = self.wa.quantile_positions(n, prob)
+
+            x_lo = self.order_stat(top_sorted, np.clip(k-1, 0, None))
+            x_hi = self.order_stat(top_sorted, k)
+            q[i] = (1-gamma)*x_lo + gamma*x_hi
+
+        q[:, n == 0] = np.nan
+
+        if np.ndim(self.qs) == 0:
+            q = q[0]
+
+        return q
+
+    def ci(self):
+        ''' Return the confidence interval of the quantiles of the simulations added so far.
+
+        Returns:
+            lo, hi (array): see `WaveletAnalysis.ar1_quantile_ci()`
+
+        '''
+        assert self.conf is not None, "The confidence level `conf` should be set to get the confidence interval."
+
+        top_sorted = np.sort(self.top, axis=0)
+        n = self.n
+
+        probs = np.atleast_1d(self.qs)
+        lo = np.ndarray(shape=(np.size(probs),) + np.shape(n))
+        hi = np.ndarray(shape=(np.size(probs),) + np.shape(n))
+
+        for i, prob in enumerate(probs):
+            r_lo, r_hi = self.wa.quantile_ci_ranks(n, prob, conf=self.conf)
+            lo[i] = self.order_stat(top_sorted, r_lo)
+            hi[i] = self.order_stat(top_sorted, r_hi)
+
+            out = (r_lo < 0) | (r_hi > n-1)
+            lo[i][out] = np.nan
+            hi[i][out] = np.nan
+
+        if np.ndim(self.qs) == 0:
+            lo, hi = lo[0], hi[0]
+
+        return lo, hi
+
+    def order_stat(self, top_sorted, r):
+        ''' Return the order statistics of rank `r` (0-based, per cell) from the sorted top values.
+        '''
+        # the order statistic of rank r is at position r - n + ntop of the sorted top values
+        i_top = np.clip(r + self.ntop - self.n, 0, self.ntop-1)
+
+        return np.take_along_axis(top_sorted, i_top[np.newaxis], axis=0)[0]
+
+
+class AliasFilter(object):
+    '''Performing anti-alias filter on a psd @author: fzhu
+    '''
+
+    def alias_filter(self, freq, pwr, fs, fc, f_limit, avgs):
+        ''' anti_alias filter
+        
+        Args:
+            freq (array): vector of frequencies in power spectrum
+            pwr (array): vector of spectral power corresponding to frequencies "freq"
+            fs (float): sampling frequency
+            fc (float): corner frequency for 1/f^2 steepening of power spectrum
+            f_limit (float): lower frequency limit for estimating misfit of model-plus-alias spectrum vs. measured power
+            avgs (int): flag for whether spectrum is derived from instantaneous point measurements (avgs<>1)
+                        OR from measurements averaged over each sampling interval (avgs==1)
+
+        Returns:
+            alpha (float): best-fit exponent of power-law model
+            filtered_pwr (array): vector of alias-filtered spectral power
+            model_pwr (array): vector of modeled spectral power
+            aliased_pwr (array): vector of modeled spectral power, plus aliases
+
+        References:
+            1. Kirchner, J. W. Aliasing in 1/f(alpha) noise spectra: origins, consequences, and remedies.
+                    Phys Rev E Stat Nonlin Soft Matter Phys 71, 66110 (2005).
+
+        '''
+        log_pwr = np.log(pwr)
+        freq_mask = (freq > f_limit)*1  # convert True & False to 1 & 0
+
+        alpha_upper_bound = 5
+
+        if avgs == 1:
+            alpha_lower_bound = -2.9  # if measurements are time-averaged
+        else:
+            alpha_lower_bound = -0.9  # if measurements are point samples
+
+        alpha = optimize.fminbound(self.misfit, alpha_lower_bound, alpha_upper_bound,
+                                   args=(fs, fc, freq, log_pwr, freq_mask, avgs), xtol=1e-4)
+
+        model_pwr, aliased_pwr, RMSE = self.alias(alpha, fs, fc, freq, log_pwr, freq_mask, avgs)
+        filtered_pwr = pwr * model_pwr / aliased_pwr
+
+        return alpha, filtered_pwr, model_pwr, aliased_pwr
+
+    def misfit(self, alpha, fs, fc, freq, log_pwr, freq_mask, avgs):
+        model, aliased_pwr, RMSE = self.alias(alpha, fs, fc, freq, log_pwr, freq_mask, avgs)
+        return RMSE
+
+    def alias(self, alpha, fs, fc, freq, log_pwr, freq_mask, avgs):
+        model_pwr = self.model(alpha, fs, fc, freq, avgs)
+        aliased_pwr = np.copy(model_pwr)
+        if avgs == 1:
+            aliased_pwr = aliased_pwr * np.sinc(freq/fs) ** 2
+
+        for k in range(1, 11):
+            alias_minus = self.model(alpha, fs, fc, k*fs-freq, avgs)
+            if avgs == 1:
+                alias_minus = alias_minus * np.sinc((k*fs-freq)/fs) ** 2
+
+            aliased_pwr = aliased_pwr + alias_minus
+
+            alias_plus = self.model(alpha, fs, fc, k*fs+freq, avgs)  # notice the + in (k*fs+freq)
+            if avgs == 1:
+                alias_plus = alias_plus * np.sinc((k*fs+freq)/fs) ** 2
+
+            aliased_pwr = aliased_pwr + alias_plus
+
+        if avgs == 1:
+            beta = alpha + 3
+            const = 1 / (2*np.pi**2*beta/fs)
+        else:
+            beta = alpha + 1
+            const = 1 / (beta*fs)
+
+        zo_minus = (11*fs-freq)**(-beta)
+        dz_minus = zo_minus / 20
+
+        for j in range(1, 21):
+            aliased_pwr = aliased_pwr + const / ((j*dz_minus)**(2/beta) + 1/fc**2)*dz_minus
+
+        zo_plus = (11*fs+freq)**(-beta)
+        dz_plus = zo_plus / 20
+
+        for j in range(1, 21):
+            aliased_pwr = aliased_pwr + const / ((j*dz_plus)**(2/beta) + 1/fc**2)*dz_plus
+
+        log_aliased = np.log(aliased_pwr)
+
+        prefactor = np.sum((log_pwr - log_aliased) * freq_mask) / np.sum(freq_mask)
+
+        log_aliased = log_aliased + prefactor
+        aliased_pwr = aliased_pwr * np.exp(prefactor)
+        model_pwr = model_pwr * np.exp(prefactor)
+
+        RMSE = np.sqrt(np.sum((log_aliased-log_pwr)*(log_aliased-log_pwr)*freq_mask)) / np.sum(freq_mask)
+
+        return model_pwr, aliased_pwr, RMSE
+
+    def model(self, alpha, fs, fc, freq, avgs):
+        spectr = freq**(-alpha) / (1 + (freq/fc)**2)
+
+        return spectr
+
+
+class Filter(object):
+    """Group various Filters under a class
+    """
+    @staticmethod
+    def savitzky_golay(y, window_size, order, deriv=0, rate=1):
+        """ Smooth (and optionally differentiate) data with a Savitzky-Golay filter.
+
+        The Savitzky-Golay filter removes high frequency noise from data.
+        It has the advantage of preserving the original shape and
+        features of the signal better than other types of filtering
+        approaches, such as moving averages techniques.
+
+        The Savitzky-Golay is a type of low-pass filter, particularly
+        suited for smoothing noisy data. The main idea behind this
+        approach is to make for each point a least-square fit with a
+        polynomial of high order over a odd-sized window centered at
+        the point.
+
+        Args:
+            y (array): the values of the time history of the signal.
+            window_size (int) : the length of the window. Must be an odd integer number.
+            order (int) : the order of the polynomial used in the filtering. Must be less then `window_size` - 1.
+            deriv (int): the order of the derivative to compute (default = 0 means only smoothing)
+
+        Returns:
+
+            ys - ndarray of shape (N), the smoothed signal (or it's n-th derivative).
+
+        Reference:
+
+            - A. Savitzky, M. J. E. Golay, Smoothing and Differentiation of
+                Data by Simplified Least Squares Procedures. Analytical
+                Chemistry, 1964, 36 (8), pp 1627-1639.
+            - Numerical Recipes 3rd Edition: The Art of Scientific Computing
+                W.H. Press, S.A. Teukolsky, W.T. Vetterling, B.P. Flannery
+                Cambridge University Press ISBN-13: 9780521880688
+            - SciPy Cookbook: shttps://github.com/scipy/scipy-cookbook/blob/master/ipython/SavitzkyGolay.ipynb
+        """
+        if type(window_size)is not int:
+            sys.exit("window_size should be of type int")
+        if type(order) is not int:
+            sys.exit("order should be of type int")
+        # Check window size and order
+        if window_size % 2 != 1 or window_size < 1:
+            raise TypeError("window_size size must be a positive odd number")
+        if window_size < order + 2:
+            raise TypeError("window_size is too small for the polynomials order")
+        order_range = range(order+1)
+        half_window = (window_size-1) // 2
+        # precompute coefficients
+        b = np.mat([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
+        m = np.linalg.pinv(b).A[deriv] * rate**deriv * factorial(deriv)
+        # pad the signal at the extremes with
+        # values taken from the signal itself
+        firstvals = y[0] - np.abs(y[1:half_window+1][::-1] - y[0])
+        lastvals = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
+        y = np.concatenate((firstvals, y, lastvals))
 
-        if tau is None:
-            med_res = np.size(ts) // np.median(np.diff(ts))
-            tau = np.linspace(np.min(ts), np.max(ts), np.max([np.size(ts)//10, 50, med_res]))
+        return np.convolve(m[::-1], y, mode='valid')
 
-        elif np.isnan(tau).any():
-            warnings.warn("The input tau contains some NaNs." +
-                          "It will be regenerated using the boundarys of the time axis of the time series with NaNs deleted," +
-                          "with the length of the size of the input tau.")
-            tau = np.linspace(np.min(ts), np.max(ts), np.size(tau))
+'''
+Interface for the users below, more checks about the input will be performed here
+'''
 
-        elif np.min(tau) < np.min(ts) and np.max(tau) > np.max(ts):
-            warnings.warn("tau should be within the time span of the time series." +
-                          "Note that sometimes if the leading points of the time series are NaNs," +
-                          "they will be deleted and cause np.min(tau) < np.min(ts)." +
-                          "A new tau with the same size of the input tau will be generated.")
-            tau = np.linspace(np.min(ts), np.max(ts), np.size(tau))
 
-        elif np.min(tau) not in ts or np.max(tau) not in ts:
-            warnings.warn("The boundaries of tau are not exactly on two of the time axis points," +
-                          "and it will be adjusted to be so.")
-            tau_lb = np.min(ts[ts > np.min(tau)])
-            tau_ub = np.max(ts[ts < np.max(tau)])
-            tau = np.linspace(tau_lb, tau_ub, np.size(tau))
+class Executor(object):
+    ''' A process pool shared by the parallel engines of `wwz()`, `wwz_psd()`, `xwt()`, `xwc()` and `Stats.corrsig()`.
 
-        # boundary condition
-        if len_bd > 0:
-            dt = np.median(np.diff(ts))
-            dtau = np.median(np.diff(tau))
-            len_bd_tau = len_bd*dt//dtau
+    The workers are started once and reused by every call, instead of a new pool for every transform.
+    Use the module-level instance `executor`. If it is not started explicitly, it is started on first use with
+    the `nproc` of the call, and restarted when a call asks for another number of workers. Once started
+    explicitly with `start()`, its number of workers is kept until `shutdown()`.
 
-            if bc_mode in ['reflect', 'symmetric']:
-                ys = np.lib.pad(ys, (len_bd, len_bd), bc_mode, reflect_type=reflect_type)
-            else:
-                ys = np.lib.pad(ys, (len_bd, len_bd), bc_mode)
+    Examples:
+        >>> Spectral.executor.start(nproc=8)
+        >>> res = Spectral.wwz(ys, ts, method='Kirchner_shm', nproc=8)
+        >>> Spectral.executor.shutdown()
 
-            ts_left_bd = np.linspace(ts[0]-dt*len_bd, ts[0]-dt, len_bd)
-            ts_right_bd = np.linspace(ts[-1]+dt, ts[-1]+dt*len_bd, len_bd)
-            ts = np.concatenate((ts_left_bd, ts, ts_right_bd))
+        or, equivalently,
 
-            warnings.warn("The tau will be regenerated to fit the boundary condition.")
-            tau_left_bd = np.linspace(tau[0]-dtau*len_bd_tau, tau[0]-dtau, len_bd_tau)
-            tau_right_bd = np.linspace(tau[-1]+dtau, tau[-1]+dtau*len_bd_tau, len_bd_tau)
-            tau = np.concatenate((tau_left_bd, tau, tau_right_bd))
+        >>> with Spectral.executor.start(nproc=8):
+        ...     res = Spectral.wwz(ys, ts, method='Kirchner_shm', nproc=8)
 
-        # truncate the time series when the range of tau is smaller than that of the time series
-        ts_cut = ts[(np.min(tau) <= ts) & (ts <= np.max(tau))]
-        ys_cut = ys[(np.min(tau) <= ts) & (ts <= np.max(tau))]
+    '''
 
-        freqs = self.make_freq_vector(ts_cut, method = 'nfft')
+    def __init__(self, nproc=None):
+        '''
+        Args:
+            nproc (int): the default number of worker processes; if None, the number of CPUs
 
-        return ys_cut, ts_cut, freqs, tau
+        '''
+        self.nproc = nproc
+        self.pool = None
+        self.pinned = False
 
-    def cross_wt(self, coeff1, coeff2):
-        ''' Return the cross wavelet transform.
+    def start(self, nproc=None, warmup=True):
+        ''' Start the workers.
 
         Args:
-            coeff1, coeff2 (array): the two sets of wavelet transform coefficients **in the form of a1 + a2*1j**
-            freqs (array): vector of frequency
-            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            nproc (int): the number of worker processes; if None, the default one
+            warmup (bool): if True, have every worker import the modules and run a small transform,
+                so that the first real task does not pay for it
 
         Returns:
-            xw_amplitude (array): the cross wavelet amplitude
-            xw_phase (array): the cross wavelet phase
+            self (Executor): the started executor
 
-        References:
-            1.Grinsted, A., Moore, J. C. & Jevrejeva, S. Application of the cross wavelet transform and
-                wavelet coherence to geophysical time series. Nonlin. Processes Geophys. 11, 561–566 (2004).
+        '''
+        if nproc is None:
+            nproc = self.nproc if self.nproc is not None else multiprocessing.cpu_count()
+
+        if self.pool is None or nproc != self.nproc:
+            self.shutdown()
+
+            # the workers inherit the resource tracker of this process, so the shared memory blocks
+            # of `WaveletAnalysis.wwz_shm_map()` are tracked once
+            resource_tracker.ensure_running()
+            self.pool = Pool(nproc, id='pyleoclim_executor')
+            self.nproc = nproc
 
+            if warmup:
+                self.pool.map(executor_warmup, range(nproc))
+
+        self.pinned = True
+
+        return self
+
+    def shutdown(self):
+        ''' Stop the workers; a later call starts them again.
         '''
-        xwt = coeff1 * np.conj(coeff2)
-        xw_amplitude = np.sqrt(xwt.real**2 + xwt.imag**2)
-        xw_phase = np.arctan2(xwt.imag, xwt.real)
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool.clear()
+            self.pool = None
 
-        return xwt, xw_amplitude, xw_phase
+        self.pinned = False
 
-    def wavelet_coherence(self, coeff1, coeff2, freqs, tau, smooth_factor=0.25):
-        ''' Return the cross wavelet coherence.
+    def get_pool(self, nproc=None):
+        ''' Return the running pool, starting it if needed.
 
         Args:
-            coeff1, coeff2 (array): the two sets of wavelet transform coefficients **in the form of a1 + a2*1j**
-            freqs (array): vector of frequency.
-            tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
+            nproc (int): the number of worker processes wanted by the caller
 
         Returns:
-            xw_coherence (array): the cross wavelet coherence
-
-        References:
-            1. Grinsted, A., Moore, J. C. & Jevrejeva, S. Application of the cross wavelet transform and
-                wavelet coherence to geophysical time series. Nonlin. Processes Geophys. 11, 561–566 (2004).
-            2. Matlab code by Grinsted (https://github.com/grinsted/wavelet-coherence)
-            3. Python code by Sebastian Krieger (https://github.com/regeirk/pycwt)
+            pool (pathos.multiprocessing.ProcessingPool): the pool
 
         '''
-        def rect(length, normalize=False):
-            """ Rectangular function adapted from https://github.com/regeirk/pycwt/blob/master/pycwt/helpers.py
+        if self.pool is None or (not self.pinned and nproc is not None and nproc != self.nproc):
+            self.start(nproc, warmup=False)
+            self.pinned = False
 
-            Args:
-                length (int): length of the rectangular function
-                normalize (bool): normalize or not
+        return self.pool
 
-            Returns:
-                rect (array): the (normalized) rectangular function
+    def map(self, func, *iterables, nproc=None):
+        ''' Apply `func` to the items of `iterables` with the workers, see `pathos.multiprocessing.ProcessingPool.map()`.
+        '''
+        return self.get_pool(nproc).map(func, *iterables)
 
-            """
-            rect = np.zeros(length)
-            rect[0] = rect[-1] = 0.5
-            rect[1:-1] = 1
+    def __enter__(self):
+        return self
 
-            if normalize:
-                rect /= rect.sum()
+    def __exit__(self, *exc):
+        self.shutdown()
 
-            return rect
 
-        def Smoothing(coeff, snorm, dj, smooth_factor=smooth_factor):
-            """ Soothing function adapted from https://github.com/regeirk/pycwt/blob/master/pycwt/helpers.py
+def executor_warmup(i):
+    ''' Import the modules and run a small transform in a worker of `Executor`.
+    '''
+    wa = WaveletAnalysis()
+    ts = np.arange(16.)
+    wa.wwz_blocks(wa.kirchner_cells, ts, np.sin(ts), ts[::4], np.array([0.5, 1.]), 1/(8*np.pi**2), 3)
 
-            Args:
-                coeff (array): the wavelet coefficients get from wavlet transform **in the form of a1 + a2*1j**
-                snorm (array): normalized scales
-                dj (float): it satisfies the equation [ Sj = S0 * 2**(j*dj) ]
+    return os.getpid()
 
-            Returns:
-                rect (array): the (normalized) rectangular function
 
-            """
-            def fft_kwargs(signal, **kwargs):
-                return {'n': np.int(2 ** np.ceil(np.log2(len(signal))))}
+executor = Executor()
+atexit.register(executor.shutdown)
 
-            W = coeff.transpose()
-            m, n = np.shape(W)
 
-            # Smooth in time
-            k = 2 * np.pi * fft.fftfreq(fft_kwargs(W[0, :])['n'])
-            k2 = k ** 2
-            # Notes by Smoothing by Gaussian window (absolute value of wavelet function)
-            # using the convolution theorem: multiplication by Gaussian curve in
-            # Fourier domain for each scale, outer product of scale and frequency
-            F = np.exp(-smooth_factor * (snorm[:, np.newaxis] ** 2) * k2)  # Outer product
-            smooth = fft.ifft(F * fft.fft(W, axis=1, **fft_kwargs(W[0, :])),
-                              axis=1,  # Along Fourier frequencies
-                              **fft_kwargs(W[0, :], overwrite_x=True))
-            T = smooth[:, :n]  # Remove possibly padded region due to FFT
-            if np.isreal(W).all():
-                T = T.real
+class ResultCache(object):
+    ''' A cache of the results of `wwz()`, `wwz_psd()` and `xwc()`, for reruns on identical inputs.
 
-            # Smooth in scale
-            wsize = 0.6 / dj * 2
-            win = rect(np.int(np.round(wsize)), normalize=True)
-            T = signal.convolve2d(T, win[:, np.newaxis], 'same')
-            S = T.transpose()
+    The results are stored under a hash of all the inputs that change them: the data, the time axes, `tau`, `freqs`,
+    `c`, `Neff`, the method, the preprocessing, `nMC`, `seed`, etc.; the options that only change the way they are
+    computed, such as `nproc`, are not part of the key. There are two tiers: the results most recently used are kept
+    in memory, and all the results are written as .npz files to `cache_dir`, if set, so that they survive the session.
+    Each tier has a budget in bytes and drops its least recently used results when it is exceeded.
 
-            return S
+    The cache is disabled by default; use the module-level instance `result_cache`. With `nMC` > 0 and `seed=None`,
+    a hit returns the AR1 quantiles of the call that was cached, instead of new random ones.
 
-        xwt = coeff1 * np.conj(coeff2)
-        power1 = np.abs(coeff1)**2
-        power2 = np.abs(coeff2)**2
+    Examples:
+        >>> Spectral.result_cache.enable(cache_dir='./wwz_cache', max_bytes=2**32)
+        >>> res = Spectral.wwz(ys, ts, nMC=200, seed=2018)  # computed
+        >>> res = Spectral.wwz(ys, ts, nMC=200, seed=2018)  # read from the cache
+        >>> Spectral.result_cache.stats()
+        {'hits': 1, 'memory_hits': 1, 'disk_hits': 0, 'misses': 1, ...}
 
-        scales = 1/freqs  # `scales` here is the `Period` axis in the wavelet plot
-        dt = np.median(np.diff(tau))
-        snorm = scales / dt  # normalized scales
+    '''
 
-        # with WWZ method, we don't have a constant dj, so we will just take the average over the whole scale range
-        N = np.size(scales)
-        s0 = scales[-1]
-        sN = scales[0]
-        dj = np.log2(sN/s0) / N
+    def __init__(self, cache_dir=None, max_bytes=2**30, max_memory_bytes=2**28):
+        '''
+        Args:
+            cache_dir (str): the directory of the disk tier; if None, only the memory tier is used
+            max_bytes (int): the budget of the disk tier, in bytes
+            max_memory_bytes (int): the budget of the memory tier, in bytes
 
-        S12 = Smoothing(xwt/scales, snorm, dj)
-        S1 = Smoothing(power1/scales, snorm, dj)
-        S2 = Smoothing(power2/scales, snorm, dj)
-        xw_coherence = np.abs(S12)**2 / (S1*S2)
-        wcs = S12 / (np.sqrt(S1)*np.sqrt(S2))
-        xw_phase = np.angle(wcs)
+        '''
+        self.enabled = False
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.reset_stats()
 
-        return xw_coherence, xw_phase
+    def enable(self, cache_dir=None, max_bytes=None, max_memory_bytes=None):
+        ''' Enable the cache.
 
-    def reconstruct_ts(self, coeff, freqs, tau, t, len_bd=0):
-        ''' Reconstruct the normalized time series from the wavelet coefficients.
-        
         Args:
-            coeff (array): the coefficients of the corresponding basis functions (a0, a1, a2)
-            freqs (array): vector of frequency of the basis functions
-            tau (array): the evenly-spaced time points of the basis functions
-            t (array): the specified evenly-spaced time points of the reconstructed time series
-            len_bd (int): the number of the ghost grids want to creat on each boundary
+            cache_dir (str): the directory of the disk tier; if None, the current one
+            max_bytes (int): the budget of the disk tier, in bytes; if None, the current one
+            max_memory_bytes (int): the budget of the memory tier, in bytes; if None, the current one
 
         Returns:
-            rec_ts (array): the reconstructed normalized time series
-            t (array): the evenly-spaced time points of the reconstructed time series
+            self (ResultCache): the enabled cache
+
         '''
-        omega = 2*np.pi*freqs
-        nf = np.size(freqs)
+        if cache_dir is not None:
+            self.cache_dir = cache_dir
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if max_memory_bytes is not None:
+            self.max_memory_bytes = max_memory_bytes
 
-        dt = np.median(np.diff(t))
-        if len_bd > 0:
-            t_left_bd = np.linspace(t[0]-dt*len_bd, t[0]-dt, len_bd)
-            t_right_bd = np.linspace(t[-1]+dt, t[-1]+dt*len_bd, len_bd)
-            t = np.concatenate((t_left_bd, t, t_right_bd))
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
 
-        ntau = np.size(tau)
-        a_0, a_1, a_2 = coeff
+        self.enabled = True
+        self.evict()
 
-        rec_ts = np.zeros(np.size(t))
-        for k in range(nf):
-            for j in range(ntau):
-                if np.isnan(a_0[j, k]) or np.isnan(a_1[j, k]) or np.isnan(a_1[j, k]):
-                    continue
-                else:
-                    dz = omega[k] * (t - tau[j])
-                    phi_1 = np.cos(dz)
-                    phi_2 = np.sin(dz)
+        return self
 
-                    rec_ts += (a_0[j, k] + a_1[j, k]*phi_1 + a_2[j, k]*phi_2)
+    def disable(self):
+        ''' Disable the cache; the stored results are kept for a later `enable()`.
+        '''
+        self.enabled = False
 
-        rec_ts = self.preprocess(rec_ts, t, detrend=False, gaussianize=False, standardize=True)
+    def clear(self):
+        ''' Remove all the results, from memory and from `cache_dir`.
+        '''
+        self.memory.clear()
+        self.memory_bytes = 0
+        for path, _, _ in self.disk_entries():
+            os.remove(path)
 
-        return rec_ts, t
+    def reset_stats(self):
+        ''' Reset the hit and miss counters.
+        '''
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
 
+    def stats(self):
+        ''' Return the statistics of the cache.
 
-class AliasFilter(object):
-    '''Performing anti-alias filter on a psd @author: fzhu
-    '''
+        Returns:
+            stats (dict): the number of hits, in memory and on disk, of misses and of evicted results, the hit rate,
+                and the number and size in bytes of the results of each tier
+
+        '''
+        disk = self.disk_entries()
+        hits = self.memory_hits + self.disk_hits
+        calls = hits + self.misses
+
+        stats = {'hits': hits, 'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                 'hit_rate': hits/calls if calls > 0 else np.nan, 'evictions': self.evictions,
+                 'memory_items': len(self.memory), 'memory_bytes': self.memory_bytes,
+                 'disk_items': len(disk), 'disk_bytes': int(np.sum([nbytes for _, nbytes, _ in disk]))}
+
+        return stats
+
+    def make_key(self, name, args, ignore=[]):
+        ''' Return the hash of the inputs of a call.
 
-    def alias_filter(self, freq, pwr, fs, fc, f_limit, avgs):
-        ''' anti_alias filter
-        
         Args:
-            freq (array): vector of frequencies in power spectrum
-            pwr (array): vector of spectral power corresponding to frequencies "freq"
-            fs (float): sampling frequency
-            fc (float): corner frequency for 1/f^2 steepening of power spectrum
-            f_limit (float): lower frequency limit for estimating misfit of model-plus-alias spectrum vs. measured power
-            avgs (int): flag for whether spectrum is derived from instantaneous point measurements (avgs<>1)
-                        OR from measurements averaged over each sampling interval (avgs==1)
+            name (str): the name of the function
+            args (dict): the arguments of the call, arrays, lists, tuples, scalars or strings
+            ignore (list): the names of the arguments that do not change the results
 
         Returns:
-            alpha (float): best-fit exponent of power-law model
-            filtered_pwr (array): vector of alias-filtered spectral power
-            model_pwr (array): vector of modeled spectral power
-            aliased_pwr (array): vector of modeled spectral power, plus aliases
+            key (str): the hexadecimal SHA-1 hash
 
-        References:
-            1. Kirchner, J. W. Aliasing in 1/f(alpha) noise spectra: origins, consequences, and remedies.
-                    Phys Rev E Stat Nonlin Soft Matter Phys 71, 66110 (2005).
+        '''
+        h = hashlib.sha1(name.encode())
+
+        def update(x):
+            if isinstance(x, np.ndarray) or isinstance(x, np.generic):
+                x = np.ascontiguousarray(x)
+                h.update('{}{}'.format(x.dtype.str, x.shape).encode())
+                h.update(x.view(np.uint8).ravel() if x.dtype != object else repr(x.tolist()).encode())
+            elif isinstance(x, (list, tuple)):
+                h.update('{}{}'.format(type(x).__name__, len(x)).encode())
+                for item in x:
+                    update(item)
+            else:
+                h.update(repr(x).encode())
+
+        for arg_name in sorted(set(args) - set(ignore)):
+            h.update(arg_name.encode())
+            update(args[arg_name])
 
+        return h.hexdigest()
+
+    def get(self, key):
+        ''' Return the results stored under `key`, or None on a miss.
         '''
-        log_pwr = np.log(pwr)
-        freq_mask = (freq > f_limit)*1  # convert True & False to 1 & 0
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.copy_results(self.memory[key][0])
+
+        path = self.disk_path(key)
+        if path is not None and os.path.exists(path):
+            with np.load(path) as f:
+                res = self.unpack_results(f)
+            # mark the file as recently used
+            os.utime(path)
+            self.disk_hits += 1
+            self.put_memory(key, res)
+            return self.copy_results(res)
+
+        self.misses += 1
+
+        return None
+
+    def put(self, key, res):
+        ''' Store the results `res` under `key`, in both tiers.
+        '''
+        res = self.copy_results(res)
+        self.put_memory(key, res)
+
+        path = self.disk_path(key)
+        if path is not None:
+            # write to a temporary file first, so that an interrupted write never leaves a corrupted entry
+            tmp_path = path[:-len('.npz')] + '.{}.tmp.npz'.format(os.getpid())
+            np.savez(tmp_path, **self.pack_results(res))
+            os.replace(tmp_path, path)
+            self.evict()
+
+    def put_memory(self, key, res):
+        nbytes = self.results_nbytes(res)
+        if nbytes > self.max_memory_bytes:
+            return
+
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)[1]
+
+        self.memory[key] = (res, nbytes)
+        self.memory_bytes += nbytes
+        self.evict()
+
+    def evict(self):
+        ''' Drop the least recently used results of each tier until it fits in its budget.
+        '''
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 0:
+            _, (_, nbytes) = self.memory.popitem(last=False)
+            self.memory_bytes -= nbytes
+            self.evictions += 1
+
+        disk = self.disk_entries()
+        disk_bytes = np.sum([nbytes for _, nbytes, _ in disk])
+        for path, nbytes, _ in sorted(disk, key=lambda entry: entry[2]):
+            if disk_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            disk_bytes -= nbytes
+            self.evictions += 1
+
+    def disk_path(self, key):
+        if self.cache_dir is None:
+            return None
+
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def disk_entries(self):
+        # the (path, size, time of last use) of the results on disk
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.npz') and not file_name.endswith('.tmp.npz'):
+                st = os.stat(os.path.join(self.cache_dir, file_name))
+                entries.append((os.path.join(self.cache_dir, file_name), st.st_size, st.st_mtime))
+
+        return entries
+
+    def results_nbytes(self, res):
+        nbytes = 0
+        for x in res:
+            for item in (x if isinstance(x, tuple) else (x,)):
+                nbytes += np.asarray(item).nbytes if item is not None else 0
+
+        return nbytes
+
+    def copy_results(self, res):
+        # in-memory copies, also of the memory-mapped outputs, so that the cached results cannot be modified in place
+        def copy(x):
+            if isinstance(x, np.ndarray):
+                return np.array(x)
+            elif isinstance(x, tuple):
+                return tuple(copy(item) for item in x)
+            return x
+
+        return type(res)(*[copy(x) for x in res])
+
+    def pack_results(self, res):
+        # the fields of a namedtuple as a dict of arrays for np.savez(); None and tuples of arrays are flagged
+        packed = {'__fields__': np.array(res._fields)}
+        for field, x in zip(res._fields, res):
+            if x is None:
+                packed['__none__' + field] = np.array(0)
+            elif isinstance(x, tuple):
+                for i, item in enumerate(x):
+                    packed['__tuple__{}__{}'.format(i, field)] = np.asarray(item)
+            else:
+                packed[field] = np.asarray(x)
+
+        return packed
+
+    def unpack_results(self, packed):
+        fields = [str(field) for field in packed['__fields__']]
+        values = []
+        for field in fields:
+            if '__none__' + field in packed.files:
+                values.append(None)
+            elif field in packed.files:
+                x = packed[field]
+                values.append(x.item() if x.ndim == 0 else x)
+            else:
+                n = len([name for name in packed.files if name.startswith('__tuple__') and name.endswith('__' + field)])
+                values.append(tuple(packed['__tuple__{}__{}'.format(i, field)] for i in range(n)))
 
-        alpha_upper_bound = 5
+        Results = collections.namedtuple('Results', fields)
 
-        if avgs == 1:
-            alpha_lower_bound = -2.9  # if measurements are time-averaged
-        else:
-            alpha_lower_bound = -0.9  # if measurements are point samples
+        return Results(*values)
 
-        alpha = optimize.fminbound(self.misfit, alpha_lower_bound, alpha_upper_bound,
-                                   args=(fs, fc, freq, log_pwr, freq_mask, avgs), xtol=1e-4)
 
-        model_pwr, aliased_pwr, RMSE = self.alias(alpha, fs, fc, freq, log_pwr, freq_mask, avgs)
-        filtered_pwr = pwr * model_pwr / aliased_pwr
+result_cache = ResultCache()
 
-        return alpha, filtered_pwr, model_pwr, aliased_pwr
 
-    def misfit(self, alpha, fs, fc, freq, log_pwr, freq_mask, avgs):
-        model, aliased_pwr, RMSE = self.alias(alpha, fs, fc, freq, log_pwr, freq_mask, avgs)
-        return RMSE
+def wwz_shm_tile(task):
+    ''' Evaluate a tile of frequencies for `WaveletAnalysis.wwz_shm_map()` in a worker process.
 
-    def alias(self, alpha, fs, fc, freq, log_pwr, freq_mask, avgs):
-        model_pwr = self.model(alpha, fs, fc, freq, avgs)
-        aliased_pwr = np.copy(model_pwr)
-        if avgs == 1:
-            aliased_pwr = aliased_pwr * np.sinc(freq/fs) ** 2
+    Args:
+        task (tuple): the names and shapes of the shared memory blocks, the name of the kernel, the decay
+            constant, the threshold of the effective number of points, and the slice of frequencies
+
+    '''
+    specs, cells_name, c, Neff, start, stop = task
+
+    # the blocks belong to the parent process, which unlinks them; before Python 3.13 they are registered
+    # again here, with the resource tracker the workers share with the parent (see `Executor.start()`)
+    if sys.version_info >= (3, 13):
+        shms = {key: shared_memory.SharedMemory(name=name, track=False) for key, (name, shape) in specs.items()}
+    else:
+        shms = {key: shared_memory.SharedMemory(name=name) for key, (name, shape) in specs.items()}
 
-        for k in range(1, 11):
-            alias_minus = self.model(alpha, fs, fc, k*fs-freq, avgs)
-            if avgs == 1:
-                alias_minus = alias_minus * np.sinc((k*fs-freq)/fs) ** 2
+    try:
+        arrays = {key: np.ndarray(specs[key][1], dtype=float, buffer=shm.buf) for key, shm in shms.items()}
 
-            aliased_pwr = aliased_pwr + alias_minus
+        wa = WaveletAnalysis()
+        cells_func = getattr(wa, cells_name)
+        res = wa.wwz_blocks(cells_func, arrays['ts'], arrays['pd_ys'], arrays['tau'],
+                            arrays['omega'][start:stop], c, Neff, keep=arrays['keep'][:, start:stop] > 0)
 
-            alias_plus = self.model(alpha, fs, fc, k*fs+freq, avgs)  # notice the + in (k*fs+freq)
-            if avgs == 1:
-                alias_plus = alias_plus * np.sinc((k*fs+freq)/fs) ** 2
+        for i in range(4):
+            arrays['out'][i, :, start:stop] = res[i]
 
-            aliased_pwr = aliased_pwr + alias_plus
+        del arrays, res
 
-        if avgs == 1:
-            beta = alpha + 3
-            const = 1 / (2*np.pi**2*beta/fs)
-        else:
-            beta = alpha + 1
-            const = 1 / (beta*fs)
+    finally:
+        for shm in shms.values():
+            shm.close()
 
-        zo_minus = (11*fs-freq)**(-beta)
-        dz_minus = zo_minus / 20
 
-        for j in range(1, 21):
-            aliased_pwr = aliased_pwr + const / ((j*dz_minus)**(2/beta) + 1/fc**2)*dz_minus
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def kirchner_numba_grid(tau, omega, c, Neff, ts, pd_ys, lo, hi):
+        ''' The kernel of `WaveletAnalysis.kirchner_numba()` over the (tau, omega) grid.
 
-        zo_plus = (11*fs+freq)**(-beta)
-        dz_plus = zo_plus / 20
+        The weighted sums of `kirchner_basic()` are accumulated in a single pass over the time series,
+        the shifted basis functions being expanded with the angle-addition formulas.
+        The sums of the cell (j, k) run over the points lo[j, k] to hi[j, k]-1, and the cell is skipped if empty.
+        '''
+        nt = tau.size
+        nf = omega.size
 
-        for j in range(1, 21):
-            aliased_pwr = aliased_pwr + const / ((j*dz_plus)**(2/beta) + 1/fc**2)*dz_plus
+        Neffs = np.empty((nt, nf))
+        a0 = np.empty((nt, nf))
+        a1 = np.empty((nt, nf))
+        a2 = np.empty((nt, nf))
 
-        log_aliased = np.log(aliased_pwr)
+        for k in numba.prange(nf):
+            sin_basis = np.sin(omega[k]*ts)
+            cos_basis = np.cos(omega[k]*ts)
 
-        prefactor = np.sum((log_pwr - log_aliased) * freq_mask) / np.sum(freq_mask)
+            for j in range(nt):
+                if hi[j, k] <= lo[j, k]:
+                    Neffs[j, k] = 0.  # a pruned cell
+                    a0[j, k] = np.nan
+                    a1[j, k] = np.nan
+                    a2[j, k] = np.nan
+                    continue
 
-        log_aliased = log_aliased + prefactor
-        aliased_pwr = aliased_pwr * np.exp(prefactor)
-        model_pwr = model_pwr * np.exp(prefactor)
+                sum_w = 0.
+                sum_w2 = 0.
+                sin_one = 0.
+                cos_one = 0.
+                sin_cos = 0.
+                sin_sin = 0.
+                cos_cos = 0.
+                ys_one = 0.
+                ys_sin = 0.
+                ys_cos = 0.
+
+                for i in range(lo[j, k], hi[j, k]):
+                    dz = omega[k] * (ts[i] - tau[j])
+                    w = np.exp(-c*dz**2)
+
+                    sum_w += w
+                    sum_w2 += w*w
+                    sin_one += w*sin_basis[i]
+                    cos_one += w*cos_basis[i]
+                    sin_cos += w*sin_basis[i]*cos_basis[i]
+                    sin_sin += w*sin_basis[i]*sin_basis[i]
+                    cos_cos += w*cos_basis[i]*cos_basis[i]
+                    ys_one += w*pd_ys[i]
+                    ys_sin += w*pd_ys[i]*sin_basis[i]
+                    ys_cos += w*pd_ys[i]*cos_basis[i]
+
+                Neffs[j, k] = sum_w**2 / sum_w2
 
-        RMSE = np.sqrt(np.sum((log_aliased-log_pwr)*(log_aliased-log_pwr)*freq_mask)) / np.sum(freq_mask)
+                if Neffs[j, k] <= Neff:
+                    a0[j, k] = np.nan  # the coefficients cannot be estimated reliably when Neff_loc <= Neff
+                    a1[j, k] = np.nan
+                    a2[j, k] = np.nan
+                else:
+                    sin_one /= sum_w
+                    cos_one /= sum_w
+                    sin_cos /= sum_w
+                    sin_sin /= sum_w
+                    cos_cos /= sum_w
+                    ys_one /= sum_w
+                    ys_sin /= sum_w
+                    ys_cos /= sum_w
+
+                    numerator = 2*(sin_cos - sin_one*cos_one)
+                    denominator = (cos_cos - cos_one**2) - (sin_sin - sin_one**2)
+                    time_shift = np.arctan2(numerator, denominator) / (2*omega[k])  # Eq. (S5)
 
-        return model_pwr, aliased_pwr, RMSE
+                    cos_ts = np.cos(omega[k]*time_shift)
+                    sin_ts = np.sin(omega[k]*time_shift)
+                    sin_tau_center = np.sin(omega[k]*(time_shift - tau[j]))
+                    cos_tau_center = np.cos(omega[k]*(time_shift - tau[j]))
 
-    def model(self, alpha, fs, fc, freq, avgs):
-        spectr = freq**(-alpha) / (1 + (freq/fc)**2)
+                    ys_cos_shift = ys_cos*cos_ts + ys_sin*sin_ts
+                    ys_sin_shift = ys_sin*cos_ts - ys_cos*sin_ts
+                    cos_shift_one = cos_one*cos_ts + sin_one*sin_ts
+                    sin_shift_one = sin_one*cos_ts - cos_one*sin_ts
 
-        return spectr
+                    A = 2*(ys_cos_shift - ys_one*cos_shift_one)
+                    B = 2*(ys_sin_shift - ys_one*sin_shift_one)
 
+                    a0[j, k] = ys_one
+                    a1[j, k] = cos_tau_center*A - sin_tau_center*B  # Eq. (S6)
+                    a2[j, k] = sin_tau_center*A + cos_tau_center*B  # Eq. (S7)
 
-class Filter(object):
-    """Group various Filters under a class
-    """
-    @staticmethod
-    def savitzky_golay(y, window_size, order, deriv=0, rate=1):
-        """ Smooth (and optionally differentiate) data with a Savitzky-Golay filter.
+        return Neffs, a0, a1, a2
 
-        The Savitzky-Golay filter removes high frequency noise from data.
-        It has the advantage of preserving the original shape and
-        features of the signal better than other types of filtering
-        approaches, such as moving averages techniques.
+    @numba.njit(parallel=True, cache=True)
+    def wwz_numba_grid(tau, omega, c, Neff, ts, pd_ys, lo, hi):
+        ''' The kernel of `WaveletAnalysis.wwz_numba()` over the (tau, omega) grid.
 
-        The Savitzky-Golay is a type of low-pass filter, particularly
-        suited for smoothing noisy data. The main idea behind this
-        approach is to make for each point a least-square fit with a
-        polynomial of high order over a odd-sized window centered at
-        the point.
+        The sums of the cell (j, k) run over the points lo[j, k] to hi[j, k]-1, and the cell is skipped if empty.
+        '''
+        nt = tau.size
+        nf = omega.size
 
-        Args:
-            y (array): the values of the time history of the signal.
-            window_size (int) : the length of the window. Must be an odd integer number.
-            order (int) : the order of the polynomial used in the filtering. Must be less then `window_size` - 1.
-            deriv (int): the order of the derivative to compute (default = 0 means only smoothing)
+        Neffs = np.empty((nt, nf))
+        ywave_1 = np.empty((nt, nf))
+        ywave_2 = np.empty((nt, nf))
+        ywave_3 = np.empty((nt, nf))
 
-        Returns:
+        for k in numba.prange(nf):
+            sin_basis = np.sin(omega[k]*ts)
+            cos_basis = np.cos(omega[k]*ts)
+            S = np.zeros((3, 3))
 
-            ys - ndarray of shape (N), the smoothed signal (or it's n-th derivative).
+            for j in range(nt):
+                if hi[j, k] <= lo[j, k]:
+                    Neffs[j, k] = 0.  # a pruned cell
+                    ywave_1[j, k] = np.nan
+                    ywave_2[j, k] = np.nan
+                    ywave_3[j, k] = np.nan
+                    continue
 
-        Reference:
+                cos_tau = np.cos(omega[k]*tau[j])
+                sin_tau = np.sin(omega[k]*tau[j])
+
+                sum_w = 0.
+                sum_w2 = 0.
+                w_phi2 = 0.
+                w_phi3 = 0.
+                w_phi2_phi2 = 0.
+                w_phi3_phi3 = 0.
+                w_phi2_phi3 = 0.
+                weighted_phi1 = 0.
+                weighted_phi2 = 0.
+                weighted_phi3 = 0.
+
+                for i in range(lo[j, k], hi[j, k]):
+                    dz = omega[k] * (ts[i] - tau[j])
+                    w = np.exp(-c*dz**2)
+                    phi2 = cos_basis[i]*cos_tau + sin_basis[i]*sin_tau  # cos(dz)
+                    phi3 = sin_basis[i]*cos_tau - cos_basis[i]*sin_tau  # sin(dz)
+
+                    sum_w += w
+                    sum_w2 += w*w
+                    w_phi2 += w*phi2
+                    w_phi3 += w*phi3
+                    w_phi2_phi2 += w*phi2*phi2
+                    w_phi3_phi3 += w*phi3*phi3
+                    w_phi2_phi3 += w*phi2*phi3
+                    weighted_phi1 += w*pd_ys[i]
+                    weighted_phi2 += w*phi2*pd_ys[i]
+                    weighted_phi3 += w*phi3*pd_ys[i]
+
+                Neffs[j, k] = sum_w**2 / sum_w2
 
-            - A. Savitzky, M. J. E. Golay, Smoothing and Differentiation of
-                Data by Simplified Least Squares Procedures. Analytical
-                Chemistry, 1964, 36 (8), pp 1627-1639.
-            - Numerical Recipes 3rd Edition: The Art of Scientific Computing
-                W.H. Press, S.A. Teukolsky, W.T. Vetterling, B.P. Flannery
-                Cambridge University Press ISBN-13: 9780521880688
-            - SciPy Cookbook: shttps://github.com/scipy/scipy-cookbook/blob/master/ipython/SavitzkyGolay.ipynb
-        """
-        if type(window_size)is not int:
-            sys.exit("window_size should be of type int")
-        if type(order) is not int:
-            sys.exit("order should be of type int")
-        # Check window size and order
-        if window_size % 2 != 1 or window_size < 1:
-            raise TypeError("window_size size must be a positive odd number")
-        if window_size < order + 2:
-            raise TypeError("window_size is too small for the polynomials order")
-        order_range = range(order+1)
-        half_window = (window_size-1) // 2
-        # precompute coefficients
-        b = np.mat([[k**i for i in order_range] for k in range(-half_window, half_window+1)])
-        m = np.linalg.pinv(b).A[deriv] * rate**deriv * factorial(deriv)
-        # pad the signal at the extremes with
-        # values taken from the signal itself
-        firstvals = y[0] - np.abs(y[1:half_window+1][::-1] - y[0])
-        lastvals = y[-1] + np.abs(y[-half_window-1:-1][::-1] - y[-1])
-        y = np.concatenate((firstvals, y, lastvals))
+                if Neffs[j, k] <= Neff:
+                    ywave_1[j, k] = np.nan  # the coefficients cannot be estimated reliably when Neff_loc <= Neff
+                    ywave_2[j, k] = np.nan
+                    ywave_3[j, k] = np.nan
+                else:
+                    S[0, 0] = 1
+                    S[1, 1] = w_phi2_phi2 / sum_w
+                    S[2, 2] = w_phi3_phi3 / sum_w
+                    S[1, 0] = S[0, 1] = w_phi2 / sum_w
+                    S[2, 0] = S[0, 2] = w_phi3 / sum_w
+                    S[2, 1] = S[1, 2] = w_phi2_phi3 / sum_w
 
-        return np.convolve(m[::-1], y, mode='valid')
+                    S_inv = np.linalg.pinv(S)
 
-'''
-Interface for the users below, more checks about the input will be performed here
-'''
+                    weighted_phi1 /= sum_w
+                    weighted_phi2 /= sum_w
+                    weighted_phi3 /= sum_w
+
+                    ywave_1[j, k] = S_inv[0, 0]*weighted_phi1 + S_inv[0, 1]*weighted_phi2 + S_inv[0, 2]*weighted_phi3
+                    ywave_2[j, k] = S_inv[1, 0]*weighted_phi1 + S_inv[1, 1]*weighted_phi2 + S_inv[1, 2]*weighted_phi3
+                    ywave_3[j, k] = S_inv[2, 0]*weighted_phi1 + S_inv[2, 1]*weighted_phi2 + S_inv[2, 2]*weighted_phi3
+
+        return Neffs, ywave_1, ywave_2, ywave_3
 
 
 def ar1_fit(ys, ts=None, detrend= None, params=["default", 4, 0, 1]):
@@ -1574,7 +4116,7 @@ def ar1_fit(ys, ts=None, detrend= None, params=["default", 4, 0, 1]):
     return g
 
 
-def ar1_sim(ys, n, p, ts=None, detrend=False, params=["default", 4, 0, 1]):
+def ar1_sim(ys, n, p, ts=None, detrend=False, params=["default", 4, 0, 1], rng=None):
     ''' Produce p realizations of an AR1 process of length n with lag-1 autocorrelation g calculated from `ys` and `ts`
 
     Args:
@@ -1591,31 +4133,33 @@ def ar1_sim(ys, n, p, ts=None, detrend=False, params=["default", 4, 0, 1]):
             while the second parameter correspond to the order of the filter
             (default is 4). The third parameter is the order of the derivative
             (the default is zero, which means only smoothing.)
+        rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state
 
     Returns:
         red (matrix): n rows by p columns matrix of an AR1 process
 
     '''
-    red = np.empty(shape=(n, p))  # declare array
-
     wa = WaveletAnalysis()
+    wa.assertPositiveInt(n, p)
+
+    if rng is None:
+        rng = np.random
+
     if wa.is_evenly_spaced(ts):
         g = ar1_fit(ys, ts=ts, detrend=detrend, params=params)
         sig = np.std(ys)
 
-        # specify model parameters (statsmodel wants lag0 coefficents as unity)
-        ar = np.r_[1, -g]  # AR model parameter
-        ma = np.r_[1, 0.0]  # MA model parameters
-        sig_n = sig*np.sqrt(1-g**2)  # theoretical noise variance for red to achieve the same variance as ys
+        # theoretical noise variance for red to achieve the same variance as ys
+        sig_n = sig*np.sqrt(1-g**2)
 
-        # simulate AR(1) model for each column
-        for i in np.arange(p):
-            red[:, i] = sm.tsa.arma_generate_sample(ar=ar, ma=ma, nsample=n, burnin=50, sigma=sig_n)
+        # simulate AR(1) model for all the columns at once, discarding the first 50 steps as burn-in
+        burnin = 50
+        noise = rng.standard_normal(size=(n+burnin, p)) * sig_n
+        red = signal.lfilter([1], [1, -g], noise, axis=0)[burnin:]
 
     else:
         tau_est = ar1_fit(ys, ts=ts, detrend=detrend, params=params)
-        for i in np.arange(p):
-            red[:, i] = wa.ar1_model(ts, tau_est, n=n)
+        red = wa.ar1_model_batch(ts, tau_est, n=n, p=p, rng=rng)
 
     if p == 1:
         red = red[:, 0]
@@ -1626,7 +4170,10 @@ def ar1_sim(ys, n, p, ts=None, detrend=False, params=["default", 4, 0, 1]):
 def wwz(ys, ts, tau=None, freqs=None, c=1/(8*np.pi**2), Neff=3, Neff_coi=3,\
         nMC=200, nproc=8, detrend=False, params=['default', 4, 0, 1],\
         gaussianize=False, standardize=True, method='Kirchner_f2py', len_bd=0,\
-        bc_mode='reflect', reflect_type='odd'):
+        bc_mode='reflect', reflect_type='odd', mc_operator=False, weight_tol=None,\
+        seed=None, qs=0.95, streaming=False, mc_batch=50, mc_tol=None, mc_frac=1, mc_conf=0.95,
+        trunc_radius=None, trunc_tol=None, prune=True, dtype=np.float64, tau_chunk=None, out_dir=None,
+        update=None, update_tol=1e-8, nufft_tol=None, cache=True):
     ''' Return the weighted wavelet amplitude (WWA) with phase, AR1_q, and cone of influence, as well as WT coefficients
 
     Args:
@@ -1649,22 +4196,91 @@ def wwz(ys, ts, tau=None, freqs=None, c=1/(8*np.pi**2), Neff=3, Neff_coi=3,\
             (default is 4). The third parameter is the order of the derivative
             (the default is zero, which means only smoothing.)
         method (str): 'Foster' - the original WWZ method;
+                      'Foster_numpy' - the original WWZ method vectorized with NumPy;
+                      'Foster_numba' - the original WWZ method compiled with numba;
+                      'Foster_shm' - the original WWZ method with a shared-memory process pool;
                       'Kirchner' - the method Kirchner adapted from Foster;
-                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py
+                      'Kirchner_numpy' - the method Kirchner adapted from Foster vectorized with NumPy;
+                      'Kirchner_numba' - the method Kirchner adapted from Foster compiled with numba;
+                      'Kirchner_shm' - the method Kirchner adapted from Foster with a shared-memory process pool;
+                      'Kirchner_nufft' - an approximation of the method Kirchner adapted from Foster with non-uniform FFTs,
+                          for dense frequency vectors, with the accuracy `nufft_tol`;
+                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py; falls back to 'Kirchner_numba', then to
+                          'Kirchner_numpy', when the f2py extension is not available;
+                      'auto' - the engine and the number of processes are chosen from the size of the problem,
+                          see `WaveletAnalysis.choose_wwz_method()`
         len_bd (int): the number of the ghost grids want to creat on each boundary
         bc_mode (str): see np.lib.pad()
         reflect_type (str): see np.lib.pad()
+        mc_operator (bool): if True, the linear operator of the WWZ transform is built once with
+            `WaveletAnalysis.make_wwz_operator()` and applied to all the AR1 surrogates as one matrix product
+        weight_tol (float): the relative threshold below which the entries of the operator are dropped;
+            see `WaveletAnalysis.make_wwz_operator()`
+        seed (int): the seed of the random number generator of the AR1 surrogates, for reproducible results;
+            if None, the global `numpy.random` state is used, e.g. as set by `np.random.seed()`
+        qs (float or list): the quantile level(s) of the AR1 simulations returned as `AR1_q`; with a list,
+            `AR1_q` is a stack of significance surfaces, one per level
+        streaming (bool): if True, the AR1 simulations are reduced to `AR1_q` batch by batch with
+            `StreamingQuantiles` instead of being stored as a (nMC, nt, nf) array; the result is the same
+        mc_batch (int): the number of AR1 simulations processed per batch
+        mc_tol (float): if not None, the Monte-Carlo simulations stop early, at the end of the first batch
+            after which the confidence interval of `AR1_q` has a half-width below `mc_tol` relative to `AR1_q`;
+            `nMC` is then the maximum number of simulations
+        mc_frac (float): the fraction of the cells that have to meet `mc_tol` to stop
+        mc_conf (float): the confidence level of the interval of `AR1_q`
+        trunc_radius (float): if not None, the weighted sums of each cell only run over the points within
+            `trunc_radius` periods of tau, found by binary search, so that each cell costs O(window) instead of O(len(ts));
+            only supported by the 'Kirchner_f2py', 'Kirchner_numba' and 'Foster_numba' methods;
+            see `WaveletAnalysis.trunc_windows()`
+        trunc_tol (float): if not None, the weighted sums only run over the points with a weight above `trunc_tol`;
+            an alternative to `trunc_radius`
+        prune (bool): if True, the (tau, freq) cells that are known to be NaNs, above the Nyquist frequency or with
+            too few points nearby, are predicted once with `WaveletAnalysis.make_prune()` and skipped by the engine,
+            for the data and the AR1 surrogates; the results, `Neffs` included, are the same as without pruning
+        dtype (dtype): the floating point precision, e.g. np.float32 for exploratory runs, which halves the memory
+            of the outputs and of the AR1 simulations. The 'Foster_numpy', 'Kirchner_numpy' and 'Kirchner_f2py'
+            methods and the operator of `mc_operator` compute in this precision; the other methods compute in
+            float64 and their outputs are converted.
+        tau_chunk (int): if not None, the time shifts are processed `tau_chunk` at a time, including the AR1
+            simulations, so that the peak memory is that of one chunk; the results are the same
+        out_dir (str): if not None, the outputs of shape (nt, nf) are written chunk by chunk to .npy files in this
+            directory and returned as read-only memory-mapped arrays, loaded lazily, for the records whose results
+            do not fit in memory; if `tau_chunk` is None, the chunks are set to about 2**24 simulated values
+        update (namedtuple): if not None, the results of wwz on a record that `ys` and `ts` are appended to;
+            only the cells whose windows reach the new points are recomputed and the other ones are re-normalized,
+            see wwz_update()
+        update_tol (float): with `update`, the weight of the first new point under which a time shift is kept,
+            see `WaveletAnalysis.prepare_wwz_update()`
+        nufft_tol (float): with the 'Kirchner_nufft' method, its accuracy; see `WaveletAnalysis.kirchner_nufft()`
+        cache (bool): if True and the result cache is enabled, the results are read from and stored in it;
+            see `ResultCache`
 
     Returns:
         wwa (array): the weighted wavelet amplitude.
-        AR1_q (array): AR1 simulations
+        AR1_q (array): the quantile(s) `qs` of the AR1 simulations
         coi (array): cone of influence
         freqs (array): vector of frequency
         tau (array): the evenly-spaced time points, namely the time shift for wavelet analysis
         Neffs (array): the matrix of effective number of points in the time-scale coordinates
         coeff (array): the wavelet transform coefficents
+        nMC (int): the number of Monte-Carlo simulations actually used, the largest over the chunks of `tau_chunk`
+        trunc_err (array): with `trunc_radius` or `trunc_tol`, an upper bound of the relative error of the weighted
+            sums of each cell due to the truncation; None otherwise
+        prune_mask (array): with `prune`, True for the cells that were skipped; None otherwise
+        ys_cut (array): the time series analyzed, with NaNs deleted and truncated to tau
+        ts_cut (array): the time axis of `ys_cut`
 
     '''
+    # the arguments of the call, for the key of the result cache
+    cache_args = dict(locals())
+
+    use_cache = cache and result_cache.enabled and update is None and out_dir is None
+    if use_cache:
+        cache_key = result_cache.make_key('wwz', cache_args, ignore=['nproc', 'tau_chunk', 'out_dir', 'update', 'cache'])
+        res = result_cache.get(cache_key)
+        if res is not None:
+            return res
+
     #  if method == 'Kirchner_f2py':
     #      if not sys.platform.startswith('darwin'):
     #          warnings.warn("WWZ method: the f2py version is only supported on macOS right now; will use python version instead.")
@@ -1673,51 +4289,261 @@ def wwz(ys, ts, tau=None, freqs=None, c=1/(8*np.pi**2), Neff=3, Neff_coi=3,\
     wa = WaveletAnalysis()
     assert isinstance(nMC, int) and nMC >= 0, "nMC should be larger than or equal to 0."
 
-    ys_cut, ts_cut, freqs, tau = wa.prepare_wwz(ys, ts, freqs=freqs, tau=tau,
-                                                len_bd=len_bd, bc_mode=bc_mode, reflect_type=reflect_type)
+    if update is None:
+        ys_cut, ts_cut, freqs, tau = wa.prepare_wwz(ys, ts, freqs=freqs, tau=tau,
+                                                    len_bd=len_bd, bc_mode=bc_mode, reflect_type=reflect_type)
+        n_keep = np.zeros(np.size(freqs), dtype=int)
+    else:
+        assert (update.AR1_q is None) == (nMC < 1), "`nMC` should be the same as for the results of `update`!"
+        assert (update.prune_mask is None) == (not prune), "`prune` should be the same as for the results of `update`!"
+        assert (update.trunc_err is None) == (trunc_radius is None and trunc_tol is None), \
+            "The truncation should be the same as for the results of `update`!"
+        if out_dir is not None and isinstance(update.wwa, np.memmap):
+            assert os.path.dirname(update.wwa.filename) != os.path.abspath(out_dir), \
+                "`out_dir` should differ from the directory of the results of `update`, which are read while writing!"
+
+        ys_cut, ts_cut, freqs, tau, n_keep, scale, shift = wa.prepare_wwz_update(
+            update, ys, ts, c=c, update_tol=update_tol, detrend=detrend, gaussianize=gaussianize,
+            standardize=standardize)
+
+    # the leading time shifts where the results of some of the frequencies are kept
+    n_kept = np.max(n_keep, initial=0)
+
+    if method == 'auto':
+        method, nproc = wa.choose_wwz_method(np.size(ts_cut), np.size(tau)-n_kept, np.size(freqs), nproc=nproc)
 
     wwz_func = wa.get_wwz_func(nproc, method)
-    wwa, phase, Neffs, coeff = wwz_func(ys_cut, ts_cut, freqs, tau, Neff=Neff, c=c, nproc=nproc,
-                                        detrend=detrend, params=params,
-                                        gaussianize=gaussianize, standardize=standardize)
 
-    # Monte-Carlo simulations of AR1 process
+    # the truncation options are only passed to the engines when set, as not all of them support it
+    engine_kwargs = {}
+    if trunc_radius is not None or trunc_tol is not None:
+        assert wwz_func.__name__ in ['kirchner_f2py', 'kirchner_numba', 'wwz_numba'], \
+            "The truncation is only supported by the 'Kirchner_f2py', 'Kirchner_numba' and 'Foster_numba' methods."
+        engine_kwargs = {'trunc_radius': trunc_radius, 'trunc_tol': trunc_tol}
+
+    if nufft_tol is not None:
+        assert wwz_func.__name__ == 'kirchner_nufft', "`nufft_tol` is only supported by the 'Kirchner_nufft' method."
+        engine_kwargs['nufft_tol'] = nufft_tol
+
+    if np.dtype(dtype) != np.float64 and wwz_func.__name__ in ['wwz_numpy', 'kirchner_numpy', 'kirchner_f2py']:
+        engine_kwargs['dtype'] = dtype
+
     nt = np.size(tau)
     nf = np.size(freqs)
 
-    wwa_red = np.ndarray(shape=(nMC, nt, nf))
-    AR1_q = np.ndarray(shape=(nt, nf))
-
     if nMC >= 1:
-        #  tauest = wa.tau_estimation(ys_cut, ts_cut, detrend=detrend, gaussianize=gaussianize, standardize=standardize)
+        # all the AR1 surrogates at once, one per column, shared by all the chunks of tau;
+        # without a seed, they are drawn from the global `numpy.random` state
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        red = np.reshape(ar1_sim(ys_cut, np.size(ts_cut), nMC, ts=ts_cut, rng=rng), (np.size(ts_cut), nMC)).astype(dtype)
+
+    def wwz_tau(tau, freqs=freqs):
+        # the WWZ of the data and the AR1 quantiles on a set of time shifts and frequencies
+        nt = np.size(tau)
+        nf = np.size(freqs)
+        tau_kwargs = dict(engine_kwargs)
+
+        trunc_err = None
+        if trunc_radius is not None or trunc_tol is not None:
+            ts_sorted = np.sort(ts_cut)
+            _, _, trunc_err = wa.trunc_windows(ts_sorted, tau, wa.make_omega(ts_sorted, freqs), c,
+                                               trunc_radius=trunc_radius, trunc_tol=trunc_tol)
+
+        # the cells to skip only depend on the time axis, so they are shared by the AR1 surrogates
+        prune_mask = None
+        if prune:
+            pruned = wa.make_prune(ts_cut, tau, wa.make_omega(ts_cut, freqs), c, Neff)
+            tau_kwargs['prune'] = pruned
+            prune_mask = pruned.mask
+
+        wwa, phase, Neffs, coeff = wwz_func(ys_cut, ts_cut, freqs, tau, Neff=Neff, c=c, nproc=nproc,
+                                            detrend=detrend, params=params,
+                                            gaussianize=gaussianize, standardize=standardize, **tau_kwargs)
+
+        wwa, phase, Neffs = [np.asarray(x, dtype=dtype) for x in (wwa, phase, Neffs)]
+        coeff = tuple(np.asarray(a, dtype=dtype) for a in coeff)
+
+        # Monte-Carlo simulations of AR1 process
+        if nMC >= 1 and mc_operator:
+            op = wa.make_wwz_operator(ts_cut, freqs, tau, c=c, Neff=Neff, method=method, weight_tol=weight_tol,
+                                      dtype=dtype)
+
+        if nMC >= 1 and streaming:
+            sq = StreamingQuantiles((nt, nf), nMC, qs=qs, conf=None if mc_tol is None else mc_conf, dtype=dtype)
+
+        elif nMC >= 1:
+            wwa_red = np.ndarray(shape=(nMC, nt, nf), dtype=dtype)
+
+        nMC_used = 0
+        if nMC >= 1:
+            for i in tqdm(range(0, nMC, mc_batch), desc='Monte-Carlo simulations'):
+                red_batch = red[:, i:i+mc_batch]
+                nMC_used = i + np.shape(red_batch)[1]
+
+                if mc_operator:
+                    wwa_batch, _, _, _ = wa.apply_wwz_operator(op, red_batch, ts_cut, detrend=detrend, params=params,
+                                                               gaussianize=gaussianize, standardize=standardize)
+                else:
+                    wwa_batch = np.stack([wwz_func(r, ts_cut, freqs, tau, c=c, Neff=Neff, nproc=nproc,
+                                                   detrend=detrend, params=params,
+                                                   gaussianize=gaussianize, standardize=standardize, **tau_kwargs)[0]
+                                          for r in red_batch.T])
+
+                if streaming:
+                    sq.update(wwa_batch)
+                else:
+                    wwa_red[i:i+mc_batch] = wwa_batch
+
+                if mc_tol is not None and nMC_used < nMC:
+                    if streaming:
+                        q_lo, q_hi = sq.ci()
+                        q = sq.quantiles()
+                    else:
+                        q_lo, q_hi = wa.ar1_quantile_ci(wwa_red[:nMC_used], qs, conf=mc_conf)
+                        q = wa.ar1_quantiles(wwa_red[:nMC_used], qs)
 
-        for i in tqdm(range(nMC), desc='Monte-Carlo simulations'):
-            #  r = wa.ar1_model(ts_cut, tauest)
-            r = ar1_sim(ys_cut, np.size(ts_cut), 1, ts=ts_cut)
-            wwa_red[i, :, :], _, _, _ = wwz_func(r, ts_cut, freqs, tau, c=c, Neff=Neff, nproc=nproc,
-                                                 detrend=detrend, params=params,
-                                                 gaussianize=gaussianize, standardize=standardize)
+                    if wa.mc_converged(q, q_lo, q_hi, mc_tol, mc_frac=mc_frac):
+                        break
 
-        for j in range(nt):
-            for k in range(nf):
-                AR1_q[j, k] = mquantiles(wwa_red[:, j, k], 0.95)
+            if streaming:
+                AR1_q = sq.quantiles()
+            else:
+                AR1_q = wa.ar1_quantiles(wwa_red[:nMC_used], qs)
+
+            AR1_q = np.asarray(AR1_q, dtype=dtype)
+
+        else:
+            AR1_q = None
+
+        res_tau = {'wwa': wwa, 'phase': phase, 'AR1_q': AR1_q, 'Neffs': Neffs,
+                   'a0': coeff[0], 'a1': coeff[1], 'a2': coeff[2], 'trunc_err': trunc_err, 'prune_mask': prune_mask}
+
+        return res_tau, nMC_used
+
+    def wwz_kept(chunk):
+        # the time shifts of `update` too far from the new points to change, re-normalized to the new standardization
+        res_tau = {'wwa': update.wwa[chunk]*scale, 'phase': update.phase[chunk], 'AR1_q': update.AR1_q,
+                   'Neffs': update.Neffs[chunk], 'a0': update.coeff[0][chunk]*scale + shift,
+                   'a1': update.coeff[1][chunk]*scale, 'a2': update.coeff[2][chunk]*scale,
+                   'trunc_err': update.trunc_err, 'prune_mask': update.prune_mask}
+
+        for name in ['AR1_q', 'trunc_err', 'prune_mask']:
+            if res_tau[name] is not None:
+                res_tau[name] = res_tau[name][..., chunk, :]
+
+        for name, x in res_tau.items():
+            if x is not None:
+                res_tau[name] = np.array(x, dtype=x.dtype if name == 'prune_mask' else dtype)
+
+        # the frequencies whose windows reach the new points on some of these time shifts are recomputed,
+        # the zero frequency included
+        cols = np.flatnonzero(n_keep < chunk.stop)
+        nMC_cols = 0
+        if np.size(cols) > 0:
+            res_cols, nMC_cols = wwz_tau(tau[chunk], freqs=np.asarray(freqs)[cols])
+            for name, x in res_cols.items():
+                if x is not None:
+                    res_tau[name][..., cols] = x
+
+        return res_tau, np.max([update.nMC, nMC_cols])
+
+    if tau_chunk is None and out_dir is None and update is None:
+        res_tau, nMC_used = wwz_tau(tau)
 
     else:
-        AR1_q = None
+        if tau_chunk is None and out_dir is None:
+            tau_chunk = nt
+        elif tau_chunk is None:
+            # about 2**24 values per chunk for the largest array, the AR1 simulations
+            tau_chunk = np.max([2**24 // (nf*np.max([nMC, 1])), 1])
+        wa.assertPositiveInt(int(tau_chunk))
+
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+
+        # the kept time shifts of `update` come first, then the recomputed ones
+        chunks = [slice(start, np.min([start+tau_chunk, n_kept])) for start in range(0, n_kept, tau_chunk)]
+        chunks += [slice(start, start+tau_chunk) for start in range(n_kept, nt, tau_chunk)]
+
+        res_tau = {}
+        nMC_used = 0
+        for chunk in chunks:
+            if chunk.stop <= n_kept:
+                res_chunk, nMC_chunk = wwz_kept(chunk)
+            else:
+                res_chunk, nMC_chunk = wwz_tau(tau[chunk])
+            nMC_used = np.max([nMC_used, nMC_chunk])
+
+            for name, x in res_chunk.items():
+                if x is None:
+                    res_tau[name] = None
+                    continue
+
+                # the axis of tau is the second to last one of all the outputs
+                if name not in res_tau:
+                    shape = np.shape(x)[:-2] + (nt, nf)
+                    if out_dir is None:
+                        res_tau[name] = np.ndarray(shape=shape, dtype=x.dtype)
+                    else:
+                        res_tau[name] = np.lib.format.open_memmap(os.path.join(out_dir, name+'.npy'), mode='w+',
+                                                                  dtype=x.dtype, shape=shape)
+
+                res_tau[name][..., chunk, :] = x
+
+        if out_dir is not None:
+            for name, x in res_tau.items():
+                if x is not None:
+                    x.flush()
+                    res_tau[name] = np.load(os.path.join(out_dir, name+'.npy'), mmap_mode='r')
+
+    coeff = (res_tau['a0'], res_tau['a1'], res_tau['a2'])
 
     # calculate the cone of influence
     coi = wa.make_coi(tau, Neff=Neff_coi)
 
-    Results = collections.namedtuple('Results', ['wwa', 'phase', 'AR1_q', 'coi', 'freqs', 'tau', 'Neffs', 'coeff'])
-    res = Results(wwa=wwa, phase=phase, AR1_q=AR1_q, coi=coi, freqs=freqs, tau=tau, Neffs=Neffs, coeff=coeff)
+    Results = collections.namedtuple('Results', ['wwa', 'phase', 'AR1_q', 'coi', 'freqs', 'tau', 'Neffs', 'coeff', 'nMC',
+                                                 'trunc_err', 'prune_mask', 'ys_cut', 'ts_cut'])
+    res = Results(wwa=res_tau['wwa'], phase=res_tau['phase'], AR1_q=res_tau['AR1_q'], coi=coi, freqs=freqs, tau=tau,
+                  Neffs=res_tau['Neffs'], coeff=coeff, nMC=nMC_used, trunc_err=res_tau['trunc_err'],
+                  prune_mask=res_tau['prune_mask'], ys_cut=ys_cut, ts_cut=ts_cut)
+
+    if use_cache:
+        result_cache.put(cache_key, res)
 
     return res
 
 
+def wwz_update(res, ys, ts, update_tol=1e-8, **kwargs):
+    ''' Return the wwz results of a record extended with newly appended points, reusing the previous results
+
+    At each frequency, only the time shifts whose Gaussian windows touch the new points, and the new time shifts
+    until the end of the record, are recomputed, including their AR1 simulations; the zero frequency, which weights
+    all the points equally, is recomputed everywhere. The other ones are kept and re-normalized to the
+    standardization of the extended record. The same time shifts and frequencies are used, so the results are the
+    same as those of wwz on the whole record, up to `update_tol` and to the AR1 quantiles of the kept time shifts,
+    which are not re-estimated.
+
+    Args:
+        res (namedtuple): the results of wwz on the previous record, computed with len_bd=0
+        ys (array): the new values appended to the record, NaNs will be deleted automatically
+        ts (array): the time points of the new values, after the end of the previous record
+        update_tol (float): the weight of the first new point under which a time shift is kept,
+            see `WaveletAnalysis.prepare_wwz_update()`
+        kwargs: the other arguments of wwz, which should be the same as those used for `res`
+
+    Returns:
+        res (namedtuple): the results of wwz on the extended record, see wwz()
+
+    '''
+    return wwz(ys, ts, update=res, update_tol=update_tol, **kwargs)
+
+
 def wwz_psd(ys, ts, freqs=None, tau=None, c=1e-3, nproc=8, nMC=200,
             detrend=False, params=["default", 4, 0, 1], gaussianize=False, 
             standardize=True, Neff=3, anti_alias=False, avgs=2, 
-            method='Kirchner_f2py'):
+            method='Kirchner_f2py', mc_operator=False, weight_tol=None, seed=None,
+            mc_batch=50, mc_tol=None, mc_frac=1, mc_conf=0.95, trunc_radius=None, trunc_tol=None,
+            dtype=np.float64, direct=False, cache=True):
     ''' Return the psd of a timeseries directly using wwz method.
 
     Args:
@@ -1741,60 +4567,160 @@ def wwz_psd(ys, ts, freqs=None, tau=None, c=1e-3, nproc=8, nMC=200,
         gaussianize (bool): If True, gaussianizes the timeseries
         standardize (bool): If True, standardizes the timeseries
         method (str): 'Foster' - the original WWZ method;
+                      'Foster_numpy' - the original WWZ method vectorized with NumPy;
+                      'Foster_numba' - the original WWZ method compiled with numba;
+                      'Foster_shm' - the original WWZ method with a shared-memory process pool;
                       'Kirchner' - the method Kirchner adapted from Foster;
-                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py
+                      'Kirchner_numpy' - the method Kirchner adapted from Foster vectorized with NumPy;
+                      'Kirchner_numba' - the method Kirchner adapted from Foster compiled with numba;
+                      'Kirchner_shm' - the method Kirchner adapted from Foster with a shared-memory process pool;
+                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py; falls back to 'Kirchner_numba', then to
+                          'Kirchner_numpy', when the f2py extension is not available;
+                      'auto' - the engine and the number of processes are chosen from the size of the problem,
+                          see `WaveletAnalysis.choose_wwz_method()`
         Neff (int):
         anti_alias (bool): If True, uses anti-aliasing
         avgs (int): 
+        mc_operator (bool): if True, the linear operator of the WWZ transform is built once with
+            `WaveletAnalysis.make_wwz_operator()` and applied to all the AR1 surrogates as one matrix product
+        weight_tol (float): the relative threshold below which the entries of the operator are dropped;
+            see `WaveletAnalysis.make_wwz_operator()`
+        seed (int): the seed of the random number generator of the AR1 surrogates, for reproducible results;
+            if None, the global `numpy.random` state is used, e.g. as set by `np.random.seed()`
+        mc_batch (int): the number of AR1 simulations processed per batch
+        mc_tol (float): if not None, the Monte-Carlo simulations stop early, at the end of the first batch
+            after which the confidence interval of `psd_ar1_q95` has a half-width below `mc_tol` relative to
+            `psd_ar1_q95`; `nMC` is then the maximum number of simulations
+        mc_frac (float): the fraction of the frequencies that have to meet `mc_tol` to stop
+        mc_conf (float): the confidence level of the interval of `psd_ar1_q95`
+        trunc_radius (float): the truncation radius of the weighted sums, in periods; see `wwz()`
+        trunc_tol (float): the weight threshold of the truncation of the weighted sums; see `wwz()`
+        dtype (dtype): the floating point precision of the WWZ and of the AR1 simulations; see `wwz()`
+        direct (bool): if True, the psd is accumulated frequency by frequency with `WaveletAnalysis.psd_direct()`,
+            without the (nt, nf) planes of the WWA, and the data and all the AR1 surrogates are processed in one
+            pass over the cells, or in batches of `mc_batch` with `mc_tol`; `method` then only selects the Foster
+            or the Kirchner formulas
+        cache (bool): if True and the result cache is enabled, the results are read from and stored in it;
+            see `ResultCache`
 
     Returns:
         psd (array): power spectral density
         freqs (array): vector of frequency
         psd_ar1_q95 (array): the 95% quantile of the psds of AR1 processes
         psd_ar1 (array): the psds of AR1 processes
+        nMC (int): the number of Monte-Carlo simulations actually used
 
     '''
+    # the arguments of the call, for the key of the result cache
+    cache_args = dict(locals())
+
+    use_cache = cache and result_cache.enabled
+    if use_cache:
+        cache_key = result_cache.make_key('wwz_psd', cache_args, ignore=['nproc', 'cache'])
+        res = result_cache.get(cache_key)
+        if res is not None:
+            return res
+
     wa = WaveletAnalysis()
     ys_cut, ts_cut, freqs, tau = wa.prepare_wwz(ys, ts, freqs=freqs, tau=tau)
 
-    # get wwa but AR1_q is not needed here so set nMC=0
-    #  wwa, _, _, coi, freqs, _, Neffs, _ = wwz(ys_cut, ts_cut, freqs=freqs, tau=tau, c=c, nproc=nproc, nMC=0,
-    res_wwz = wwz(ys_cut, ts_cut, freqs=freqs, tau=tau, c=c, nproc=nproc, nMC=0,
-              detrend=detrend, params=params,
-              gaussianize=gaussianize, standardize=standardize, method=method)
+    if method == 'auto':
+        method, nproc = wa.choose_wwz_method(np.size(ts_cut), np.size(tau), np.size(freqs), nproc=nproc)
 
-    psd = wa.wwa2psd(res_wwz.wwa, ts_cut, res_wwz.Neffs, freqs=res_wwz.freqs, Neff=Neff, anti_alias=anti_alias, avgs=avgs)
-    #  psd[1/freqs > np.max(coi)] = np.nan  # cut off the unreliable part out of the coi
-    #  psd = psd[1/freqs <= np.max(coi)] # cut off the unreliable part out of the coi
-    #  freqs = freqs[1/freqs <= np.max(coi)]
+    if direct:
+        assert trunc_radius is None and trunc_tol is None, "The truncation is not supported with `direct`."
 
-    # Monte-Carlo simulations of AR1 process
     nf = np.size(freqs)
+    psd_ar1 = np.ndarray(shape=(nMC, nf), dtype=dtype)
+
+    if nMC >= 1:
+        # all the AR1 surrogates at once, one per column; without a seed, they are drawn from the global
+        # `numpy.random` state
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        red = np.reshape(ar1_sim(ys_cut, np.size(ts_cut), nMC, ts=ts_cut, rng=rng), (np.size(ts_cut), nMC)).astype(dtype)
+
+    nMC_used = 0
+    if direct and nMC >= 1 and mc_tol is None:
+        # the data and all the AR1 surrogates in one pass over the cells
+        psd_all = wa.psd_direct(np.column_stack((ys_cut, red)), ts_cut, freqs, tau, c=c, Neff=Neff, method=method,
+                                detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize,
+                                anti_alias=anti_alias, avgs=avgs, dtype=dtype)
+        psd = psd_all[0]
+        psd_ar1[:] = psd_all[1:]
+        nMC_used = nMC
+
+    elif direct:
+        psd = wa.psd_direct(ys_cut, ts_cut, freqs, tau, c=c, Neff=Neff, method=method,
+                            detrend=detrend, params=params, gaussianize=gaussianize, standardize=standardize,
+                            anti_alias=anti_alias, avgs=avgs, dtype=dtype)
+
+    else:
+        # get wwa but AR1_q is not needed here so set nMC=0
+        #  wwa, _, _, coi, freqs, _, Neffs, _ = wwz(ys_cut, ts_cut, freqs=freqs, tau=tau, c=c, nproc=nproc, nMC=0,
+        res_wwz = wwz(ys_cut, ts_cut, freqs=freqs, tau=tau, c=c, nproc=nproc, nMC=0,
+                  detrend=detrend, params=params,
+                  gaussianize=gaussianize, standardize=standardize, method=method,
+                  trunc_radius=trunc_radius, trunc_tol=trunc_tol, dtype=dtype, cache=False)
+
+        psd = wa.wwa2psd(res_wwz.wwa, ts_cut, res_wwz.Neffs, freqs=res_wwz.freqs, Neff=Neff, anti_alias=anti_alias, avgs=avgs)
+        #  psd[1/freqs > np.max(coi)] = np.nan  # cut off the unreliable part out of the coi
+        #  psd = psd[1/freqs <= np.max(coi)] # cut off the unreliable part out of the coi
+        #  freqs = freqs[1/freqs <= np.max(coi)]
+
+    # Monte-Carlo simulations of AR1 process
+    if nMC >= 1 and mc_operator and not direct:
+        op = wa.make_wwz_operator(ts_cut, freqs, tau, c=c, Neff=Neff, method=method, weight_tol=weight_tol,
+                                  dtype=dtype)
+
+    if nMC >= 1 and nMC_used < nMC:
+        for i in tqdm(range(0, nMC, mc_batch), desc='Monte-Carlo simulations'):
+            red_batch = red[:, i:i+mc_batch]
+            nMC_used = i + np.shape(red_batch)[1]
+
+            if direct:
+                psd_ar1[i:nMC_used] = wa.psd_direct(red_batch, ts_cut, freqs, tau, c=c, Neff=Neff, method=method,
+                                                    detrend=detrend, params=params, gaussianize=gaussianize,
+                                                    standardize=standardize, anti_alias=anti_alias, avgs=avgs,
+                                                    dtype=dtype)
+
+            elif mc_operator:
+                wwa_red, _, Neffs_red, _ = wa.apply_wwz_operator(op, red_batch, ts_cut, detrend=detrend, params=params,
+                                                                 gaussianize=gaussianize, standardize=standardize)
+                for j in range(i, nMC_used):
+                    psd_ar1[j, :] = wa.wwa2psd(wwa_red[j-i], ts_cut, Neffs_red,
+                                               freqs=freqs, Neff=Neff, anti_alias=anti_alias, avgs=avgs)
+
+            else:
+                for j in range(i, nMC_used):
+                    res_red = wwz(red[:, j], ts_cut, freqs=freqs, tau=tau, c=c, nproc=nproc, nMC=0,
+                                  detrend=detrend, params=params,
+                                  gaussianize=gaussianize, standardize=standardize,
+                                  method=method, trunc_radius=trunc_radius, trunc_tol=trunc_tol, dtype=dtype,
+                                  cache=False)
+                    psd_ar1[j, :] = wa.wwa2psd(res_red.wwa, ts_cut, res_red.Neffs,
+                                               freqs=res_red.freqs, Neff=Neff, anti_alias=anti_alias, avgs=avgs)
+                    #  psd_ar1[j, 1/freqs_red > np.max(coi_red)] = np.nan  # cut off the unreliable part out of the coi
+
+            if mc_tol is not None and nMC_used < nMC:
+                q_lo, q_hi = wa.ar1_quantile_ci(psd_ar1[:nMC_used], 0.95, conf=mc_conf)
+                q = wa.ar1_quantiles(psd_ar1[:nMC_used], 0.95)
 
-    psd_ar1 = np.ndarray(shape=(nMC, nf))
+                if wa.mc_converged(q, q_lo, q_hi, mc_tol, mc_frac=mc_frac):
+                    break
+
+        psd_ar1 = psd_ar1[:nMC_used]
 
     if nMC >= 1:
-        #  tauest = wa.tau_estimation(ys_cut, ts_cut, detrend=detrend)
-
-        for i in tqdm(range(nMC), desc='Monte-Carlo simulations'):
-            #  r = wa.ar1_model(ts_cut, tauest)
-            r = ar1_sim(ys_cut, np.size(ts_cut), 1, ts=ts_cut)
-            res_red = wwz(r, ts_cut, freqs=freqs, tau=tau, c=c, nproc=nproc, nMC=0,
-                                                                     detrend=detrend, params=params,
-                                                                     gaussianize=gaussianize, standardize=standardize,
-                                                                     method=method)
-            psd_ar1[i, :] = wa.wwa2psd(res_red.wwa, ts_cut, res_red.Neffs,
-                                       freqs=res_red.freqs, Neff=Neff, anti_alias=anti_alias, avgs=avgs)
-            #  psd_ar1[i, 1/freqs_red > np.max(coi_red)] = np.nan  # cut off the unreliable part out of the coi
-            #  psd_ar1 = psd_ar1[1/freqs_red <= np.max(coi_red)] # cut off the unreliable part out of the coi
-
-        psd_ar1_q95 = mquantiles(psd_ar1, 0.95, axis=0)[0]
+        psd_ar1_q95 = wa.ar1_quantiles(psd_ar1, 0.95)
 
     else:
         psd_ar1_q95 = None
 
-    Results = collections.namedtuple('Results', ['psd', 'freqs', 'psd_ar1_q95', 'psd_ar1'])
-    res = Results(psd=psd, freqs=freqs, psd_ar1_q95=psd_ar1_q95, psd_ar1=psd_ar1)
+    Results = collections.namedtuple('Results', ['psd', 'freqs', 'psd_ar1_q95', 'psd_ar1', 'nMC'])
+    res = Results(psd=psd, freqs=freqs, psd_ar1_q95=psd_ar1_q95, psd_ar1=psd_ar1, nMC=nMC_used)
+
+    if use_cache:
+        result_cache.put(cache_key, res)
 
     return res
 
@@ -1827,8 +4753,17 @@ def xwt(ys1, ts1, ys2, ts2,
         gaussianize (bool): If True, gaussianizes the timeseries
         standardize (bool): If True, standardizes the timeseries
         method (str): 'Foster' - the original WWZ method;
+                      'Foster_numpy' - the original WWZ method vectorized with NumPy;
+                      'Foster_numba' - the original WWZ method compiled with numba;
+                      'Foster_shm' - the original WWZ method with a shared-memory process pool;
                       'Kirchner' - the method Kirchner adapted from Foster;
-                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py
+                      'Kirchner_numpy' - the method Kirchner adapted from Foster vectorized with NumPy;
+                      'Kirchner_numba' - the method Kirchner adapted from Foster compiled with numba;
+                      'Kirchner_shm' - the method Kirchner adapted from Foster with a shared-memory process pool;
+                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py; falls back to 'Kirchner_numba', then to
+                          'Kirchner_numpy', when the f2py extension is not available;
+                      'auto' - the engine and the number of processes are chosen from the size of the problem,
+                          see `WaveletAnalysis.choose_wwz_method()`
 
     Returns:
         xw_amplitude (array): the cross wavelet amplitude
@@ -1841,11 +4776,15 @@ def xwt(ys1, ts1, ys2, ts2,
     '''
     wa = WaveletAnalysis()
 
-    wwz_func = wa.get_wwz_func(nproc, method)
-
     ys1_cut, ts1_cut, freqs, tau = wa.prepare_wwz(ys1, ts1, freqs=freqs, tau=tau)
     ys2_cut, ts2_cut, freqs, tau = wa.prepare_wwz(ys2, ts2, freqs=freqs, tau=tau)
 
+    if method == 'auto':
+        method, nproc = wa.choose_wwz_method(np.max([np.size(ts1_cut), np.size(ts2_cut)]), np.size(tau), np.size(freqs),
+                                             nproc=nproc)
+
+    wwz_func = wa.get_wwz_func(nproc, method)
+
     _, _, _, coeff1 = wwz_func(ys1_cut, ts1_cut, freqs, tau, Neff=Neff, c=c, nproc=nproc, detrend=detrend,
                                params=params, gaussianize=gaussianize, standardize=standardize)
     _, _, _, coeff2 = wwz_func(ys2_cut, ts2_cut, freqs, tau, Neff=Neff, c=c, nproc=nproc, detrend=detrend,
@@ -1892,7 +4831,9 @@ def xwt(ys1, ts1, ys2, ts2,
 def xwc(ys1, ts1, ys2, ts2, smooth_factor=0.25,
         tau=None, freqs=None, c=1/(8*np.pi**2), Neff=3, nproc=8, detrend=False,
         nMC=200, params=['default', 4, 0, 1],
-        gaussianize=False, standardize=True, method='Kirchner_f2py'):
+        gaussianize=False, standardize=True, method='Kirchner_f2py',
+        mc_operator=False, weight_tol=None, seed=None, qs=0.95, streaming=False, mc_batch=50, dtype=np.float64,
+        cache=True):
     ''' Return the cross-wavelet coherence of two time series.
 
     Args:
@@ -1917,14 +4858,48 @@ def xwc(ys1, ts1, ys2, ts2, smooth_factor=0.25,
         gaussianize (bool): If True, gaussianizes the timeseries
         standardize (bool): If True, standardizes the timeseries
         method (str): 'Foster' - the original WWZ method;
+                      'Foster_numpy' - the original WWZ method vectorized with NumPy;
+                      'Foster_numba' - the original WWZ method compiled with numba;
+                      'Foster_shm' - the original WWZ method with a shared-memory process pool;
                       'Kirchner' - the method Kirchner adapted from Foster;
-                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py
+                      'Kirchner_numpy' - the method Kirchner adapted from Foster vectorized with NumPy;
+                      'Kirchner_numba' - the method Kirchner adapted from Foster compiled with numba;
+                      'Kirchner_shm' - the method Kirchner adapted from Foster with a shared-memory process pool;
+                      'Kirchner_f2py' - the method Kirchner adapted from Foster with f2py; falls back to 'Kirchner_numba', then to
+                          'Kirchner_numpy', when the f2py extension is not available;
+                      'auto' - the engine and the number of processes are chosen from the size of the problem,
+                          see `WaveletAnalysis.choose_wwz_method()`
+        mc_operator (bool): if True, the linear operators of the WWZ transform are built once with
+            `WaveletAnalysis.make_wwz_operator()` and applied to all the AR1 surrogates as one matrix product
+        weight_tol (float): the relative threshold below which the entries of the operators are dropped;
+            see `WaveletAnalysis.make_wwz_operator()`
+        seed (int): the seed of the random number generator of the AR1 surrogates, for reproducible results;
+            if None, the global `numpy.random` state is used, e.g. as set by `np.random.seed()`
+        qs (float or list): the quantile level(s) of the AR1 simulations returned as `AR1_q`; with a list,
+            `AR1_q` is a stack of significance surfaces, one per level
+        streaming (bool): if True, the AR1 simulations are reduced to `AR1_q` batch by batch with
+            `StreamingQuantiles` instead of being stored as a (nMC, nt, nf) array; the result is the same
+        mc_batch (int): the number of AR1 simulations processed per batch
+        dtype (dtype): the floating point precision of the WWZ, of the coherence and of the AR1 simulations;
+            see `wwz()`
+        cache (bool): if True and the result cache is enabled, the results are read from and stored in it;
+            see `ResultCache`
 
     Returns:
         res (dict): contains the cross wavelet coherence, cross-wavelet phase,
             vector of frequency, evenly-spaced time points, AR1 sims, cone of influence
 
     '''
+    # the arguments of the call, for the key of the result cache
+    cache_args = dict(locals())
+
+    use_cache = cache and result_cache.enabled
+    if use_cache:
+        cache_key = result_cache.make_key('xwc', cache_args, ignore=['nproc', 'cache'])
+        res = result_cache.get(cache_key)
+        if res is not None:
+            return res
+
     if (not sys.platform.startswith('darwin')) and (not sys.platform.startswith('linux')) and method == 'Kirchner_f2py':
         warnings.warn("The f2py version of WWZ is only supported on macOS & Linux right now; will use the python version instead.")
         method = 'Kirchner'
@@ -1956,45 +4931,92 @@ def xwc(ys1, ts1, ys2, ts2, smooth_factor=0.25,
     if freqs[0] == 0:
         freqs = freqs[1:] # delete 0 frequency if present
 
+    if method == 'auto':
+        method, nproc = wa.choose_wwz_method(np.max([np.size(ts1_cut), np.size(ts2_cut)]), np.size(tau), np.size(freqs),
+                                             nproc=nproc)
+
     res_wwz1 = wwz(ys1_cut, ts1_cut, tau=tau, freqs=freqs, c=c, Neff=Neff, nMC=0,
                    nproc=nproc, detrend=detrend, params=params,
-                   gaussianize=gaussianize, standardize=standardize, method=method)
+                   gaussianize=gaussianize, standardize=standardize, method=method, dtype=dtype, cache=False)
     res_wwz2 = wwz(ys2_cut, ts2_cut, tau=tau, freqs=freqs, c=c, Neff=Neff, nMC=0,
                    nproc=nproc, detrend=detrend, params=params,
-                   gaussianize=gaussianize, standardize=standardize, method=method)
+                   gaussianize=gaussianize, standardize=standardize, method=method, dtype=dtype, cache=False)
 
     wt_coeff1 = res_wwz1.coeff[1] - res_wwz1.coeff[2]*1j
     wt_coeff2 = res_wwz2.coeff[1] - res_wwz2.coeff[2]*1j
 
+    # wwz moves `tau` onto the time points of each series and cuts its time axis again, so the surrogates are
+    # drawn and transformed on the time axes and time shifts of the coefficients of the data
+    ys1_cut, ts1_cut, tau1 = res_wwz1.ys_cut, res_wwz1.ts_cut, res_wwz1.tau
+    ys2_cut, ts2_cut, tau2 = res_wwz2.ys_cut, res_wwz2.ts_cut, res_wwz2.tau
+
     xw_coherence, xw_phase = wa.wavelet_coherence(wt_coeff1, wt_coeff2, freqs, tau, smooth_factor=smooth_factor)
+    xw_coherence, xw_phase = np.asarray(xw_coherence, dtype=dtype), np.asarray(xw_phase, dtype=dtype)
     xwt, xw_amplitude, _ = wa.cross_wt(wt_coeff1, wt_coeff2)
 
     # Monte-Carlo simulations of AR1 process
     nt = np.size(tau)
     nf = np.size(freqs)
 
-    coherence_red = np.ndarray(shape=(nMC, nt, nf))
-    AR1_q = np.ndarray(shape=(nt, nf))
-
     if nMC >= 1:
+        # all the AR1 surrogates at once, one per column; without a seed, they are drawn from the global
+        # `numpy.random` state
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        red1 = np.reshape(ar1_sim(ys1_cut, np.size(ts1_cut), nMC, ts=ts1_cut, rng=rng), (np.size(ts1_cut), nMC)).astype(dtype)
+        red2 = np.reshape(ar1_sim(ys2_cut, np.size(ts2_cut), nMC, ts=ts2_cut, rng=rng), (np.size(ts2_cut), nMC)).astype(dtype)
 
-        for i in tqdm(range(nMC), desc='Monte-Carlo simulations'):
-            r1 = ar1_sim(ys1_cut, np.size(ts1_cut), 1, ts=ts1_cut)
-            r2 = ar1_sim(ys2_cut, np.size(ts2_cut), 1, ts=ts2_cut)
-            res_wwz_r1 = wwz(r1, ts1_cut, tau=tau, freqs=freqs, c=c, Neff=Neff, nMC=0, nproc=nproc,
-                                                     detrend=detrend, params=params,
-                                                     gaussianize=gaussianize, standardize=standardize)
-            res_wwz_r2 = wwz(r2, ts2_cut, tau=tau, freqs=freqs, c=c, Neff=Neff, nMC=0, nproc=nproc,
-                                                     detrend=detrend, params=params,
-                                                     gaussianize=gaussianize, standardize=standardize)
+    if nMC >= 1 and mc_operator:
+        op1 = wa.make_wwz_operator(ts1_cut, freqs, tau1, c=c, Neff=Neff, method=method, weight_tol=weight_tol,
+                                   dtype=dtype)
+        op2 = wa.make_wwz_operator(ts2_cut, freqs, tau2, c=c, Neff=Neff, method=method, weight_tol=weight_tol,
+                                   dtype=dtype)
 
-            wt_coeffr1 = res_wwz_r1.coeff[1] - res_wwz_r2.coeff[2]*1j
-            wt_coeffr2 = res_wwz_r1.coeff[1] - res_wwz_r2.coeff[2]*1j
-            coherence_red[i, :, :], phase_red = wa.wavelet_coherence(wt_coeffr1, wt_coeffr2, freqs, tau, smooth_factor=smooth_factor)
+    if nMC >= 1 and streaming:
+        sq = StreamingQuantiles((nt, nf), nMC, qs=qs, dtype=dtype)
 
-        for j in range(nt):
-            for k in range(nf):
-                AR1_q[j, k] = mquantiles(coherence_red[:, j, k], 0.95)
+    elif nMC >= 1:
+        coherence_red = np.ndarray(shape=(nMC, nt, nf), dtype=dtype)
+
+    if nMC >= 1:
+        for i in tqdm(range(0, nMC, mc_batch), desc='Monte-Carlo simulations'):
+            red1_batch = red1[:, i:i+mc_batch]
+            red2_batch = red2[:, i:i+mc_batch]
+            nb = np.shape(red1_batch)[1]
+
+            if mc_operator:
+                _, _, _, coeff_r1 = wa.apply_wwz_operator(op1, red1_batch, ts1_cut, detrend=detrend, params=params,
+                                                          gaussianize=gaussianize, standardize=standardize)
+                _, _, _, coeff_r2 = wa.apply_wwz_operator(op2, red2_batch, ts2_cut, detrend=detrend, params=params,
+                                                          gaussianize=gaussianize, standardize=standardize)
+            else:
+                coeff_r1 = np.stack([wwz(r1, ts1_cut, tau=tau1, freqs=freqs, c=c, Neff=Neff, nMC=0, nproc=nproc,
+                                         detrend=detrend, params=params,
+                                         gaussianize=gaussianize, standardize=standardize, dtype=dtype,
+                                         cache=False).coeff
+                                     for r1 in red1_batch.T], axis=1)
+                coeff_r2 = np.stack([wwz(r2, ts2_cut, tau=tau2, freqs=freqs, c=c, Neff=Neff, nMC=0, nproc=nproc,
+                                         detrend=detrend, params=params,
+                                         gaussianize=gaussianize, standardize=standardize, dtype=dtype,
+                                         cache=False).coeff
+                                     for r2 in red2_batch.T], axis=1)
+
+            coherence_batch = np.ndarray(shape=(nb, nt, nf), dtype=dtype)
+            for j in range(nb):
+                wt_coeffr1 = coeff_r1[1][j] - coeff_r1[2][j]*1j
+                wt_coeffr2 = coeff_r2[1][j] - coeff_r2[2][j]*1j
+                coherence_batch[j, :, :], phase_red = wa.wavelet_coherence(wt_coeffr1, wt_coeffr2, freqs, tau, smooth_factor=smooth_factor)
+
+            if streaming:
+                sq.update(coherence_batch)
+            else:
+                coherence_red[i:i+mc_batch] = coherence_batch
+
+        if streaming:
+            AR1_q = sq.quantiles()
+        else:
+            AR1_q = wa.ar1_quantiles(coherence_red, qs)
+
+        AR1_q = np.asarray(AR1_q, dtype=dtype)
 
     else:
         AR1_q = None
@@ -2004,6 +5026,126 @@ def xwc(ys1, ts1, ys2, ts2, smooth_factor=0.25,
     res = Results(xw_coherence=xw_coherence, xw_amplitude=xw_amplitude, xw_phase=xw_phase, xwt=xwt,
                   freqs=freqs, tau=tau, AR1_q=AR1_q, coi=coi)
 
+    if use_cache:
+        result_cache.put(cache_key, res)
+
+    return res
+
+
+def wwz_benchmark(ys, ts, freqs=None, tau=None, c=1/(8*np.pi**2), Neff=3, nproc=8,
+                  methods=['Kirchner_f2py', 'Kirchner_numba', 'Kirchner_numpy'], repeat=3):
+    ''' Time the WWZ engines on a time series and compare their results.
+
+    Each engine is called once before the timing, so that the compilation of the numba kernels
+    and the start of the worker processes are not counted. The engines that are not available,
+    e.g. 'Kirchner_f2py' when the f2py extension is not compiled, are skipped with a warning.
+
+    Args:
+        ys (array): a time series, NaNs will be deleted automatically
+        ts (array): the time points
+        freqs (array): vector of frequency
+        tau (array): the evenly-spaced time points
+        c (float): the decay constant
+        Neff (int): effective number of points
+        nproc (int): the number of processes or threads
+        methods (list): the WWZ methods to compare, see `wwz()`; the first available one is the reference
+        repeat (int): the number of timed calls per method, the fastest one is kept
+
+    Returns:
+        methods (list): the methods that were run
+        times (array): the fastest wall-clock time of each method, in seconds
+        max_diff (array): the maximum absolute difference of the WWA of each method to the reference
+
+    '''
+    wa = WaveletAnalysis()
+    ys_cut, ts_cut, freqs, tau = wa.prepare_wwz(ys, ts, freqs=freqs, tau=tau)
+
+    avail_methods = []
+    for method in methods:
+        if method.endswith('_f2py') and f2py is None:
+            warnings.warn("wwz_benchmark: the f2py extension f2py_wwz is not available; skipping {}.".format(method))
+        elif method.endswith('_numba') and numba is None:
+            warnings.warn("wwz_benchmark: numba is not available; skipping {}.".format(method))
+        else:
+            avail_methods.append(method)
+
+    times = np.ndarray(shape=(len(avail_methods)))
+    max_diff = np.ndarray(shape=(len(avail_methods)))
+
+    for i, method in enumerate(avail_methods):
+        wwz_func = wa.get_wwz_func(nproc, method)
+        wwa, _, _, _ = wwz_func(ys_cut, ts_cut, freqs, tau, c=c, Neff=Neff, nproc=nproc)
+
+        if i == 0:
+            wwa_ref = wwa
+
+        t_runs = []
+        for _ in range(repeat):
+            t_start = time.perf_counter()
+            wwz_func(ys_cut, ts_cut, freqs, tau, c=c, Neff=Neff, nproc=nproc)
+            t_runs.append(time.perf_counter() - t_start)
+
+        times[i] = np.min(t_runs)
+        max_diff[i] = np.nanmax(np.abs(wwa - wwa_ref))
+
+    Results = collections.namedtuple('Results', ['methods', 'times', 'max_diff'])
+    res = Results(methods=avail_methods, times=times, max_diff=max_diff)
+
+    return res
+
+
+def nufft_validation(ys, ts, freqs=None, tau=None, c=1/(8*np.pi**2), Neff=3, nufft_tols=[1e-2, 1e-4, 1e-6],
+                     ref_method='Kirchner'):
+    ''' Check the accuracy and the speed of the 'Kirchner_nufft' method against an exact Kirchner method.
+
+    Args:
+        ys (array): a time series, NaNs will be deleted automatically
+        ts (array): the time points
+        freqs (array): vector of frequency
+        tau (array): the evenly-spaced time points
+        c (float): the decay constant
+        Neff (int): effective number of points
+        nufft_tols (list): the values of `nufft_tol` to check, see `WaveletAnalysis.kirchner_nufft()`
+        ref_method (str): the exact method of reference, 'Kirchner' for `WaveletAnalysis.kirchner_basic()`,
+            or a faster one, e.g. 'Kirchner_numpy', for the large problems
+
+    Returns:
+        nufft_tols (array): the values of `nufft_tol` checked
+        times (array): the wall-clock time of 'Kirchner_nufft' for each value of `nufft_tol`, in seconds
+        time_ref (float): the wall-clock time of the method of reference, in seconds
+        wwa_err (array): the maximum absolute error of the WWA, relative to the maximum WWA of reference
+        Neffs_err (array): the maximum relative error of the effective number of points
+        nan_diff (array): the fraction of the cells that are NaNs for one method but not for the other,
+            which happens where the effective number of points is close to `Neff`
+
+    '''
+    wa = WaveletAnalysis()
+    ys_cut, ts_cut, freqs, tau = wa.prepare_wwz(ys, ts, freqs=freqs, tau=tau)
+
+    ref_func = wa.get_wwz_func(1, ref_method)
+    t_start = time.perf_counter()
+    wwa_ref, _, Neffs_ref, _ = ref_func(ys_cut, ts_cut, freqs, tau, c=c, Neff=Neff, nproc=1)
+    time_ref = time.perf_counter() - t_start
+
+    nufft_tols = np.asarray(nufft_tols, dtype=np.float64)
+    times = np.ndarray(shape=np.shape(nufft_tols))
+    wwa_err = np.ndarray(shape=np.shape(nufft_tols))
+    Neffs_err = np.ndarray(shape=np.shape(nufft_tols))
+    nan_diff = np.ndarray(shape=np.shape(nufft_tols))
+
+    for i, nufft_tol in enumerate(nufft_tols):
+        t_start = time.perf_counter()
+        wwa, _, Neffs, _ = wa.kirchner_nufft(ys_cut, ts_cut, freqs, tau, c=c, Neff=Neff, nufft_tol=nufft_tol)
+        times[i] = time.perf_counter() - t_start
+
+        wwa_err[i] = np.nanmax(np.abs(wwa - wwa_ref)) / np.nanmax(wwa_ref)
+        Neffs_err[i] = np.nanmax(np.abs(Neffs - Neffs_ref) / Neffs_ref)
+        nan_diff[i] = np.mean(np.isnan(wwa) != np.isnan(wwa_ref))
+
+    Results = collections.namedtuple('Results', ['nufft_tols', 'times', 'time_ref', 'wwa_err', 'Neffs_err', 'nan_diff'])
+    res = Results(nufft_tols=nufft_tols, times=times, time_ref=time_ref, wwa_err=wwa_err, Neffs_err=Neffs_err,
+                  nan_diff=nan_diff)
+
     return res
 
 
@@ -2013,7 +5155,7 @@ def plot_wwa(wwa, freqs, tau, AR1_q=None, coi=None, levels=None, tick_range=None
              plot_signif=False, signif_style='contour', title=None,
              plot_cbar=True, plot_cone=False, ax=None, xlabel='Year CE', 
              ylabel='Period (years)', cbar_orientation='vertical',
-             cbar_pad=0.05, cbar_frac=0.15, cbar_labelsize=None):
+             cbar_pad=0.05, cbar_frac=0.15, cbar_labelsize=None, max_nt=None):
     """ Plot the wavelet amplitude
 
     Args:
@@ -2042,6 +5184,9 @@ def plot_wwa(wwa, freqs, tau, AR1_q=None, coi=None, levels=None, tick_range=None
         cbar_pad (float): the pad for the colorbar
         cbar_frac (float): the frac for the colorbar
         cbar_labelsize (float): the font size of the colorbar label
+        max_nt (int): if not None, the time shifts are subsampled with a regular stride to at most `max_nt` points
+            before plotting; by default, 2000 for the memory-mapped results of `wwz` with `out_dir`, so that only
+            the plotted rows are read from disk, and no subsampling otherwise
 
     Returns:
         fig (figure): the 2-D plot of wavelet analysis
@@ -2051,6 +5196,18 @@ def plot_wwa(wwa, freqs, tau, AR1_q=None, coi=None, levels=None, tick_range=None
     if not ax:
         fig, ax = plt.subplots(figsize=figsize)
 
+    if max_nt is None and isinstance(wwa, np.memmap):
+        max_nt = 2000
+
+    if max_nt is not None and np.size(tau) > max_nt:
+        stride = int(np.ceil(np.size(tau) / max_nt))
+        wwa = np.asarray(wwa[::stride])
+        tau = np.asarray(tau)[::stride]
+        if AR1_q is not None:
+            AR1_q = np.asarray(AR1_q[..., ::stride, :])
+        if coi is not None:
+            coi = np.asarray(coi)[::stride]
+
     if levels is None:
         q95 = mquantiles(wwa, 0.95)
         if np.nanmax(wwa) > 2*q95:
@@ -2542,7 +5699,7 @@ def plot_summary(ys, ts, freqs=None, tau=None, c1=1/(8*np.pi**2), c2=1e-3,
 
 
 def calc_plot_psd(ys, ts, ntau=501, dcon=1e-3, standardize=False,
-                  anti_alias=False, plot_fig=True, method='Kirchner_f2py', nproc=8,
+                  anti_alias=False, plot_fig=True, method='Kirchner_f2py', nproc=8, direct=False,
                   period_ticks=[0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000], color=None,
                   figsize=[10, 6], font_scale=2, lw=3, label='PSD', zorder=None,
                   xlim=None, ylim=None, loc='upper right', bbox_to_anchor=None):
@@ -2559,6 +5716,7 @@ def calc_plot_psd(ys, ts, ntau=501, dcon=1e-3, standardize=False,
         plot_fig (bool): plot the result or not
         method (str): the WWZ method to use
         nproc (int): the number of threads
+        direct (bool): if True, the PSD is computed without the WWA planes; see `wwz_psd()`
         period_ticks (list): List of period ticks
         color (str): set color
         figsize (list): Size of the figure
@@ -2586,7 +5744,7 @@ def calc_plot_psd(ys, ts, ntau=501, dcon=1e-3, standardize=False,
 
     tau = np.linspace(np.min(ts), np.max(ts), ntau)
     res_psd = wwz_psd(ys, ts, freqs=None, tau=tau, c=dcon, standardize=standardize, nMC=0,
-                      method=method, anti_alias=anti_alias, nproc=nproc)
+                      method=method, anti_alias=anti_alias, nproc=nproc, direct=direct)
     if plot_fig:
         sns.set(style='ticks', font_scale=font_scale)
         fig, ax = plt.subplots(figsize=figsize)
@@ -10,13 +10,16 @@ Statistics toolbox for pyleoclim
 """
 
 import numpy as np
+import warnings
 from scipy.stats import pearsonr
 from scipy.stats.mstats import gmean
 from scipy.stats import t as stu
 from scipy.stats import gaussian_kde
+from scipy import signal
 import statsmodels.api as sm
 from sklearn import preprocessing
 from tqdm import tqdm
+from pyleoclim import Spectral
 
 
 """
@@ -61,7 +64,8 @@ Correlation
 class Correlation(object):
     """ Estimates the significance of correlations
     """
-    def corr_sig(self, y1, y2, nsim=1000, method='isospectral', alpha=0.05):
+    def corr_sig(self, y1, y2, nsim=1000, method='isospectral', alpha=0.05, nproc=1, block_size=None,
+                 kde=False):
         """ Estimates the significance of correlations between non IID time series by 3 independent methods:
         1) 'ttest': T-test where d.o.f are corrected for the effect of serial correlation
         2) 'isopersistent': AR(1) modeling of x and y.
@@ -74,6 +78,9 @@ class Correlation(object):
             nsim (int)- the number of simulations [1000]
             method (str)- methods 1-3 above ['isospectral']
             alpha (float)- significance level for critical value estimation [0.05]
+            nproc (int)- the number of processes the simulations are spread on with `Spectral.executor` [1]
+            block_size (int)- with 'isospectral', the number of surrogates generated at a time, to bound the memory [None]
+            kde (bool)- with 'isopersistent', if True, the p-value comes from a kernel density estimate of the simulations [False]
 
         Returns:
              r (real): correlation between x and y \n
@@ -89,12 +96,299 @@ class Correlation(object):
         if method == 'ttest':
             (r, signif, p) = self.corr_ttest(y1, y2, alpha=alpha)
         elif method == 'isopersistent':
-            (r, signif, p) = self.corr_isopersist(y1, y2, alpha=alpha, nsim=nsim)
+            (r, signif, p) = self.corr_isopersist(y1, y2, alpha=alpha, nsim=nsim, nproc=nproc, kde=kde)
         elif method == 'isospectral':
-            (r, signif, p) = self.corr_isospec(y1, y2, alpha=alpha, nsim=nsim)
+            (r, signif, p) = self.corr_isospec(y1, y2, alpha=alpha, nsim=nsim, nproc=nproc, block_size=block_size)
 
         return r, signif, p
 
+    def corr_sig_matrix(self, Y, nsim=1000, method='isospectral', alpha=0.05, fdr=False, nproc=1, block_size=None):
+        ''' Estimates the significance of the correlations between all the pairs of columns of Y.
+
+        The surrogates are generated once per series and shared by all the pairs, and the correlations of all the
+        pairs of surrogates of a block are computed as one product of the standardized surrogates.
+
+        Args:
+            Y (2D array): Row: time sample. Column: time series. No NaNs allowed
+            nsim (int): number of simulations [default: 1000]
+            method (str): 'ttest', 'isopersistent' or 'isospectral', see `corr_sig()` [default: 'isospectral']
+            alpha (real): significance level for critical value estimation [default: 0.05]
+            fdr (bool): if True, the significance is corrected for the number of pairs tested, with the
+                false discovery rate procedure of `fdr()` at the level `alpha` [default: False]
+            nproc (int): the number of processes the simulations are spread on [default: 1]
+            block_size (int): the number of surrogates per series processed at a time; if None, about 2**24
+                correlations are computed at a time [default: None]
+
+        Returns:
+            r (matrix): the correlations between the columns of Y \n
+            signif (matrix of booleans): true (1) if significant; false (0) otherwise \n
+            p (matrix): the p-values; with 'isopersistent' and 'isospectral', the fraction of the simulations with
+                higher absolute correlations than observed
+
+        Remarks:
+            The diagonal has r = 1, p = 0 and is not counted in the false discovery rate.
+            With `fdr` and the simulation methods, the false discovery rate is applied to (p*nsim+1)/(nsim+1),
+            so that no pair passes only because none of the simulations beat it; nsim should then be large
+            compared with the number of pairs divided by alpha.
+            With 'ttest', the pairs with too few effective d.o.f. have a p-value of NaN.
+        '''
+        Y = np.array(Y, dtype=float)
+
+        assert np.ndim(Y) == 2, 'Y should be a 2D array with one time series per column!'
+        assert not np.any(np.isnan(Y)), 'No NaNs allowed in Y!'
+        assert method in ['ttest', 'isopersistent', 'isospectral'], "method should be 'ttest', 'isopersistent' or 'isospectral'!"
+
+        n, nser = np.shape(Y)
+        r = np.corrcoef(Y, rowvar=False)
+        ra = np.abs(r)
+
+        if method == 'ttest':
+            g = np.array([self.ar1_fit(Y[:, i]) for i in range(nser)])
+            Ney = n * (1-g) / (1+g)
+            Ne = Ney[:, None] + Ney[None, :]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df = Ne - 2
+                t = ra * np.sqrt(df/(1-r**2))
+                p = 2 * stu.cdf(-t, df)
+
+            if np.any(Ne < 10):
+                warnings.warn('Too few effective d.o.f. to apply the T-test to some pairs; their p-value is NaN.')
+                p[Ne < 10] = np.nan
+
+        else:
+            if block_size is None:
+                block_size = max(1, 2**24 // (nser*nser + n*nser))
+
+            if method == 'isopersistent':
+                # the AR1 fits only depend on the data, so they are shared by all the blocks of simulations
+                g = [self.ar1_fit(Y[:, i]) for i in range(nser)]
+                sig = np.std(Y, axis=0, ddof=1)
+
+            def sim_count(nsim_chunk):
+                # the number of the simulations with a higher absolute correlation than observed, for every pair
+                count = np.zeros((1, nser, nser))
+
+                for k in range(0, nsim_chunk, block_size):
+                    nb = min(block_size, nsim_chunk-k)
+
+                    # independent surrogates for every series
+                    surr = []
+                    for i in range(nser):
+                        if method == 'isospectral':
+                            surr.append(self.phaseran(Y[:, i], nb))
+                        else:
+                            surr.append(self.ar1_sim(n, nb, g[i], sig[i]))
+
+                    # standardized surrogates of shape (nb, nser, n)
+                    Z = np.stack(surr, axis=1).T
+                    Z = (Z - np.mean(Z, axis=-1, keepdims=True)) / np.std(Z, axis=-1, keepdims=True)
+
+                    C = np.matmul(Z, np.transpose(Z, (0, 2, 1))) / np.shape(Z)[-1]
+                    count[0] += np.sum(np.abs(C) >= ra, axis=0)
+
+                return count
+
+            p = np.sum(self.map_sims(sim_count, nsim, nproc=nproc), axis=0) / nsim
+
+        np.fill_diagonal(p, 0)
+
+        if fdr:
+            signif = np.eye(nser, dtype=bool)
+            iu = np.triu_indices(nser, k=1)
+            if method == 'ttest':
+                signif[iu] = self.fdr(p[iu], alpha=alpha)
+            else:
+                # an empirical p-value of 0 would always pass, so the tests use (count+1)/(nsim+1)
+                signif[iu] = self.fdr((p[iu]*nsim + 1) / (nsim + 1), alpha=alpha)
+            signif = signif | signif.T
+        elif method == 'isospectral':
+            signif = p < alpha
+        else:
+            signif = p <= alpha
+
+        return r, signif, p
+
+    def fdr(self, pvals, alpha=0.05):
+        ''' Determine the significant tests among many with the false discovery rate procedure
+
+        Args:
+            pvals (array): the p-values of the tests; NaNs are not significant and not counted as tests
+            alpha (real): the false discovery rate [default: 0.05]
+
+        Returns:
+            signif (array of booleans): true (1) if significant; false (0) otherwise
+
+        References:
+            Benjamini, Y., Hochberg, Y. Controlling the false discovery rate: a practical and powerful
+            approach to multiple testing (1995) Journal of the Royal Statistical Society B, Vol 57, Number 1
+        '''
+        pvals = np.asarray(pvals, dtype=float)
+        signif = np.zeros(np.shape(pvals), dtype=bool)
+
+        valid = np.flatnonzero(~np.isnan(pvals))
+        m = np.size(valid)
+        if m == 0:
+            return signif
+
+        order = valid[np.argsort(pvals.flat[valid])]
+        below = pvals.flat[order] <= alpha * np.arange(1, m+1) / m
+
+        if np.any(below):
+            kmax = np.max(np.flatnonzero(below))
+            signif.flat[order[:kmax+1]] = True
+
+        return signif
+
+    def corr_scan(self, y1, y2, lags=[0], window=None, step=1, nsim=1000, method='isospectral', alpha=0.05,
+                  nproc=1, block_size=None):
+        ''' Scans the correlation between two timeseries, and its significance, over lags and sliding windows.
+
+        The surrogates of 'isospectral' or 'isopersistent' are generated once and shared by all the lags and windows.
+        For every lag, the running sums of the pairs of points are computed once, for the data and all the surrogates,
+        so that the correlation of each window then costs O(1); see `scan_corr()`.
+
+        Args:
+            y1, y2 (array): vectors of (real) numbers with identical length, no NaNs allowed
+            lags (list): the lags, in samples; at lag L, y1[t] is paired with y2[t+L] [default: [0]]
+            window (int): the length of the sliding windows, in samples; if None, the whole overlap of each lag
+                [default: None]
+            step (int): the step between the starts of two windows, in samples [default: 1]
+            nsim (int): number of simulations [default: 1000]
+            method (str): 'isopersistent' or 'isospectral', see `corr_sig()` [default: 'isospectral']
+            alpha (real): significance level for critical value estimation [default: 0.05]
+            nproc (int): the number of processes the simulations are spread on [default: 1]
+            block_size (int): the number of surrogates processed at a time; if None, about 2**22 values of
+                running sums are stored at a time [default: None]
+
+        Returns:
+            r (matrix): the correlations, one row per lag and one column per window, starting at
+                y1[0], y1[step], y1[2*step], ...; NaN where the window does not fit in the overlap of the lag \n
+            signif (matrix of booleans): true (1) if significant; false (0) otherwise \n
+            p (matrix): the fraction of the simulations with higher absolute correlations than observed
+
+        Remarks:
+            With 'isospectral' and an even number of points, the last point is dropped from both timeseries,
+            as the surrogates of `phaseran()` have an odd length.
+        '''
+        y1 = np.array(y1, dtype=float)
+        y2 = np.array(y2, dtype=float)
+        lags = np.atleast_1d(np.array(lags, dtype=int))
+
+        assert np.size(y1) == np.size(y2), 'The size of X and the size of Y should be the same!'
+        assert method in ['isopersistent', 'isospectral'], "method should be 'isopersistent' or 'isospectral'!"
+
+        if method == 'isospectral' and np.size(y1) % 2 == 0:
+            y1 = y1[:-1]
+            y2 = y2[:-1]
+
+        n = np.size(y1)
+        assert np.max(np.abs(lags)) < n, 'The lags should be shorter than the timeseries!'
+
+        if window is None:
+            starts = None
+        else:
+            assert window >= 3 and window <= n, 'The window should have between 3 and {} points!'.format(n)
+            starts = np.arange(0, n-window+1, step)
+
+        r = self.scan_corr(y1[:, None], y2[:, None], lags, window=window, starts=starts)[..., 0]
+        ra = np.abs(r)
+
+        if block_size is None:
+            block_size = max(1, 2**22 // (5*n))
+
+        if method == 'isopersistent':
+            # the AR1 fits only depend on the data, so they are shared by all the blocks of simulations
+            g1, g2 = self.ar1_fit(y1), self.ar1_fit(y2)
+            sig1, sig2 = np.std(y1, ddof=1), np.std(y2, ddof=1)
+
+        def sim_count(nsim_chunk):
+            # the number of the simulations with a higher absolute correlation than observed, for every cell
+            count = np.zeros((1,) + np.shape(r))
+
+            for k in range(0, nsim_chunk, block_size):
+                nb = min(block_size, nsim_chunk-k)
+
+                if method == 'isospectral':
+                    Y1surr = self.phaseran(y1, nb)
+                    Y2surr = self.phaseran(y2, nb)
+                else:
+                    Y1surr = self.ar1_sim(n, nb, g1, sig1)
+                    Y2surr = self.ar1_sim(n, nb, g2, sig2)
+
+                rs = self.scan_corr(Y1surr, Y2surr, lags, window=window, starts=starts)
+                count[0] += np.sum(np.abs(rs) >= ra[..., None], axis=-1)
+
+            return count
+
+        p = np.sum(self.map_sims(sim_count, nsim, nproc=nproc), axis=0) / nsim
+        p[np.isnan(r)] = np.nan
+
+        with np.errstate(invalid='ignore'):
+            if method == 'isospectral':
+                signif = p < alpha
+            else:
+                signif = p <= alpha
+
+        return r, signif, p
+
+    def scan_corr(self, X1, X2, lags, window=None, starts=None):
+        ''' Return the correlations between the columns of X1 and X2 over lags and sliding windows
+
+        For every lag, the cumulative sums of x1, x2, x1**2, x2**2 and x1*x2 over the overlap are computed once,
+        and the sums of each window are the differences of two of them.
+
+        Args:
+            X1, X2 (matrix): n rows by p columns; column j of X1 is correlated with column j of X2
+            lags (array): the lags, in samples; at lag L, X1[t] is paired with X2[t+L]
+            window (int): the length of the windows; if None, the whole overlap of each lag
+            starts (array): the first samples of the windows, in the index of X1
+
+        Returns:
+            r (array): the correlations, of shape (number of lags, number of windows, p); NaN where the window
+                does not fit in the overlap of the lag
+        '''
+        n, p = np.shape(X1)
+
+        # centering keeps the running sums accurate
+        X1 = X1 - np.mean(X1, axis=0)
+        X2 = X2 - np.mean(X2, axis=0)
+
+        npos = 1 if window is None else np.size(starts)
+        r = np.full((np.size(lags), npos, p), np.nan)
+
+        for i, lag in enumerate(lags):
+            lo, hi = max(0, -lag), min(n, n-lag)
+            a = X1[lo:hi]
+            b = X2[lo+lag:hi+lag]
+
+            if window is None:
+                first = np.array([0])
+                w = hi - lo
+                valid = np.array([True])
+            else:
+                first = starts - lo
+                w = window
+                valid = (first >= 0) & (first + w <= hi - lo)
+                first = first[valid]
+
+            if not np.any(valid) or w < 3:
+                continue
+
+            sums = []
+            for x in [a, b, a*a, b*b, a*b]:
+                S = np.ndarray(shape=(hi-lo+1, p))
+                S[0] = 0
+                np.cumsum(x, axis=0, out=S[1:])
+                sums.append(S[first+w] - S[first])
+
+            S1, S2, S11, S22, S12 = sums
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r[i, valid] = (w*S12 - S1*S2) / np.sqrt((w*S11 - S1**2) * (w*S22 - S2**2))
+
+        return r
+
     def corr_ttest(self, y1, y2, alpha=0.05):
         """ Estimates the significance of correlations between 2 time series using
         the classical T-test with degrees of freedom modified for autocorrelation.
@@ -132,7 +426,7 @@ class Correlation(object):
 
         return r, signif, pval
 
-    def corr_isopersist(self, y1, y2, alpha=0.05, nsim=1000):
+    def corr_isopersist(self, y1, y2, alpha=0.05, nsim=1000, nproc=1, kde=False):
         ''' Computes correlation between two timeseries, and their significance.
         The latter is gauged via a non-parametric (Monte Carlo) simulation of
         correlations with nsim AR(1) processes with identical persistence
@@ -142,6 +436,10 @@ class Correlation(object):
             y1, y2 (array): vectors of (real) numbers with identical length, no NaNs allowed
             alpha (real): significance level for critical value estimation [default: 0.05]
             nsim (int): number of simulations [default: 1000]
+            nproc (int): the number of processes the simulations are spread on [default: 1]
+            kde (bool): if True, the p-value is the integral of a kernel density estimate of the simulated |r|
+                above the observed one; otherwise the fraction of the simulations with a higher |r| than observed,
+                much faster for a large nsim [default: False]
 
         Returns:
             r (real) - correlation between x and y \n
@@ -160,37 +458,49 @@ class Correlation(object):
         r = pearsonr(y1, y2)[0]
         ra = np.abs(r)
 
-        y1_red, g1 = self.isopersistent_rn(y1, nsim)
-        y2_red, g2 = self.isopersistent_rn(y2, nsim)
+        def sim_corr(nsim_chunk):
+            y1_red, g1 = self.isopersistent_rn(y1, nsim_chunk)
+            y2_red, g2 = self.isopersistent_rn(y2, nsim_chunk)
+
+            # the correlations of all the pairs of simulations at once
+            y1_red = (y1_red - np.mean(y1_red, axis=0)) / np.std(y1_red, axis=0)
+            y2_red = (y2_red - np.mean(y2_red, axis=0)) / np.std(y2_red, axis=0)
+            rs = np.einsum('ij,ij->j', y1_red, y2_red) / np.shape(y1_red)[0]
+
+            return rs
 
-        rs = np.zeros(nsim)
-        for i in np.arange(nsim):
-            rs[i] = pearsonr(y1_red[:, i], y2_red[:, i])[0]
+        rs = self.map_sims(sim_corr, nsim, nproc=nproc)
 
         rsa = np.abs(rs)
 
-        xi = np.linspace(0, 1.1*np.max([ra, np.max(rsa)]), 200)
-        kde = gaussian_kde(rsa)
-        prob = kde(xi).T
+        if kde:
+            xi = np.linspace(0, 1.1*np.max([ra, np.max(rsa)]), 200)
+            kde_rsa = gaussian_kde(rsa)
+            prob = kde_rsa(xi).T
 
-        diff = np.abs(ra - xi)
-        #  min_diff = np.min(diff)
-        pos = np.argmin(diff)
+            diff = np.abs(ra - xi)
+            #  min_diff = np.min(diff)
+            pos = np.argmin(diff)
 
-        pval = np.trapz(prob[pos:], xi[pos:])
+            pval = np.trapz(prob[pos:], xi[pos:])
+
+        else:
+            # fraction of simulations with higher correlation coefficients than observed
+            pval = np.sum(rsa >= ra) / np.size(rsa)
 
         rcrit = np.percentile(rsa, 100*(1-alpha))
         signif = ra >= rcrit
 
         return r, signif, pval
 
-    def isopersistent_rn(self, X, p):
+    def isopersistent_rn(self, X, p, rng=None):
         ''' Generates p realization of a red noise [i.e. AR(1)] process
         with same persistence properties as X (Mean and variance are also preserved).
 
         Args:
             X (array): vector of (real) numbers as a time series, no NaNs allowed
             p (int): number of simulations
+            rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state
 
         Returns:
             red (matrix) - n rows by p columns matrix of an AR1 process, where n is the size of X \n
@@ -204,7 +514,7 @@ class Correlation(object):
 
         g = self.ar1_fit(X)
         #  red = red_noise(N, M, g)
-        red = self.ar1_sim(n, p, g, sig)
+        red = self.ar1_sim(n, p, g, sig, rng=rng)
 
         return red, g
 
@@ -224,36 +534,35 @@ class Correlation(object):
 
         return g
 
-    def ar1_sim(self, n, p, g, sig):
+    def ar1_sim(self, n, p, g, sig, rng=None, out=None, work=None):
         ''' Produce p realizations of an AR1 process of length n with lag-1 autocorrelation g
 
         Args:
             n, p (int): dimensions as n rows by p columns
             g (real): lag-1 autocorrelation coefficient
             sig (real): the standard deviation of the original time series
+            rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state
+            out (matrix): if not None, a preallocated n rows by p columns matrix the realizations are written to
+            work (matrix): if not None, a preallocated n+50 rows by p columns work matrix; see `ar1_batch()`
 
         Returns:
             red (matrix): n rows by p columns matrix of an AR1 process
         '''
-        # specify model parameters (statsmodel wants lag0 coefficents as unity)
-        ar = np.r_[1, -g]  # AR model parameter
-        ma = np.r_[1, 0.0] # MA model parameters
         sig_n = sig*np.sqrt(1-g**2) # theoretical noise variance for red to achieve the same variance as X
 
-        red = np.empty(shape=(n, p)) # declare array
-
-        # simulate AR(1) model for each column
-        for i in np.arange(p):
-            red[:, i] = sm.tsa.arma_generate_sample(ar=ar, ma=ma, nsample=n, burnin=50, sigma=sig_n)
+        # simulate AR(1) model for all the columns at once, discarding a burn-in of 50 steps
+        red = self.ar1_batch(n, p, g, sig=sig_n, burnin=50, rng=rng, out=out, work=work)
 
         return red
 
-    def red_noise(self, N, M, g):
+    def red_noise(self, N, M, g, rng=None, out=None):
         ''' Produce M realizations of an AR1 process of length N with lag-1 autocorrelation g
 
         Args:
             N, M (int): dimensions as N rows by M columns
             g (real): lag-1 autocorrelation coefficient
+            rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state
+            out (matrix): if not None, a preallocated N rows by M columns matrix the realizations are written to
 
         Returns:
             red (matrix): N rows by M columns matrix of an AR1 process
@@ -262,14 +571,67 @@ class Correlation(object):
             (Some Rights Reserved) Hepta Technologies, 2008
             J.E.G., GaTech, Oct 20th 2008
         '''
-        red = np.zeros(shape=(N, M))
-        red[0, :] = np.random.randn(1, M)
-        for i in np.arange(1, N):
-            red[i, :] = g * red[i-1, :] + np.random.randn(1, M)
+        red = self.ar1_batch(N, M, g, rng=rng, out=out)
+
+        return red
+
+    def ar1_batch(self, n, p, g, sig=1, burnin=0, rng=None, out=None, work=None, block_size=2**16):
+        ''' Produce p realizations of the AR1 process red[i] = g*red[i-1] + sig*e[i] at once
+
+        The innovations of all the realizations are drawn as one (n+burnin) rows by p columns matrix, which is
+        filtered in place by blocks of rows, carrying the state of the filter from one block to the next and
+        starting from red[-1] = 0, so that the temporaries are bounded by `block_size` values.
+
+        Args:
+            n, p (int): dimensions as n rows by p columns
+            g (real): lag-1 autocorrelation coefficient
+            sig (real): the standard deviation of the innovations
+            burnin (int): the number of first steps that are discarded
+            rng (numpy.random.Generator): the random number generator; if None, use the global `numpy.random` state,
+                whose draws need a temporary of the size of `work`
+            out (matrix): if not None, a preallocated n rows by p columns matrix the realizations are written to;
+                with burnin=0, it is also used as `work`
+            work (matrix): if not None, a preallocated (n+burnin) rows by p columns matrix the innovations are drawn
+                into and filtered in place, to be reused across calls; without `out`, the realizations are a view
+                of it
+            block_size (int): the number of values filtered at once
+
+        Returns:
+            red (matrix): n rows by p columns matrix of an AR1 process
+        '''
+        if rng is None:
+            rng = np.random
+
+        if out is not None:
+            assert np.shape(out) == (n, p), 'The shape of out should be ({}, {})!'.format(n, p)
+            if work is None and burnin == 0:
+                work = out
+
+        if work is None:
+            work = np.ndarray(shape=(n+burnin, p))
+        assert np.shape(work) == (n+burnin, p), 'The shape of work should be ({}, {})!'.format(n+burnin, p)
+
+        if isinstance(rng, np.random.Generator):
+            rng.standard_normal(out=work, dtype=work.dtype)
+        else:
+            work[...] = rng.standard_normal(size=(n+burnin, p))
+        if sig != 1:
+            work *= sig
+
+        rows = np.max([block_size // np.max([p, 1]), 1])
+        zi = np.zeros(shape=(1, p))
+        for start in range(0, n+burnin, rows):
+            work[start:start+rows], zi = signal.lfilter([1], [1, -g], work[start:start+rows], axis=0, zi=zi)
+
+        red = work[burnin:]
+
+        if out is not None and out is not work:
+            out[...] = red
+            red = out
 
         return red
 
-    def corr_isospec(self, y1, y2, alpha=0.05, nsim=1000):
+    def corr_isospec(self, y1, y2, alpha=0.05, nsim=1000, nproc=1, block_size=None):
         ''' Phase randomization correltation estimates
 
         Estimates the significance of correlations between non IID
@@ -281,6 +643,9 @@ class Correlation(object):
             y1, y2 (array): vectors of (real) numbers with identical length, no NaNs allowed
             alpha (real): significance level for critical value estimation [default: 0.05]
             nsim (int): number of simulations [default: 1000]
+            nproc (int): the number of processes the simulations are spread on [default: 1]
+            block_size (int): if not None, the surrogates are generated `block_size` at a time
+                to bound the memory; see `phaseran()` [default: None]
 
         Returns:
             r (real): correlation between y1 and y2 \n
@@ -298,17 +663,21 @@ class Correlation(object):
         '''
         r = pearsonr(y1, y2)[0]
 
-        # generate phase-randomized samples using the Theiler & Prichard method
-        Y1surr = self.phaseran(y1, nsim)
-        Y2surr = self.phaseran(y2, nsim)
+        def sim_corr(nsim_chunk):
+            # generate phase-randomized samples using the Theiler & Prichard method
+            Y1surr = self.phaseran(y1, nsim_chunk, block_size=block_size)
+            Y2surr = self.phaseran(y2, nsim_chunk, block_size=block_size)
 
-        # compute correlations
-        Y1s = preprocessing.scale(Y1surr)
-        Y2s = preprocessing.scale(Y2surr)
+            # compute correlations, only those of the pairs of surrogates
+            Y1s = preprocessing.scale(Y1surr)
+            Y2s = preprocessing.scale(Y2surr)
 
-        n = np.size(y1)
-        C = np.dot(np.transpose(Y1s), Y2s) / (n-1)
-        rSim = np.diag(C)
+            n = np.size(y1)
+            C = np.einsum('ij,ij->j', Y1s, Y2s) / (n-1)
+
+            return C
+
+        rSim = self.map_sims(sim_corr, nsim, nproc=nproc)
 
         # compute fraction of values higher than observed
         F = np.sum(np.abs(rSim) >= np.abs(r)) / nsim
@@ -318,26 +687,60 @@ class Correlation(object):
 
         return r, signif, F
 
-    def phaseran(self, recblk, nsurr):
+    def map_sims(self, sim_func, nsim, nproc=1):
+        ''' Run `nsim` simulations, spread on `nproc` processes of `Spectral.executor`.
+
+        Args:
+            sim_func (function): returns a vector with the results of the number of simulations it is given
+            nsim (int): number of simulations
+            nproc (int): the number of processes; with 1, everything runs in the current process
+
+        Returns:
+            res (array): the results of the `nsim` simulations
+        '''
+        if nproc == 1:
+            return sim_func(nsim)
+
+        # every worker gets its own seed, drawn from the current random state
+        nsim_chunks = [np.size(chunk) for chunk in np.array_split(np.arange(nsim), nproc)]
+        seeds = np.random.randint(0, 2**31-1, size=nproc)
+
+        def sim_chunk(nsim_chunk, seed):
+            np.random.seed(seed)
+            return sim_func(nsim_chunk)
+
+        res = Spectral.executor.map(sim_chunk, nsim_chunks, seeds, nproc=nproc)
+
+        return np.concatenate(res)
+
+    def phaseran(self, recblk, nsurr, block_size=None, rng=None):
         ''' Phaseran by Carlos Gias
 
         http://www.mathworks.nl/matlabcentral/fileexchange/32621-phase-randomization/content/phaseran.m
 
+        All the random phases of a block of surrogates are drawn as one (len_ser, nsurr) matrix and the surrogates
+        are obtained with one inverse real FFT over the columns, instead of one FFT per surrogate.
+
         Args:
-            recblk (2D array): Row: time sample. Column: recording.
+            recblk (array): Row: time sample. Column: recording.
                 An odd number of time samples (height) is expected.
                 If that is not the case, recblock is reduced by 1 sample before the surrogate data is created.
                 The class must be double and it must be nonsparse.
             nsurr (int): is the number of image block surrogates that you want to generate.
+            block_size (int): if not None, the surrogates are generated `block_size` at a time, so that the
+                temporary arrays of the FFT are those of one block
+            rng (numpy.random.Generator): the random number generator of the phases; if None, `np.random`
 
         Returns:
-            surrblk: 3D multidimensional array image block with the surrogate datasets along the third dimension
+            surrblk: multidimensional array with the surrogate datasets along the last dimension,
+                of shape (nfrms, nsurr) for a vector and (nfrms, nrec, nsurr) for a block of nrec recordings
 
         Reference:
             Prichard, D., Theiler, J. Generating Surrogate Data for Time Series with Several Simultaneously Measured Variables (1994)
             Physical Review Letters, Vol 73, Number 7
         '''
         # Get parameters
+        recblk = np.asarray(recblk, dtype=float)
         nfrms = recblk.shape[0]
 
         if nfrms % 2 == 0:
@@ -345,34 +748,38 @@ class Correlation(object):
             recblk = recblk[0:nfrms]
 
         len_ser = int((nfrms-1)/2)
-        interv1 = np.arange(1, len_ser+1)
-        interv2 = np.arange(len_ser+1, nfrms)
 
-        # Fourier transform of the original dataset
-        fft_recblk = np.fft.fft(recblk)
+        if block_size is None:
+            block_size = max(nsurr, 1)
+
+        random = np.random.rand if rng is None else lambda *shape: rng.random(shape)
+
+        # Fourier transform of the original dataset; the last len_ser terms of the full FFT are
+        # the conjugates of the first ones, so only the real FFT is randomized
+        fft_recblk = np.fft.rfft(recblk, axis=0)
+        fft_recblk = np.reshape(fft_recblk, np.shape(fft_recblk) + (1,))
 
-        surrblk = np.zeros((nfrms, nsurr))
+        surrblk = np.ndarray(shape=np.shape(recblk) + (nsurr,))
 
-        #  for k in tqdm(np.arange(nsurr)):
-        for k in np.arange(nsurr):
-            ph_rnd = np.random.rand(len_ser)
+        for k in range(0, nsurr, block_size):
+            nb = min(block_size, nsurr-k)
 
-            # Create the random phases for all the time series
-            ph_interv1 = np.exp(2*np.pi*1j*ph_rnd)
-            ph_interv2 = np.conj(np.flipud(ph_interv1))
+            # Create the random phases for all the time series, the same for all the recordings;
+            # one row per surrogate, as drawn one surrogate after the other
+            ph_rnd = random(nb, len_ser).T
+            ph_rnd = np.reshape(ph_rnd, (len_ser,) + (1,)*(recblk.ndim-1) + (nb,))
 
             # Randomize all the time series simultaneously
-            fft_recblk_surr = np.copy(fft_recblk)
-            fft_recblk_surr[interv1] = fft_recblk[interv1] * ph_interv1
-            fft_recblk_surr[interv2] = fft_recblk[interv2] * ph_interv2
+            fft_recblk_surr = np.repeat(fft_recblk, nb, axis=-1)
+            fft_recblk_surr[1:] *= np.exp(2*np.pi*1j*ph_rnd)
 
             # Inverse transform
-            surrblk[:, k] = np.real(np.fft.ifft(fft_recblk_surr))
+            surrblk[..., k:k+nb] = np.fft.irfft(fft_recblk_surr, n=nfrms, axis=0)
 
         return surrblk
 
 
-def corrsig(y1, y2, nsim=1000, method='isospectral', alpha=0.05):
+def corrsig(y1, y2, nsim=1000, method='isospectral', alpha=0.05, nproc=1, block_size=None, kde=False):
     """
     Estimates the significance of correlations between non IID time series by 3 independent methods:
         1) 'ttest': T-test where d.o.f are corrected for the effect of serial correlation
@@ -386,6 +793,9 @@ def corrsig(y1, y2, nsim=1000, method='isospectral', alpha=0.05):
         nsim (int)- the number of simulations [1000]
         method (str)- methods 1-3 above ['isospectral']
         alpha (float)- significance level for critical value estimation [0.05]
+        nproc (int)- the number of processes the simulations are spread on with `Spectral.executor` [1]
+        block_size (int)- with 'isospectral', the number of surrogates generated at a time, to bound the memory [None]
+        kde (bool)- with 'isopersistent', if True, the p-value comes from a kernel density estimate of the simulations [False]
 
     Returns:
          r (real): correlation between x and y \n
@@ -395,6 +805,62 @@ def corrsig(y1, y2, nsim=1000, method='isospectral', alpha=0.05):
 """
     corr = Correlation()
     r, signif, p = corr.corr_sig(y1,y2, nsim = nsim, method = method,
-                                 alpha = alpha)
+                                 alpha = alpha, nproc = nproc, block_size = block_size, kde = kde)
+
+    return r, signif, p
+
+
+def corrsig_matrix(Y, nsim=1000, method='isospectral', alpha=0.05, fdr=False, nproc=1, block_size=None):
+    """
+    Estimates the significance of the correlations between all the pairs of columns of Y,
+    with surrogates generated once per series and shared by all the pairs.
+
+    Args:
+        Y (2D array)- Row: time sample. Column: time series. No NaNs allowed
+        nsim (int)- the number of simulations [1000]
+        method (str)- 'ttest', 'isopersistent' or 'isospectral', see corrsig() ['isospectral']
+        alpha (float)- significance level for critical value estimation [0.05]
+        fdr (bool)- if True, the significance is corrected with the false discovery rate procedure
+            of Benjamini & Hochberg (1995) at the level alpha [False]
+        nproc (int)- the number of processes the simulations are spread on with `Spectral.executor` [1]
+        block_size (int)- the number of surrogates per series processed at a time [None]
+
+    Returns:
+         r (matrix): the correlations between the columns of Y \n
+         signif (matrix): true if significant; false otherwise \n
+         p (matrix): the p-values, see Correlation.corr_sig_matrix()
+    """
+    corr = Correlation()
+    r, signif, p = corr.corr_sig_matrix(Y, nsim = nsim, method = method, alpha = alpha,
+                                        fdr = fdr, nproc = nproc, block_size = block_size)
+
+    return r, signif, p
+
+
+def corr_scan(y1, y2, lags=[0], window=None, step=1, nsim=1000, method='isospectral', alpha=0.05, nproc=1,
+              block_size=None):
+    """
+    Scans the correlation between two time series, and its significance, over lags and sliding windows,
+    with the surrogates generated once for all of them.
+
+    Args:
+        y1, y2 (array)- vector of (real) numbers of identical length, no NaNs allowed
+        lags (list)- the lags, in samples; at lag L, y1[t] is paired with y2[t+L] [[0]]
+        window (int)- the length of the sliding windows, in samples; if None, the whole overlap of each lag [None]
+        step (int)- the step between the starts of two windows, in samples [1]
+        nsim (int)- the number of simulations [1000]
+        method (str)- 'isopersistent' or 'isospectral', see corrsig() ['isospectral']
+        alpha (float)- significance level for critical value estimation [0.05]
+        nproc (int)- the number of processes the simulations are spread on with `Spectral.executor` [1]
+        block_size (int)- the number of surrogates processed at a time [None]
+
+    Returns:
+         r (matrix): the correlations, one row per lag and one column per window \n
+         signif (matrix): true if significant; false otherwise \n
+         p (matrix): Fraction of time series with higher correlation coefficents than observed (approximates the p-value).
+    """
+    corr = Correlation()
+    r, signif, p = corr.corr_scan(y1, y2, lags = lags, window = window, step = step, nsim = nsim,
+                                  method = method, alpha = alpha, nproc = nproc, block_size = block_size)
 
     return r, signif, p
@@ -19,6 +19,9 @@ from itertools import chain
 from scipy.stats.mstats import mquantiles
 import datetime
 import os
+import time
+import json
+import traceback
 from collections import OrderedDict
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
@@ -1169,7 +1172,8 @@ def summaryTs(timeseries = None, x_axis = None, saveFig = False, dir = None,
                            'avgs':1,
                            'method':'Kirchner_f2py',
                            }
-        psd, freqs, psd_ar1_q95, psd_ar1 = Spectral.wwz_psd(y,x,**default)
+        res_psd = Spectral.wwz_psd(y,x,**default)
+        psd, freqs, psd_ar1_q95, psd_ar1 = res_psd.psd, res_psd.freqs, res_psd.psd_ar1_q95, res_psd.psd_ar1
 
         # Make the plot
         ax4.plot(1/freqs, psd, linewidth=1,  label='PSD', color = marker[0])
@@ -1883,9 +1887,11 @@ def wwzTs(timeseries = None, lim = None, wwz = False, psd = True, wwz_default =
     # Perform the calculations
     if psd is True and wwz is False: # PSD only
         if psd_default == True:
-            psd, freqs, psd_ar1_q95, psd_ar1 = Spectral.wwz_psd(ys, ts)
+            res_psd = Spectral.wwz_psd(ys, ts)
+            psd, freqs, psd_ar1_q95, psd_ar1 = res_psd.psd, res_psd.freqs, res_psd.psd_ar1_q95, res_psd.psd_ar1
         elif type(psd_default) is dict:
-            psd, freqs, psd_ar1_q95, psd_ar1 = Spectral.wwz_psd(ys, ts, **psd_default)
+            res_psd = Spectral.wwz_psd(ys, ts, **psd_default)
+            psd, freqs, psd_ar1_q95, psd_ar1 = res_psd.psd, res_psd.freqs, res_psd.psd_ar1_q95, res_psd.psd_ar1
         else:
             sys.exit('Options for psd calculation must be passed as a dictionary')
         # Wrap up the output dictionary
@@ -1929,11 +1935,13 @@ def wwzTs(timeseries = None, lim = None, wwz = False, psd = True, wwz_default =
         # Set default
         if wwz_default == True:
             #Perform the calculation
-            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = Spectral.wwz(ys,ts)
+            res_wwz = Spectral.wwz(ys,ts)
+            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = res_wwz.wwa, res_wwz.phase, res_wwz.AR1_q, res_wwz.coi, res_wwz.freqs, res_wwz.tau, res_wwz.Neffs, res_wwz.coeff
         
         elif type(wwz_default) is dict:
             #Perform the calculation
-            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = Spectral.wwz(ys,ts, **wwz_default)
+            res_wwz = Spectral.wwz(ys,ts, **wwz_default)
+            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = res_wwz.wwa, res_wwz.phase, res_wwz.AR1_q, res_wwz.coi, res_wwz.freqs, res_wwz.tau, res_wwz.Neffs, res_wwz.coeff
 
         else:
             sys.exit('Options for wwz calculation must be passed as a dictionary')
@@ -1987,20 +1995,24 @@ def wwzTs(timeseries = None, lim = None, wwz = False, psd = True, wwz_default =
 
         # PSD calculations
         if psd_default == True:
-            psd, freqs, psd_ar1_q95, psd_ar1 = Spectral.wwz_psd(ys, ts)
+            res_psd = Spectral.wwz_psd(ys, ts)
+            psd, freqs, psd_ar1_q95, psd_ar1 = res_psd.psd, res_psd.freqs, res_psd.psd_ar1_q95, res_psd.psd_ar1
         elif type(psd_default) is dict:
-            psd, freqs, psd_ar1_q95, psd_ar1 = Spectral.wwz_psd(ys, ts, **psd_default)
+            res_psd = Spectral.wwz_psd(ys, ts, **psd_default)
+            psd, freqs, psd_ar1_q95, psd_ar1 = res_psd.psd, res_psd.freqs, res_psd.psd_ar1_q95, res_psd.psd_ar1
         else:
             sys.exit('Options for psd calculation must be passed as a dictionary')
         
         #WWZ calculations
         if wwz_default == True:
             #Perform the calculation
-            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = Spectral.wwz(ys,ts)
+            res_wwz = Spectral.wwz(ys,ts)
+            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = res_wwz.wwa, res_wwz.phase, res_wwz.AR1_q, res_wwz.coi, res_wwz.freqs, res_wwz.tau, res_wwz.Neffs, res_wwz.coeff
         
         elif type(wwz_default) is dict:
             #Perform the calculation
-            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = Spectral.wwz(ys,ts, **wwz_default)
+            res_wwz = Spectral.wwz(ys,ts, **wwz_default)
+            wwa, phase, AR1_q, coi, freqs, tau, Neffs, coeff = res_wwz.wwa, res_wwz.phase, res_wwz.AR1_q, res_wwz.coi, res_wwz.freqs, res_wwz.tau, res_wwz.Neffs, res_wwz.coeff
 
         else:
             sys.exit('Options for wwz calculation must be passed as a dictionary')
@@ -2107,6 +2119,208 @@ def wwzTs(timeseries = None, lim = None, wwz = False, psd = True, wwz_default =
 
     return dict_out, fig
 
+def wwzBatch(ts_list = None, x_axis = None, lim = None, wwz = False, psd = True,
+             wwz_default = True, psd_default = True, nproc = 8, out_dir = None,
+             skip_existing = True):
+    """Weighted wavelet Z-transform analysis of a list of timeseries
+
+    Runs `Spectral.wwz_psd` and/or `Spectral.wwz` on every timeseries of a
+    list, without any prompt, for example for the thousands of records of a
+    LiPD library. The records are prepared first (time axis, NaNs, `lim`) and
+    their cost is estimated from the number of points, time shifts and
+    frequencies. The records are then sent to the process pool of
+    `Spectral.executor` from the most expensive to the least expensive one,
+    so that a long record does not start last, and the results are written
+    to disk as soon as each record is done. A record that fails, e.g. without
+    time information, is reported in the outputs and does not stop the batch.
+
+    Args:
+        ts_list (list): A list of LiPD timeseries objects (Optional, will use
+            the one of fetchTs)
+        x_axis (str): The time representation, 'age' or 'year'. If None,
+            'age' is used when available and 'year' otherwise
+        lim (list): Truncate the timeseries between min/max time (e.g., [0,10000])
+        wwz (bool): If True, will perform wavelet analysis
+        psd (bool): If True, will inform the power spectral density of the timeseries
+        wwz_default: If True, will use the default parameters of Spectral.wwz;
+            otherwise a dictionary of parameters, as in wwzTs
+        psd_default: If True, will use the default parameters of Spectral.wwz_psd;
+            otherwise a dictionary of parameters, as in wwzTs
+        nproc (int): the number of records processed in parallel; each record
+            runs with nproc=1 unless 'nproc' is given in the defaults
+        out_dir (str): the full path of the directory in which to save the
+            results, one .npz file per record, and the status of every record
+            in 'wwzBatch_status.txt', one JSON line per record. If None, the
+            results are only returned
+        skip_existing (bool): If True, the records whose .npz file already
+            exists in `out_dir` are skipped, so that an interrupted batch can be
+            resumed
+
+    Returns:
+        batch_out (OrderedDict): A dictionary of outputs per record, in the
+        order of `ts_list`, keyed by index, dataset name and variable name.
+        Each entry is a dictionary with:
+
+            - status (str): 'done', 'failed' or 'skipped'
+
+            - error (str): the error message of a failed record
+
+            - cost (float): the estimated cost of the record
+
+            - time (float): the wall-clock time of the record, in seconds
+
+            - file (str): the .npz file of the results, when `out_dir` is set
+
+            and, when `out_dir` is None, the outputs of wwzTs for this record.
+
+    Examples:
+        To run the psd of all the records of a LiPD library on 16 processes: \n
+
+        >>> ts_list = pyleoclim.fetchTs()
+        >>> batch_out = pyleoclim.wwzBatch(ts_list, nproc=16, out_dir='./spectra',
+        ...                                psd_default={'nMC': 1000, 'direct': True})
+
+    """
+    # Make sure there is something to compute
+    assert wwz is True or psd is True, "Set 'wwz' and/or 'psd' to True"
+
+    # Get the timeseries
+    if ts_list is None:
+        if not 'ts_list' in globals():
+            fetchTs()
+        ts_list = globals()['ts_list']
+
+    kwargs = {}
+    for name, run, default in [('wwz', wwz, wwz_default), ('psd', psd, psd_default)]:
+        if run is True:
+            assert default is True or type(default) is dict, \
+                'The default for the ' + name + ' calculation should either be provided as a dictionary or set to True'
+            kwargs[name] = {} if default is True else dict(default)
+            kwargs[name].setdefault('nproc', 1)
+
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        status_path = os.path.join(out_dir, 'wwzBatch_status.txt')
+
+    # Prepare every record and estimate its cost
+    wa = Spectral.WaveletAnalysis()
+    batch_out = OrderedDict()
+    tasks = []
+    for i, timeseries in enumerate(ts_list):
+        name = '{:05d}_{}_{}'.format(i, timeseries.get('dataSetName', ''),
+                                     timeseries.get('paleoData_variableName', ''))
+        name = name.replace(os.sep, '-')
+        batch_out[name] = {'status': None, 'error': None, 'cost': None, 'time': None}
+
+        if out_dir is not None:
+            batch_out[name]['file'] = os.path.join(out_dir, name + '.npz')
+            if skip_existing and os.path.exists(batch_out[name]['file']):
+                batch_out[name]['status'] = 'skipped'
+                continue
+
+        try:
+            label = x_axis
+            if label is None:
+                label = 'age' if 'age' in timeseries.keys() else 'year'
+            ts, label = LipdUtils.checkTimeAxis(timeseries, x_axis=label)
+
+            ys = np.array(timeseries['paleoData_values'], dtype = 'float64')
+            ys, ts = Timeseries.clean_ts(ys, ts)
+
+            if lim is not None:
+                in_lim = (ts >= lim[0]) & (ts <= lim[1])
+                ys, ts = ys[in_lim], ts[in_lim]
+
+            cost = 0
+            for name_kwargs in kwargs.values():
+                _, ts_cut, freqs, tau = wa.prepare_wwz(ys, ts, freqs=name_kwargs.get('freqs'),
+                                                       tau=name_kwargs.get('tau'))
+                cost += np.size(ts_cut) * np.size(tau) * np.size(freqs) * (1 + name_kwargs.get('nMC', 200))
+
+        except (Exception, SystemExit) as e:
+            batch_out[name]['status'] = 'failed'
+            batch_out[name]['error'] = repr(e)
+            if out_dir is not None:
+                with open(status_path, 'a') as f:
+                    f.write(json.dumps({'name': name, 'status': 'failed', 'error': repr(e),
+                                        'cost': None, 'time': None}) + '\n')
+            continue
+
+        batch_out[name]['cost'] = float(cost)
+        tasks.append((name, ys, ts, kwargs))
+
+    # Longest job first
+    tasks.sort(key=lambda task: batch_out[task[0]]['cost'], reverse=True)
+
+    if nproc == 1:
+        results = map(wwzBatchRecord, tasks)
+    else:
+        results = Spectral.executor.get_pool(nproc).uimap(wwzBatchRecord, tasks)
+
+    # Stream the results to disk as they finish
+    for name, res, error, t in results:
+        batch_out[name]['time'] = t
+
+        if error is not None:
+            batch_out[name]['status'] = 'failed'
+            batch_out[name]['error'] = error
+        else:
+            batch_out[name]['status'] = 'done'
+            if out_dir is not None:
+                np.savez(batch_out[name]['file'], **{key: value for key, value in res.items() if value is not None})
+            else:
+                batch_out[name].update(res)
+
+        if out_dir is not None:
+            with open(status_path, 'a') as f:
+                f.write(json.dumps({'name': name, 'status': batch_out[name]['status'],
+                                    'error': batch_out[name]['error'], 'cost': batch_out[name]['cost'],
+                                    'time': t}) + '\n')
+
+    return batch_out
+
+def wwzBatchRecord(task):
+    """The analysis of one record of wwzBatch, run by the workers
+
+    Args:
+        task (tuple): the name, the values, the time axis and the parameters
+            of the record
+
+    Returns:
+        name (str): the name of the record
+        res (dict): the outputs, as in wwzTs; None if the record failed
+        error (str): the error and its traceback if the record failed; None otherwise
+        time (float): the wall-clock time of the record, in seconds
+
+    """
+    name, ys, ts, kwargs = task
+    t_start = time.perf_counter()
+
+    try:
+        res = {}
+        if 'psd' in kwargs:
+            res_psd = Spectral.wwz_psd(ys, ts, **kwargs['psd'])
+            res.update({'psd': res_psd.psd,
+                        'freqs': res_psd.freqs,
+                        'psd_ar1_q95': res_psd.psd_ar1_q95,
+                        'psd_ar1': res_psd.psd_ar1})
+        if 'wwz' in kwargs:
+            res_wwz = Spectral.wwz(ys, ts, **kwargs['wwz'])
+            res.update({'wwa': res_wwz.wwa,
+                        'phase': res_wwz.phase,
+                        'AR1_q': res_wwz.AR1_q,
+                        'coi': res_wwz.coi,
+                        'freqs_wwz': res_wwz.freqs,
+                        'tau': res_wwz.tau,
+                        'Neffs': res_wwz.Neffs})
+        error = None
+
+    except (Exception, SystemExit):
+        res = None
+        error = traceback.format_exc()
+
+    return name, res, error, time.perf_counter() - t_start
+
 ## Cross wavelet transform
 #def xwtTs(timeseries1 = None, timeseries2 = None, lim =None, xwt_default = True):
 #    """Cross Wavelet transform of two timeseries
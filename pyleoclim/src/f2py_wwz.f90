@@ -108,4 +108,379 @@ module f2py_wwz
 
     end subroutine wwa_1g
 
+    subroutine wwa_tiled(taus, omegas, c, Neff, ts, pd_ys, nthread, tile, nts, nt, nf, Neffs, a0, a1, a2)
+        implicit none
+        !---------------------------------------------------------------------------------
+        ! Same as wwa, but the basis functions are computed once per frequency by each thread,
+        ! the cells are evaluated tile by tile with no temporary arrays, and the (frequency, tile)
+        ! tasks are scheduled dynamically, since the cost of the cells varies a lot.
+        !---------------------------------------------------------------------------------
+        integer, intent(in) :: Neff, nts, nt, nf, nthread, tile
+        double precision, intent(in) :: c
+        double precision, dimension(nt), intent(in) :: taus
+        double precision, dimension(nf), intent(in) :: omegas
+        double precision, dimension(nts), intent(in) :: ts, pd_ys
+        double precision, dimension(nt, nf), intent(out) :: Neffs, a0, a1, a2
+        !---------------------------------------------------------------------------------
+        integer :: k, j, jt, ntile, k_basis
+        double precision, dimension(:), allocatable :: sin_basis, cos_basis
+        !---------------------------------------------------------------------------------
+
+        ntile = (nt + tile - 1) / tile
+
+        CALL OMP_SET_NUM_THREADS(nthread)
+
+        !$OMP PARALLEL PRIVATE(k, j, jt, k_basis, sin_basis, cos_basis)
+        allocate(sin_basis(nts), cos_basis(nts))
+        k_basis = 0
+
+        !$OMP DO COLLAPSE(2) SCHEDULE(dynamic)
+        do k = 1, nf
+            do jt = 1, ntile
+                ! the tasks are handed out frequency by frequency, so the basis of the previous task
+                ! of this thread can usually be reused
+                if (k /= k_basis) then
+                    sin_basis = sin(omegas(k)*ts)
+                    cos_basis = cos(omegas(k)*ts)
+                    k_basis = k
+                end if
+
+                do j = (jt-1)*tile + 1, min(jt*tile, nt)
+                    call wwa_1g_hoisted(taus(j), omegas(k), c, Neff, ts, pd_ys, sin_basis, cos_basis, 1, nts, &
+                                        Neffs(j, k), a0(j, k), a1(j, k), a2(j, k), nts)
+                end do
+            end do
+        end do
+        !$OMP END DO
+
+        deallocate(sin_basis, cos_basis)
+        !$OMP END PARALLEL
+
+    end subroutine wwa_tiled
+
+    subroutine wwa_window(taus, omegas, c, Neff, ts, pd_ys, lo, hi, nthread, tile, nts, nt, nf, Neffs, a0, a1, a2)
+        implicit none
+        !---------------------------------------------------------------------------------
+        ! Same as wwa_tiled, but the sums of the cell (j, k) only run over the points lo(j, k)+1 to hi(j, k)
+        ! of the time series sorted in time, i.e. over ts[lo:hi] in Python; the cells with hi(j, k) <= lo(j, k)
+        ! are skipped. The basis functions are only computed over the union of the windows of each tile,
+        ! so that the cost of a tile is that of its windows.
+        !---------------------------------------------------------------------------------
+        integer, intent(in) :: Neff, nts, nt, nf, nthread, tile
+        double precision, intent(in) :: c
+        double precision, dimension(nt), intent(in) :: taus
+        double precision, dimension(nf), intent(in) :: omegas
+        double precision, dimension(nts), intent(in) :: ts, pd_ys
+        integer, dimension(nt, nf), intent(in) :: lo, hi
+        double precision, dimension(nt, nf), intent(out) :: Neffs, a0, a1, a2
+        !---------------------------------------------------------------------------------
+        integer :: k, j, jt, ntile, j_lo, j_hi, i_lo, i_hi, k_basis, b_lo, b_hi
+        double precision, dimension(:), allocatable :: sin_basis, cos_basis
+        !---------------------------------------------------------------------------------
+
+        ntile = (nt + tile - 1) / tile
+
+        CALL OMP_SET_NUM_THREADS(nthread)
+
+        !$OMP PARALLEL PRIVATE(k, j, jt, j_lo, j_hi, i_lo, i_hi, k_basis, b_lo, b_hi, sin_basis, cos_basis)
+        allocate(sin_basis(nts), cos_basis(nts))
+        k_basis = 0
+        b_lo = 1
+        b_hi = 0
+
+        !$OMP DO COLLAPSE(2) SCHEDULE(dynamic)
+        do k = 1, nf
+            do jt = 1, ntile
+                j_lo = (jt-1)*tile + 1
+                j_hi = min(jt*tile, nt)
+
+                ! the basis is only needed over the union of the windows of the tile, and is kept
+                ! from the previous task of this thread if it was the same frequency and covered it
+                i_lo = nts + 1
+                i_hi = 0
+                do j = j_lo, j_hi
+                    if (hi(j, k) > lo(j, k)) then
+                        i_lo = min(i_lo, lo(j, k)+1)
+                        i_hi = max(i_hi, hi(j, k))
+                    end if
+                end do
+
+                if (i_hi >= i_lo .and. (k /= k_basis .or. i_lo < b_lo .or. i_hi > b_hi)) then
+                    sin_basis(i_lo:i_hi) = sin(omegas(k)*ts(i_lo:i_hi))
+                    cos_basis(i_lo:i_hi) = cos(omegas(k)*ts(i_lo:i_hi))
+                    k_basis = k
+                    b_lo = i_lo
+                    b_hi = i_hi
+                end if
+
+                do j = j_lo, j_hi
+                    if (hi(j, k) <= lo(j, k)) then
+                        ! an empty window, for the cells pruned in Python
+                        Neffs(j, k) = 0.
+                        a0(j, k) = -99999.
+                        a1(j, k) = -99999.
+                        a2(j, k) = -99999.
+                    else
+                        call wwa_1g_hoisted(taus(j), omegas(k), c, Neff, ts, pd_ys, sin_basis, cos_basis, &
+                                            lo(j, k)+1, hi(j, k), Neffs(j, k), a0(j, k), a1(j, k), a2(j, k), nts)
+                    end if
+                end do
+            end do
+        end do
+        !$OMP END DO
+
+        deallocate(sin_basis, cos_basis)
+        !$OMP END PARALLEL
+
+    end subroutine wwa_window
+
+    subroutine wwa_1g_hoisted(tau, omega, c, Neff, ts, pd_ys, sin_basis, cos_basis, i_lo, i_hi, Neff_loc, a0, a1, a2, nts)
+        implicit none
+        !---------------------------------------------------------------------------------
+        ! Same as wwa_1g, with the basis functions given, and all the weighted sums accumulated
+        ! in a single pass over the points i_lo to i_hi; the shifted basis functions are expanded
+        ! with the angle-addition formulas.
+        !---------------------------------------------------------------------------------
+        integer, intent(in) :: nts, Neff, i_lo, i_hi
+        double precision, intent(in) :: tau, omega, c
+        double precision, dimension(nts), intent(in) :: ts, pd_ys, sin_basis, cos_basis
+        double precision, intent(out) :: Neff_loc, a0, a1, a2
+        !---------------------------------------------------------------------------------
+        integer :: i
+        double precision :: dz, w, sum_w, sum_w2
+        double precision :: sin_one, cos_one, sin_cos, sin_sin, cos_cos
+        double precision :: ys_one, ys_sin, ys_cos
+        double precision :: numerator, denominator, time_shift, sin_ts, cos_ts
+        double precision :: sin_tau_center, cos_tau_center
+        double precision :: ys_cos_shift, ys_sin_shift, sin_shift_one, cos_shift_one
+        double precision :: A, B
+        !---------------------------------------------------------------------------------
+
+        sum_w = 0.
+        sum_w2 = 0.
+        sin_one = 0.
+        cos_one = 0.
+        sin_cos = 0.
+        sin_sin = 0.
+        cos_cos = 0.
+        ys_one = 0.
+        ys_sin = 0.
+        ys_cos = 0.
+
+        do i = i_lo, i_hi
+            dz = omega * (ts(i) - tau)
+            w = exp(-c*dz**2)
+
+            sum_w = sum_w + w
+            sum_w2 = sum_w2 + w*w
+            sin_one = sin_one + w*sin_basis(i)
+            cos_one = cos_one + w*cos_basis(i)
+            sin_cos = sin_cos + w*sin_basis(i)*cos_basis(i)
+            sin_sin = sin_sin + w*sin_basis(i)*sin_basis(i)
+            cos_cos = cos_cos + w*cos_basis(i)*cos_basis(i)
+            ys_one = ys_one + w*pd_ys(i)
+            ys_sin = ys_sin + w*pd_ys(i)*sin_basis(i)
+            ys_cos = ys_cos + w*pd_ys(i)*cos_basis(i)
+        end do
+
+        Neff_loc = sum_w**2 / sum_w2
+
+        if (Neff_loc <= Neff) then
+            a0 = -99999.
+            a1 = -99999.
+            a2 = -99999.
+        else
+            sin_one = sin_one / sum_w
+            cos_one = cos_one / sum_w
+            sin_cos = sin_cos / sum_w
+            sin_sin = sin_sin / sum_w
+            cos_cos = cos_cos / sum_w
+            ys_one = ys_one / sum_w
+            ys_sin = ys_sin / sum_w
+            ys_cos = ys_cos / sum_w
+
+            numerator = 2*(sin_cos - sin_one*cos_one)
+            denominator = (cos_cos - cos_one**2) - (sin_sin - sin_one**2)
+            time_shift = atan2(numerator, denominator) / (2*omega)
+
+            sin_ts = sin(omega*time_shift)
+            cos_ts = cos(omega*time_shift)
+            sin_tau_center = sin(omega*(time_shift - tau))
+            cos_tau_center = cos(omega*(time_shift - tau))
+
+            ys_cos_shift = ys_cos*cos_ts + ys_sin*sin_ts
+            ys_sin_shift = ys_sin*cos_ts - ys_cos*sin_ts
+            cos_shift_one = cos_one*cos_ts + sin_one*sin_ts
+            sin_shift_one = sin_one*cos_ts - cos_one*sin_ts
+
+            A = 2*(ys_cos_shift - ys_one*cos_shift_one)
+            B = 2*(ys_sin_shift - ys_one*sin_shift_one)
+
+            a0 = ys_one
+            a1 = cos_tau_center*A - sin_tau_center*B
+            a2 = sin_tau_center*A + cos_tau_center*B
+        end if
+
+    end subroutine wwa_1g_hoisted
+
+    subroutine wwa_window_f32(taus, omegas, c, Neff, ts, pd_ys, lo, hi, nthread, tile, nts, nt, nf, Neffs, a0, a1, a2)
+        implicit none
+        !---------------------------------------------------------------------------------
+        ! Same as wwa_window, in single precision.
+        !---------------------------------------------------------------------------------
+        integer, intent(in) :: Neff, nts, nt, nf, nthread, tile
+        real, intent(in) :: c
+        real, dimension(nt), intent(in) :: taus
+        real, dimension(nf), intent(in) :: omegas
+        real, dimension(nts), intent(in) :: ts, pd_ys
+        integer, dimension(nt, nf), intent(in) :: lo, hi
+        real, dimension(nt, nf), intent(out) :: Neffs, a0, a1, a2
+        !---------------------------------------------------------------------------------
+        integer :: k, j, jt, ntile, j_lo, j_hi, i_lo, i_hi, k_basis, b_lo, b_hi
+        real, dimension(:), allocatable :: sin_basis, cos_basis
+        !---------------------------------------------------------------------------------
+
+        ntile = (nt + tile - 1) / tile
+
+        CALL OMP_SET_NUM_THREADS(nthread)
+
+        !$OMP PARALLEL PRIVATE(k, j, jt, j_lo, j_hi, i_lo, i_hi, k_basis, b_lo, b_hi, sin_basis, cos_basis)
+        allocate(sin_basis(nts), cos_basis(nts))
+        k_basis = 0
+        b_lo = 1
+        b_hi = 0
+
+        !$OMP DO COLLAPSE(2) SCHEDULE(dynamic)
+        do k = 1, nf
+            do jt = 1, ntile
+                j_lo = (jt-1)*tile + 1
+                j_hi = min(jt*tile, nt)
+
+                ! the basis is only needed over the union of the windows of the tile, and is kept
+                ! from the previous task of this thread if it was the same frequency and covered it
+                i_lo = nts + 1
+                i_hi = 0
+                do j = j_lo, j_hi
+                    if (hi(j, k) > lo(j, k)) then
+                        i_lo = min(i_lo, lo(j, k)+1)
+                        i_hi = max(i_hi, hi(j, k))
+                    end if
+                end do
+
+                if (i_hi >= i_lo .and. (k /= k_basis .or. i_lo < b_lo .or. i_hi > b_hi)) then
+                    sin_basis(i_lo:i_hi) = sin(omegas(k)*ts(i_lo:i_hi))
+                    cos_basis(i_lo:i_hi) = cos(omegas(k)*ts(i_lo:i_hi))
+                    k_basis = k
+                    b_lo = i_lo
+                    b_hi = i_hi
+                end if
+
+                do j = j_lo, j_hi
+                    if (hi(j, k) <= lo(j, k)) then
+                        ! an empty window, for the cells pruned in Python
+                        Neffs(j, k) = 0.
+                        a0(j, k) = -99999.
+                        a1(j, k) = -99999.
+                        a2(j, k) = -99999.
+                    else
+                        call wwa_1g_hoisted_f32(taus(j), omegas(k), c, Neff, ts, pd_ys, sin_basis, cos_basis, &
+                                            lo(j, k)+1, hi(j, k), Neffs(j, k), a0(j, k), a1(j, k), a2(j, k), nts)
+                    end if
+                end do
+            end do
+        end do
+        !$OMP END DO
+
+        deallocate(sin_basis, cos_basis)
+        !$OMP END PARALLEL
+
+    end subroutine wwa_window_f32
+
+    subroutine wwa_1g_hoisted_f32(tau, omega, c, Neff, ts, pd_ys, sin_basis, cos_basis, i_lo, i_hi, Neff_loc, a0, a1, a2, nts)
+        implicit none
+        !---------------------------------------------------------------------------------
+        ! Same as wwa_1g_hoisted, in single precision.
+        !---------------------------------------------------------------------------------
+        integer, intent(in) :: nts, Neff, i_lo, i_hi
+        real, intent(in) :: tau, omega, c
+        real, dimension(nts), intent(in) :: ts, pd_ys, sin_basis, cos_basis
+        real, intent(out) :: Neff_loc, a0, a1, a2
+        !---------------------------------------------------------------------------------
+        integer :: i
+        real :: dz, w, sum_w, sum_w2
+        real :: sin_one, cos_one, sin_cos, sin_sin, cos_cos
+        real :: ys_one, ys_sin, ys_cos
+        real :: numerator, denominator, time_shift, sin_ts, cos_ts
+        real :: sin_tau_center, cos_tau_center
+        real :: ys_cos_shift, ys_sin_shift, sin_shift_one, cos_shift_one
+        real :: A, B
+        !---------------------------------------------------------------------------------
+
+        sum_w = 0.
+        sum_w2 = 0.
+        sin_one = 0.
+        cos_one = 0.
+        sin_cos = 0.
+        sin_sin = 0.
+        cos_cos = 0.
+        ys_one = 0.
+        ys_sin = 0.
+        ys_cos = 0.
+
+        do i = i_lo, i_hi
+            dz = omega * (ts(i) - tau)
+            w = exp(-c*dz**2)
+
+            sum_w = sum_w + w
+            sum_w2 = sum_w2 + w*w
+            sin_one = sin_one + w*sin_basis(i)
+            cos_one = cos_one + w*cos_basis(i)
+            sin_cos = sin_cos + w*sin_basis(i)*cos_basis(i)
+            sin_sin = sin_sin + w*sin_basis(i)*sin_basis(i)
+            cos_cos = cos_cos + w*cos_basis(i)*cos_basis(i)
+            ys_one = ys_one + w*pd_ys(i)
+            ys_sin = ys_sin + w*pd_ys(i)*sin_basis(i)
+            ys_cos = ys_cos + w*pd_ys(i)*cos_basis(i)
+        end do
+
+        Neff_loc = sum_w**2 / sum_w2
+
+        if (Neff_loc <= Neff) then
+            a0 = -99999.
+            a1 = -99999.
+            a2 = -99999.
+        else
+            sin_one = sin_one / sum_w
+            cos_one = cos_one / sum_w
+            sin_cos = sin_cos / sum_w
+            sin_sin = sin_sin / sum_w
+            cos_cos = cos_cos / sum_w
+            ys_one = ys_one / sum_w
+            ys_sin = ys_sin / sum_w
+            ys_cos = ys_cos / sum_w
+
+            numerator = 2*(sin_cos - sin_one*cos_one)
+            denominator = (cos_cos - cos_one**2) - (sin_sin - sin_one**2)
+            time_shift = atan2(numerator, denominator) / (2*omega)
+
+            sin_ts = sin(omega*time_shift)
+            cos_ts = cos(omega*time_shift)
+            sin_tau_center = sin(omega*(time_shift - tau))
+            cos_tau_center = cos(omega*(time_shift - tau))
+
+            ys_cos_shift = ys_cos*cos_ts + ys_sin*sin_ts
+            ys_sin_shift = ys_sin*cos_ts - ys_cos*sin_ts
+            cos_shift_one = cos_one*cos_ts + sin_one*sin_ts
+            sin_shift_one = sin_one*cos_ts - cos_one*sin_ts
+
+            A = 2*(ys_cos_shift - ys_one*cos_shift_one)
+            B = 2*(ys_sin_shift - ys_one*sin_shift_one)
+
+            a0 = ys_one
+            a1 = cos_tau_center*A - sin_tau_center*B
+            a2 = sin_tau_center*A + cos_tau_center*B
+        end if
+
+    end subroutine wwa_1g_hoisted_f32
+
 end module f2py_wwz